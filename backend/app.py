@@ -1,157 +1,829 @@
 import os
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, g, render_template, request, jsonify
 from flask_cors import CORS  # <- Añade este import
 import json
+import logging
+import logging.handlers
+import queue
+import sys
 import numpy as np
 from datetime import datetime
-from sklearn.cluster import DBSCAN
-from sklearn.neighbors import NearestNeighbors
-from sklearn.metrics.pairwise import haversine_distances
-import tempfile
-import shutil
-from math import radians
+import atexit
+import itertools
+import operator
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from math import isfinite
+from incremental_dbscan import IncrementalDBSCAN
+from spatial_index import KM_PER_DEGREE, SpatialIndex
+from neighbor_graph import RadiusNeighborGraph, chord_length, unit_vectors
+import geometry
+from point_store import USER, PointStore, PointStoreBuilder, user_key
+from polygon_pipeline import PolygonPipeline, cluster_hull
+from locate import PolygonLocator
+from cluster_sweep import DEFAULT_EPS_FACTORS, KDistanceCache, knee, sweep
+from partitions import PartitionCache, cluster_partition, parse_time
+from changes import ChangeLog
+from dedup import PointDeduplicator, point_weight
+import serialization
+from storage import ClusterSnapshot, PointLog, atomic_write_json, content_digest
+from jobs import ReclusterScheduler
+from response_cache import ResponseCache
+from heatmap_tiles import HeatmapTiles
+from shared_state import PublishedData, RWLock, SharedSnapshot
+import metrics
+import lod
+from geojson_stream import FeatureFilter, iter_features, load_feature_collection
+from sqlite_store import SQLiteStore
 
 app = Flask(__name__)
+app.json = serialization.JSONProvider(app)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CORS(app, origins=["http://127.0.0.1:5500", "http://127.0.0.1:5000"])
 
+# Parámetros de DBSCAN. Con métrica 'euclidean' el radio es EPS en grados
+# lng/lat; con 'haversine' es EPS_KM en kilómetros sobre la esfera
+CLUSTER_METRIC = os.environ.get('EARTHBLOOM_CLUSTER_METRIC', 'euclidean')
+CLUSTER_EPS = float(os.environ.get('EARTHBLOOM_EPS', 0.05))
+CLUSTER_EPS_KM = float(os.environ.get('EARTHBLOOM_EPS_KM', 5.5))
+CLUSTER_MIN_SAMPLES = int(os.environ.get('EARTHBLOOM_MIN_SAMPLES', 3))
+
+# Envolvente de cada cluster: 'convex' o 'concave' (alpha shape)
+CLUSTER_HULL = os.environ.get('EARTHBLOOM_HULL', 'convex')
+
+# Envolventes, áreas y procedencia de los clusters en paralelo: pool 'process',
+# 'thread' o 'serial', con POLYGON_WORKERS workers (0 = uno por núcleo) y
+# bloques de POLYGON_CHUNK clusters
+POLYGON_POOL = os.environ.get('EARTHBLOOM_POLYGON_POOL', 'process')
+POLYGON_WORKERS = int(os.environ.get('EARTHBLOOM_POLYGON_WORKERS', 0))
+POLYGON_CHUNK = int(os.environ.get('EARTHBLOOM_POLYGON_CHUNK', 128))
+
+# Log de puntos de usuario: fsync cada N registros (o cada segundo) y
+# compactación en user_points.json cada N registros
+WAL_FSYNC_EVERY = int(os.environ.get('EARTHBLOOM_WAL_FSYNC_EVERY', 32))
+WAL_COMPACT_EVERY = int(os.environ.get('EARTHBLOOM_WAL_COMPACT_EVERY', 500))
+
+# Re-clustering en segundo plano: las mutaciones responden de inmediato y el
+# trabajo se agrupa en ventanas de RECLUSTER_DEBOUNCE segundos. Con
+# EARTHBLOOM_BACKGROUND_JOBS=0 todo se ejecuta dentro de la petición
+BACKGROUND_JOBS = os.environ.get('EARTHBLOOM_BACKGROUND_JOBS', '1') != '0'
+RECLUSTER_DEBOUNCE = float(os.environ.get('EARTHBLOOM_RECLUSTER_DEBOUNCE', 0.25))
+
+# Varios procesos (p. ej. gunicorn -w 4) sobre los mismos datos: las escrituras
+# se serializan con un cerrojo entre procesos y las lecturas se sirven desde
+# un snapshot compartido en memoria mapeada
+SHARED_STATE = os.environ.get('EARTHBLOOM_SHARED_STATE', '0') == '1'
+
+# Archivos de datos: JSON compacto (EARTHBLOOM_JSON_PRETTY=1 para indentar).
+# Las exportaciones redondean las coordenadas a COORD_PRECISION decimales
+JSON_PRETTY = os.environ.get('EARTHBLOOM_JSON_PRETTY', '0') == '1'
+COORD_PRECISION = int(os.environ.get('EARTHBLOOM_COORD_PRECISION', 6))
+
+# Almacenamiento: 'json' (base combinada, puntos de usuario y vértices ML en
+# tres archivos JSON) o 'sqlite' (una base SQLite embebida, ver sqlite_store;
+# la primera vez importa los archivos JSON existentes). Con 'sqlite' el filtro
+# de carga se aplica en cada arranque a los features originales
+STORAGE = os.environ.get('EARTHBLOOM_STORAGE', 'json')
+STORAGE_BACKENDS = ('json', 'sqlite')
+
+# Los GeoJSON se leen en streaming. Al cargar los datos originales se puede
+# conservar solo un subconjunto: EARTHBLOOM_LOAD_BBOX=min_lng,min_lat,max_lng,max_lat,
+# EARTHBLOOM_LOAD_SEASONS=Spring,Summer y/o EARTHBLOOM_LOAD_TYPES=Wild
+LOAD_FILTER = FeatureFilter.parse(bbox=os.environ.get('EARTHBLOOM_LOAD_BBOX'),
+                                  seasons=os.environ.get('EARTHBLOOM_LOAD_SEASONS'),
+                                  types=os.environ.get('EARTHBLOOM_LOAD_TYPES'))
+
+# Archivos a partir de este tamaño informan del progreso de carga en el log
+LOAD_PROGRESS_BYTES = 8 * 1024 * 1024
+
+# Clustering particionado (/api/ml-polygons?season=&since=&until=): cada
+# temporada se agrupa por separado en ventanas de tiempo 'year', 'month',
+# 'week' o 'day' según el timestamp de los puntos ('none' = sin ventanas)
+PARTITION_WINDOW = os.environ.get('EARTHBLOOM_PARTITION_WINDOW', 'month')
+
+# Barrido de parámetros (/api/cluster-sweep): valores de min_samples por
+# defecto (además del actual) y máximo de candidatos (eps × min_samples)
+SWEEP_MIN_SAMPLES = tuple(int(v) for v in os.environ.get('EARTHBLOOM_SWEEP_MIN_SAMPLES', '3,5,8,12').split(','))
+SWEEP_MAX_CANDIDATES = int(os.environ.get('EARTHBLOOM_SWEEP_MAX_CANDIDATES', 100))
+
+# eps máximo del barrido en km (en grados con métrica 'euclidean', a razón
+# de KM_PER_DEGREE): el grafo de vecinos crece con eps hasta casi todos los
+# pares de puntos
+SWEEP_MAX_EPS_KM = float(os.environ.get('EARTHBLOOM_SWEEP_MAX_EPS_KM', 50))
+
+# Máximo de puntos por petición POST /api/locate
+LOCATE_MAX_POINTS = int(os.environ.get('EARTHBLOOM_LOCATE_MAX_POINTS', 10000))
+
+# Feed de cambios (/api/changes?since=): publicaciones que se recuerdan; un
+# cliente más atrasado recibe reset y recarga todo
+CHANGES_HISTORY = int(os.environ.get('EARTHBLOOM_CHANGES_HISTORY', 256))
+
+# Deduplicación en la ingesta (ver dedup): las coordenadas de los puntos
+# nuevos se redondean a SNAP_DECIMALS decimales y un reporte a menos de
+# DEDUP_RADIUS_M metros de un punto de la misma temporada y tipo, reportado
+# por última vez hace menos de DEDUP_WINDOW_S segundos, se fusiona en él
+# como peso (0 = sin fusión / sin límite de tiempo)
+SNAP_DECIMALS = int(os.environ.get('EARTHBLOOM_SNAP_DECIMALS', 5))
+DEDUP_RADIUS_M = float(os.environ.get('EARTHBLOOM_DEDUP_RADIUS_M', 25))
+DEDUP_WINDOW_S = float(os.environ.get('EARTHBLOOM_DEDUP_WINDOW_S', 86400))
+
+# Endpoints de lectura sin filtros que se sirven ya serializados
+READ_PAYLOADS = ("combined-data", "original-polygons", "ml-polygons",
+                 "user-points", "ml-vertices", "heatmap-data")
+
+# Campo de PublishedData del que sale cada cuerpo: en modo multi-proceso un
+# cuerpo solo se vuelve a serializar y escribir si su fuente cambió
+PAYLOAD_SOURCES = {"combined-data": "combined_data", "original-polygons": "combined_data",
+                   "ml-polygons": "combined_data", "user-points": "user_points",
+                   "ml-vertices": "ml_vertices", "heatmap-data": "combined_data"}
+
+# Nivel de log: DEBUG, INFO, WARNING, ERROR u OFF (sin logs, para producción).
+# Los mensajes se encolan y los escribe un hilo aparte, así que las peticiones
+# no esperan a stderr
+LOG_LEVEL = os.environ.get('EARTHBLOOM_LOG_LEVEL', 'INFO').upper()
+
+logger = logging.getLogger('earthbloom')
+
+def configure_logging(level=LOG_LEVEL):
+    """Configura el logger 'earthbloom' (y sus hijos, p. ej. earthbloom.jobs)"""
+    if level == 'OFF':
+        logger.setLevel(logging.CRITICAL + 1)
+        logger.propagate = False
+        return
+    if level not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+        raise ValueError(f"EARTHBLOOM_LOG_LEVEL no válido: {level}")
+    logger.setLevel(level)
+    if not logger.handlers:
+        records = queue.SimpleQueue()
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        listener = logging.handlers.QueueListener(records, handler)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.propagate = False
+
+configure_logging()
+
+def same_source(old, new):
+    """True si new es old o una tupla con los mismos elementos (por identidad)"""
+    if old is new:
+        return True
+    return (isinstance(old, tuple) and isinstance(new, tuple) and len(old) == len(new)
+            and all(map(operator.is_, old, new)))
+
+def parse_lat_lng(lat, lng):
+    """(lat, lng) como floats válidos; lanza ValueError si no lo son"""
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("lat y lng deben ser números")
+    if not (isfinite(lat) and isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat/lng fuera de rango")
+    return lat, lng
+
 class WildflowerMLSystem:
-    def __init__(self):
-        # Usar rutas absolutas basadas en la ubicación del script
-        self.primary_geojson = os.path.join(BASE_DIR, 'WildflowerBlooms_AreaOfInterest.geojson')
-        self.combined_geojson = os.path.join(BASE_DIR, 'WildflowerBlooms_Combined.geojson')
-        self.user_points_file = os.path.join(BASE_DIR, 'user_points.json')
-        self.ml_vertices_file = os.path.join(BASE_DIR, 'ml_vertices.json')
-        
-        # Inicializar la base de datos combinada
-        self.initialize_combined_database()
-        self.load_data()
-        
-        # Generar polígonos ML automáticamente al iniciar
-        self.auto_generate_ml_polygons()
-    
-    def initialize_combined_database(self):
-        """Inicializa la base de datos combinada con los datos originales si no existe"""
-        if not os.path.exists(self.combined_geojson):
-            try:
-                # Verificar que el archivo original existe
-                if os.path.exists(self.primary_geojson):
-                    # Copiar los datos originales a la base de datos combinada
-                    shutil.copyfile(self.primary_geojson, self.combined_geojson)
-                    print("✅ Base de datos combinada creada a partir de datos originales")
+    def __init__(self, data_dir=BASE_DIR):
+        # Usar rutas absolutas basadas en la ubicación del script (o en
+        # data_dir, p. ej. un directorio temporal en los benchmarks)
+        self.data_dir = data_dir
+        self.primary_geojson = os.path.join(data_dir, 'WildflowerBlooms_AreaOfInterest.geojson')
+        self.combined_geojson = os.path.join(data_dir, 'WildflowerBlooms_Combined.geojson')
+        self.user_points_file = os.path.join(data_dir, 'user_points.json')
+        self.ml_vertices_file = os.path.join(data_dir, 'ml_vertices.json')
+        self.user_points_log = os.path.join(data_dir, 'user_points.wal.jsonl')
+        self.cluster_snapshot = ClusterSnapshot(os.path.join(data_dir, 'cluster_snapshot.npz'))
+        self.database_file = os.path.join(data_dir, 'earthbloom.sqlite3')
+        if STORAGE not in STORAGE_BACKENDS:
+            raise ValueError(f"Almacenamiento no válido: {STORAGE} (usar {', '.join(STORAGE_BACKENDS)})")
+        self.database = SQLiteStore(self.database_file) if STORAGE == 'sqlite' else None
+        
+        # Los puntos nuevos se anexan al log; user_points.json es el snapshot
+        # compactado y las salidas ML se guardan en cada checkpoint. Con la
+        # base SQLite los puntos se insertan directamente y el log no se usa
+        self.point_log = PointLog(self.user_points_log, fsync_every=WAL_FSYNC_EVERY)
+        self.ml_dirty = False
+        self.snapshot_dirty = False
+        atexit.register(self.close)
+        
+        # Un solo escritor a la vez (peticiones y trabajador de re-clustering,
+        # ver writing()). ml_version aumenta cada vez que se publican polígonos
+        # ML nuevos; data_version con cualquier mutación. Los lectores usan
+        # solo `published`, un snapshot inmutable que se sustituye entero
+        self.lock = threading.RLock()
+        self.shared = SharedSnapshot(data_dir) if SHARED_STATE else None
+        self.published = None
+        self.shared_published = None   # última publicación de este proceso en el snapshot compartido
+        self._loading = False
+        self.ml_version = 0
+        self.data_version = 0
+        self.pending_cluster_points = []
+        
+        # Claves añadidas, modificadas y eliminadas en cada publicación
+        # (/api/changes): el mapa solo descarga lo que cambió
+        self.changes = ChangeLog(CHANGES_HISTORY)
+        
+        # Hash espacial e ids de los puntos de usuario para fusionar los
+        # reportes repetidos en la ingesta
+        self.dedup = PointDeduplicator(DEDUP_RADIUS_M, DEDUP_WINDOW_S, SNAP_DECIMALS)
+        
+        self.metric = CLUSTER_METRIC
+        self.eps = CLUSTER_EPS
+        self.eps_km = CLUSTER_EPS_KM
+        self.min_samples = CLUSTER_MIN_SAMPLES
+        self.hull_mode = CLUSTER_HULL
+        self.polygon_pipeline = PolygonPipeline(POLYGON_POOL, POLYGON_WORKERS, POLYGON_CHUNK)
+        
+        # Grafo de vecinos compartido entre ejecuciones de DBSCAN. El ajuste
+        # de eps tiene sus propias cachés (grafo y curva k-distancia) y su
+        # cerrojo: se ejecuta fuera de writing() sobre una copia de los puntos
+        self.neighbor_graph = RadiusNeighborGraph()
+        self.sweep_graph = RadiusNeighborGraph()
+        self.k_distances = KDistanceCache()
+        self.sweep_lock = threading.Lock()
+        
+        # Estado del clustering incremental: cada punto del motor corresponde
+        # por índice a una fila del almacén columnar point_store
+        self.clusterer = self.make_clusterer()
+        self.point_store = PointStore()
+        self.cluster_polygons = {}
+        self.site_numbers = {}
+        
+        # Polígonos del clustering por temporada y ventana de tiempo, en caché
+        # por partición (ver partition_polygons)
+        self.partitions = PartitionCache(PARTITION_WINDOW)
+        
+        # Índice espacial de polígonos y puntos de usuario para consultas
+        # por caja (?bbox=) y por radio (?near=)
+        self.spatial_index = SpatialIndex()
+        self.index_lock = RWLock()
+        self.ml_index_keys = []
+        self.user_index_keys = []
+        
+        # Pirámide de densidad para las teselas de /api/heatmap/z/x/y; se
+        # reconstruye cuando cambia data_version
+        self.heatmap_tiles = HeatmapTiles()
+        
+        # Simplificaciones por banda de zoom (?zoom=) de los polígonos servidos
+        self.lod = lod.LevelOfDetail()
+        self.lod_generation = None
+        
+        # Punto-en-polígono: todos los polígonos publicados (/api/locate, se
+        # reconstruye cuando cambia data_version) y solo los originales para
+        # etiquetar los puntos nuevos con su sitio (cambian con sites_version)
+        self.locator = PolygonLocator()
+        self.site_locator = PolygonLocator()
+        self.sites_version = 0
+        
+        # Cargar los datos y restaurar el clustering (sin escribir en disco:
+        # lo que cambie se guarda en el próximo checkpoint)
+        with self.writing():
+            if self.published is None:
+                self.reload()
+    
+    def reload(self):
+        """Carga los datos desde disco, restaura el clustering y publica el resultado"""
+        self._loading = True
+        try:
+            self.load_data()
+            self.load_clusters()
+        finally:
+            self._loading = False
+        self.publish_data()
+    
+    @contextmanager
+    def writing(self):
+        """
+        Sección de escritura: un solo escritor a la vez
+        
+        En modo multi-proceso toma además el cerrojo entre procesos, recarga
+        el estado desde disco si otro proceso publicó una generación más nueva
+        y, al salir, guarda en disco lo necesario para que los demás procesos
+        puedan recargarlo
+        """
+        with self.lock:
+            if self.shared is None:
+                yield
+                return
+            with self.shared.writer_lock():
+                if self.published is not None and self.shared.generation() != self.data_version:
+                    logger.info("🔄 Otro proceso publicó cambios: recargando estado")
+                    self.reload()
+                yield
+                self.point_log.sync()
+                self.checkpoint(compact=self.point_log.count >= WAL_COMPACT_EVERY)
+    
+    def refresh(self):
+        """En modo multi-proceso, recarga el estado local si otro proceso publicó cambios"""
+        if self.shared is not None and self.shared.generation() != self.data_version:
+            with self.writing():
+                pass  # writing() recarga al entrar
+    
+    def generation(self):
+        """Generación de datos más reciente (de cualquier proceso en modo multi-proceso)"""
+        return self.shared.generation() if self.shared is not None else self.data_version
+    
+    def publish_data(self):
+        """
+        Publica un snapshot inmutable de los datos de lectura
+        
+        Debe llamarse dentro de writing() tras cada mutación. Los escritores
+        nunca modifican en el sitio lo que ya se publicó (copy-on-write): solo
+        construyen objetos nuevos y sustituyen la referencia. En modo
+        multi-proceso los cuerpos serializados se publican además en el
+        snapshot compartido con una generación global nueva
+        """
+        if self._loading:
+            return  # reload() publica una sola vez al terminar
+        if self.shared is not None:
+            shared_generation = self.shared.generation()
+            self.data_version = max(self.data_version, shared_generation) + 1
+        else:
+            self.data_version += 1
+        self.published = PublishedData(self.data_version, self.combined_data,
+                                       tuple(self.user_points), self.ml_vertices)
+        self.changes.record(self.data_version, {"features": self.combined_data,
+                                                "user_points": self.published.user_points,
+                                                "ml_vertices": self.ml_vertices})
+        if self.shared is not None:
+            # Los cuerpos del snapshot compartido son de este proceso si nadie
+            # publicó desde entonces: los de fuente sin cambios se conservan
+            previous = self.shared_published
+            if previous is not None and previous.generation != shared_generation:
+                previous = None
+            bodies = {}
+            for name, field in PAYLOAD_SOURCES.items():
+                if previous is not None and same_source(getattr(previous, field),
+                                                        getattr(self.published, field)):
+                    bodies[name] = None   # se conserva el archivo ya publicado
                 else:
-                    print(f"❌ Archivo original no encontrado: {self.primary_geojson}")
-                    # Crear una base de datos combinada vacía
-                    with open(self.combined_geojson, 'w', encoding='utf-8') as f:
-                        json.dump({"type": "FeatureCollection", "features": []}, f, indent=2)
-            except Exception as e:
-                print(f"❌ Error inicializando base de datos combinada: {e}")
-                # Crear una base de datos combinada vacía
-                with open(self.combined_geojson, 'w', encoding='utf-8') as f:
-                    json.dump({"type": "FeatureCollection", "features": []}, f, indent=2)
-                    
+                    bodies[name] = serialize_json(self.read_payload(name))
+            self.shared.publish(self.data_version, bodies)
+            self.shared_published = self.published
+    
+    def read_payload(self, name):
+        """Contenido de un endpoint de lectura sin filtros (ver READ_PAYLOADS)"""
+        data = self.published
+        if name == "combined-data":
+            return data.combined_data
+        if name == "original-polygons":
+            return self.get_original_polygons()
+        if name == "ml-polygons":
+            return self.get_ml_polygons()
+        if name == "user-points":
+            return data.user_points
+        if name == "ml-vertices":
+            return data.ml_vertices
+        if name == "heatmap-data":
+            return self.get_heatmap_data()
+        raise KeyError(name)
+    
+    def load_geojson(self, path, feature_filter=None, on_feature=None):
+        """
+        Lee un FeatureCollection en streaming (ver geojson_stream)
+        
+        on_feature(feature) se llama con cada feature aceptado en cuanto se
+        decodifica. El progreso se publica en /api/metrics y, en archivos
+        grandes, también en el log cada 10 %
+        """
+        with metrics.stage('load'):
+            return load_feature_collection(path, feature_filter, self.load_progress(path), on_feature)
+    
+    def load_progress(self, path):
+        """Callback de progreso de lectura de un GeoJSON (ver load_geojson)"""
+        name = os.path.basename(path)
+        reported = [0.0]
+        
+        def progress(done, total, features):
+            ratio = done / total if total else 0.0
+            metrics.LOAD_PROGRESS.set(ratio, file=name)
+            metrics.LOAD_FEATURES.set(features, file=name)
+            if total and total >= LOAD_PROGRESS_BYTES and (ratio - reported[0] >= 0.1 or done == total):
+                reported[0] = ratio
+                logger.info("⏳ Cargando %s: %.0f%% (%s features)", name, 100 * ratio, features)
+        
+        return progress
+    
+    def lod_features(self, features, band):
+        """Features simplificados para la banda de zoom (None = resolución completa)"""
+        data = self.published
+        if band is not None and self.lod_generation != data.generation:
+            # Olvidar las simplificaciones de features que ya no se publican
+            self.lod.sync(data.combined_data.get("features", []))
+            self.lod_generation = data.generation
+        return self.lod.simplify(features, band)
+    
+    def lod_payload(self, name, band, fmt):
+        """
+        Contenido de un endpoint de lectura para un nivel de detalle: polígonos
+        simplificados para la banda de zoom y, con fmt='polyline', anillos
+        codificados como encoded polylines
+        """
+        if name == "ml-vertices":
+            # Los mismos polígonos que los vértices publicados (la última generación)
+            ids = {v.get("polygon_id") for v in self.published.ml_vertices}
+            polygons = self.get_ml_polygons()["features"]
+            if None in ids:
+                # Vértices guardados sin polygon_id: los de los polígonos auto-generados
+                polygons = [f for f in polygons if f["properties"].get("auto_generated", False)]
+            else:
+                polygons = [f for f in polygons if f["properties"].get("id") in ids]
+            polygons = self.lod_features(polygons, band)
+            if fmt == 'polyline':
+                return self.encode_ml_vertices(polygons)
+            return self.extract_ml_vertices(polygons)
+        
+        payload = self.read_payload(name)
+        payload = dict(payload, features=self.lod_features(payload.get("features", []), band))
+        if fmt == 'polyline':
+            payload = lod.encode_collection(payload)
+        return payload
+    
+    def changes_payload(self, since, epoch=None, band=None, fmt='geojson'):
+        """
+        Features, puntos de usuario y vértices ML añadidos, modificados y
+        eliminados desde la versión since (ver changes.ChangeLog)
+        
+        Cada feature lleva su clave como "id" de primer nivel y cada punto en
+        "key"; los eliminados se listan por clave. Los polígonos salen al nivel
+        de detalle pedido (band, fmt), como en los endpoints de lectura.
+        Con reset=True el cliente debe recargar todo
+        """
+        version, changes = self.changes.changes(since, epoch)
+        payload = {"epoch": self.changes.epoch, "version": version, "since": since,
+                   "ml_version": self.ml_version, "reset": changes is None}
+        if changes is None:
+            return payload
+        
+        features = changes["features"]
+        for kind in ("added", "modified"):
+            # Simplificar el feature publicado (sus importancias están en caché) y luego poner la clave
+            items = [dict(simplified, id=k) for k, f in features[kind] for simplified in self.lod_features([f], band)]
+            if fmt == 'polyline':
+                items = lod.encode_collection({"features": items})["features"]
+            features[kind] = items
+        
+        points = changes["user_points"]
+        for kind in ("added", "modified"):
+            points[kind] = [dict(p, key=k) for k, p in points[kind]]
+        
+        # Vértices de cada polígono cambiado, de su polígono al nivel de detalle pedido
+        vertices = changes["ml_vertices"]
+        polygons = {str(f["properties"].get("id")): f for f in self.published.combined_data.get("features", [])
+                    if f.get("properties", {}).get("generated_auto", False)}
+        for kind in ("added", "modified"):
+            groups = []
+            for polygon_id, group in vertices[kind]:
+                if band is not None and polygon_id in polygons:
+                    group = self.extract_ml_vertices(self.lod_features([polygons[polygon_id]], band))
+                groups.append({"polygon_id": polygon_id, "vertices": group})
+            vertices[kind] = groups
+        
+        payload.update(features=features, user_points=points, ml_vertices=vertices)
+        if fmt == 'polyline':
+            payload["encoding"] = lod.ENCODING
+        return payload
+    
+    def initialize_combined_database(self, on_feature=None):
+        """
+        Datos iniciales de la base combinada cuando aún no existe: una copia en
+        memoria de los datos originales (filtrados con LOAD_FILTER), que se
+        escribe en el primer checkpoint
+        """
+        data = self.load_geojson(self.primary_geojson, LOAD_FILTER, on_feature)
+        if LOAD_FILTER:
+            logger.info("✅ Base de datos combinada creada a partir de datos originales (%s): %s features",
+                        LOAD_FILTER.describe(), len(data["features"]))
+        else:
+            logger.info("✅ Base de datos combinada creada a partir de datos originales")
+        self.ml_dirty = True
+        return data
+    
+    def index_feature(self, index, feature, ml_keys):
+        """Registra un feature en el índice espacial (capa "original" o "ml")"""
+        properties = feature.get("properties", {})
+        layer = "ml" if properties.get("generated_auto", False) else "original"
+        key = index.insert_feature(layer, feature)
+        if key is not None and properties.get("auto_generated", False):
+            ml_keys.append(key)
+    
     def load_data(self):
-        # Cargar ÚNICAMENTE la base de datos combinada
-        try:
-            with open(self.combined_geojson, 'r', encoding='utf-8') as f:
-                self.combined_data = json.load(f)
-            print(f"✅ Base de datos combinada cargada: {len(self.combined_data.get('features', []))} features")
-        except Exception as e:
-            print(f"❌ Error cargando base de datos combinada: {e}")
-            self.combined_data = {"type": "FeatureCollection", "features": []}
+        self.sites_version += 1
+        
+        # El índice espacial y el almacén de puntos se llenan mientras se lee la
+        # base combinada y sustituyen a los actuales al terminar
+        index, ml_keys, builder = SpatialIndex(), [], PointStoreBuilder()
+        
+        def on_feature(feature):
+            builder.add_feature(feature)
+            self.index_feature(index, feature, ml_keys)
         
-        # Cargar puntos de usuario
+        if self.database is not None:
+            try:
+                self.load_database(on_feature)
+            except Exception as e:
+                logger.error("❌ Error cargando base de datos SQLite: %s", e)
+                self.combined_data = {"type": "FeatureCollection", "features": []}
+                self.user_points, self.ml_vertices = [], []
+                index, ml_keys, builder = SpatialIndex(), [], PointStoreBuilder()
+        else:
+            # Cargar ÚNICAMENTE la base de datos combinada
+            if not os.path.exists(self.combined_geojson):
+                try:
+                    self.combined_data = self.initialize_combined_database(on_feature)
+                except Exception as e:
+                    logger.error("❌ Error inicializando base de datos combinada: %s", e)
+                    self.combined_data = {"type": "FeatureCollection", "features": []}
+                    index, ml_keys, builder = SpatialIndex(), [], PointStoreBuilder()
+                    self.ml_dirty = True
+            else:
+                try:
+                    self.combined_data = self.load_geojson(self.combined_geojson, on_feature=on_feature)
+                    logger.info("✅ Base de datos combinada cargada: %s features", len(self.combined_data.get('features', [])))
+                except Exception as e:
+                    logger.error("❌ Error cargando base de datos combinada: %s", e)
+                    self.combined_data = {"type": "FeatureCollection", "features": []}
+                    index, ml_keys, builder = SpatialIndex(), [], PointStoreBuilder()
+        
+            self.user_points = self.read_user_points(self.point_log)
+            self.ml_vertices = self.read_ml_vertices()
+        
+        user_keys = self.index_user_points(index)
+        builder.add_user_points(self.user_points)
+        with self.index_lock.writing():
+            self.spatial_index, self.ml_index_keys, self.user_index_keys = index, ml_keys, user_keys
+        self.dedup.reset(self.user_points)
+        self.point_store = builder.build()
+        logger.info("📊 Puntos extraídos para ML: %s puntos totales", len(self.point_store))
+    
+    def read_user_points(self, point_log):
+        """Puntos de usuario de user_points.json más los anexados a point_log"""
         try:
             with open(self.user_points_file, 'r', encoding='utf-8') as f:
-                self.user_points = json.load(f)
-            print(f"✅ Puntos de usuario cargados: {len(self.user_points)} puntos")
+                user_points = json.load(f)
+            logger.info("✅ Puntos de usuario cargados: %s puntos", len(user_points))
         except:
-            self.user_points = []
-            print("✅ Puntos de usuario inicializados (archivo no existía)")
+            user_points = []
+            logger.info("✅ Puntos de usuario inicializados (archivo no existía)")
         
-        # Cargar vértices ML
+        # Reproducir los puntos anexados al log después del último snapshot.
+        # Un registro con el (id, timestamp) de un punto ya cargado lo
+        # sustituye: es el mismo punto con un reporte fusionado, o uno ya
+        # incluido si la compactación se interrumpió tras escribir el snapshot
+        logged = point_log.replay()
+        if logged:
+            positions = {user_key(p): i for i, p in enumerate(user_points)}
+            appended = 0
+            for point in logged:
+                position = positions.get(user_key(point))
+                if position is None:
+                    positions[user_key(point)] = len(user_points)
+                    user_points.append(point)
+                    appended += 1
+                else:
+                    user_points[position] = point
+            logger.info("✅ Log de puntos reproducido: %s puntos nuevos, %s actualizados",
+                        appended, len(logged) - appended)
+        return user_points
+    
+    def read_ml_vertices(self):
         try:
             with open(self.ml_vertices_file, 'r', encoding='utf-8') as f:
-                self.ml_vertices = json.load(f)
-            print(f"✅ Vértices ML cargados: {len(self.ml_vertices)} vértices")
+                ml_vertices = json.load(f)
+            logger.info("✅ Vértices ML cargados: %s vértices", len(ml_vertices))
         except:
-            self.ml_vertices = []
-            print("✅ Vértices ML inicializados (archivo no existía)")
+            ml_vertices = []
+            logger.info("✅ Vértices ML inicializados (archivo no existía)")
+        return ml_vertices
+    
+    def load_database(self, on_feature=None):
+        """
+        Carga la base combinada (features originales filtrados con LOAD_FILTER
+        en SQL), los puntos de usuario y los vértices ML desde la base SQLite
+        """
+        if not self.database.initialized():
+            self.import_into_database()
+        with metrics.stage('load'):
+            self.combined_data = self.database.load_features(LOAD_FILTER, on_feature)
+            self.user_points = self.database.load_user_points()
+            self.ml_vertices = self.database.load_ml_vertices()
+        if LOAD_FILTER:
+            logger.info("✅ Base de datos SQLite cargada (%s): %s features, %s puntos de usuario, %s vértices ML",
+                        LOAD_FILTER.describe(), len(self.combined_data["features"]),
+                        len(self.user_points), len(self.ml_vertices))
+        else:
+            logger.info("✅ Base de datos SQLite cargada: %s features, %s puntos de usuario, %s vértices ML",
+                        len(self.combined_data["features"]), len(self.user_points), len(self.ml_vertices))
+    
+    def import_into_database(self):
+        """
+        Datos iniciales de la base SQLite: los archivos JSON si existen (base
+        combinada, puntos de usuario con su log y vértices ML) o, si no, los
+        datos originales completos (el filtro de carga se aplica al leer). Los
+        archivos JSON no se modifican
+        """
+        source = self.combined_geojson if os.path.exists(self.combined_geojson) else self.primary_geojson
+        head = {}
+        with metrics.stage('load'):
+            count = self.database.import_features(iter_features(source, progress=self.load_progress(source), head=head), head)
+        self.database.save_user_points(self.read_user_points(PointLog(self.user_points_log)))
+        self.database.save_ml_vertices(self.read_ml_vertices())
+        self.database.mark_initialized()
+        logger.info("✅ Base de datos SQLite creada a partir de %s: %s features", os.path.basename(source), count)
+    
+    def index_user_points(self, index):
+        """Indexa los puntos de usuario; devuelve la clave de cada uno (None si no tiene coordenadas)"""
+        return [index.insert_point("user", point["lng"], point["lat"], point)
+                if point.get("lng") is not None and point.get("lat") is not None else None
+                for point in self.user_points]
+    
+    def rebuild_spatial_index(self):
+        """Reconstruye el índice espacial desde la base combinada y los puntos de usuario"""
+        index, ml_keys = SpatialIndex(), []
+        for feature in self.combined_data.get("features", []):
+            self.index_feature(index, feature, ml_keys)
+        user_keys = self.index_user_points(index)
+        with self.index_lock.writing():
+            self.spatial_index, self.ml_index_keys, self.user_index_keys = index, ml_keys, user_keys
+    
+    def query_spatial(self, layers, bbox=None, near=None, radius_km=None):
+        """
+        Consulta el índice espacial por caja o por radio
+        
+        - bbox: [min_lng, min_lat, max_lng, max_lat]
+        - near: (lat, lng) junto con radius_km
+        """
+        self.refresh()
+        with self.index_lock.reading():
+            if bbox is not None:
+                return self.spatial_index.query_bbox(bbox, layers)
+            lat, lng = near
+            return self.spatial_index.query_radius(lng, lat, radius_km, layers)
     
     def save_combined_data(self):
-        """Guarda la base de datos combinada"""
+        """Guarda la base de datos combinada (con SQLite, solo los features que cambiaron)"""
         try:
-            with open(self.combined_geojson, 'w', encoding='utf-8') as f:
-                json.dump(self.combined_data, f, indent=2)
-            print(f"✅ Base de datos combinada guardada: {len(self.combined_data.get('features', []))} features")
+            if self.database is not None:
+                with metrics.stage('persistence'):
+                    inserted, removed = self.database.save_features(self.combined_data)
+                logger.info("✅ Base de datos combinada guardada: %s features (%s filas nuevas, %s borradas)",
+                            len(self.combined_data.get('features', [])), inserted, removed)
+                return True
+            with metrics.stage('persistence'):
+                atomic_write_json(self.combined_geojson, self.combined_data, pretty=JSON_PRETTY)
+            logger.info("✅ Base de datos combinada guardada: %s features", len(self.combined_data.get('features', [])))
             return True
         except Exception as e:
-            print(f"❌ Error guardando base de datos combinada: {e}")
+            logger.error("❌ Error guardando base de datos combinada: %s", e)
             return False
     
     def save_user_points(self):
+        """Escribe el snapshot completo de puntos de usuario y vacía el log"""
         try:
-            with open(self.user_points_file, 'w', encoding='utf-8') as f:
-                json.dump(self.user_points, f, indent=2)
-            print(f"✅ Puntos de usuario guardados: {len(self.user_points)} puntos")
+            with metrics.stage('persistence'):
+                if self.database is not None:
+                    self.database.save_user_points(self.user_points)
+                else:
+                    atomic_write_json(self.user_points_file, self.user_points, pretty=JSON_PRETTY)
+                    self.point_log.truncate()
+            logger.info("✅ Puntos de usuario guardados: %s puntos", len(self.user_points))
             return True
         except Exception as e:
-            print(f"❌ Error guardando puntos de usuario: {e}")
+            logger.error("❌ Error guardando puntos de usuario: %s", e)
             return False
     
     def save_ml_vertices(self):
         try:
-            with open(self.ml_vertices_file, 'w', encoding='utf-8') as f:
-                json.dump(self.ml_vertices, f, indent=2)
-            print(f"✅ Vértices ML guardados: {len(self.ml_vertices)} vértices")
+            with metrics.stage('persistence'):
+                if self.database is not None:
+                    self.database.save_ml_vertices(self.ml_vertices)
+                else:
+                    atomic_write_json(self.ml_vertices_file, self.ml_vertices, pretty=JSON_PRETTY)
+            logger.info("✅ Vértices ML guardados: %s vértices", len(self.ml_vertices))
+            return True
+        except Exception as e:
+            logger.error("❌ Error guardando vértices ML: %s", e)
+            return False
+    
+    def save_cluster_snapshot(self):
+        """Guarda el estado del clustering etiquetado con el hash de sus entradas"""
+        try:
+            with metrics.stage('persistence'):
+                self.cluster_snapshot.save(self.cluster_digest(), self.clusterer.state(), {
+                    "polygons": {str(root): polygon for root, polygon in self.cluster_polygons.items()}
+                })
+            self.snapshot_dirty = False
+            logger.info("✅ Snapshot de clustering guardado: %s clusters", len(self.cluster_polygons))
             return True
         except Exception as e:
-            print(f"❌ Error guardando vértices ML: {e}")
+            logger.error("❌ Error guardando snapshot de clustering: %s", e)
             return False
     
+    def checkpoint(self, compact=True):
+        """
+        Compacta el log de puntos en user_points.json y guarda las salidas ML
+        (base combinada, vértices y snapshot de clustering) si cambiaron desde
+        el último checkpoint
+        """
+        if compact and self.point_log.count:
+            self.save_user_points()
+        if self.ml_dirty:
+            self.save_ml_vertices()
+            self.save_combined_data()
+            self.ml_dirty = False
+        # Con puntos pendientes el motor no refleja todas las entradas
+        if self.snapshot_dirty and not self.pending_cluster_points:
+            self.save_cluster_snapshot()
+    
+    def close(self):
+        """Vuelca a disco todo lo pendiente (se ejecuta al salir del proceso)"""
+        # En modo multi-proceso writing() ya guardó el estado tras cada escritura
+        # y no se puede escribir fuera del cerrojo entre procesos
+        if self.shared is None:
+            self.checkpoint()
+        self.point_log.close()
+        if self.database is not None:
+            self.database.close()
+        self.polygon_pipeline.close()
+    
     def extract_points_from_combined_data(self):
-        """Extrae TODOS los puntos de la base de datos combinada"""
-        all_points = []
+        """
+        Extrae TODOS los puntos de la base de datos combinada
         
-        for feature in self.combined_data.get("features", []):
-            geometry = feature.get("geometry", {})
-            properties = feature.get("properties", {})
-            
-            if geometry.get("type") == "Polygon":
-                for ring in geometry.get("coordinates", []):
-                    for coord in ring:
-                        if len(coord) >= 2:
-                            all_points.append({
-                                "lng": coord[0],
-                                "lat": coord[1],
-                                "source": "combined_polygon",
-                                "properties": properties
-                            })
-            elif geometry.get("type") == "MultiPolygon":
-                for polygon in geometry.get("coordinates", []):
-                    for ring in polygon:
-                        for coord in ring:
-                            if len(coord) >= 2:
-                                all_points.append({
-                                    "lng": coord[0],
-                                    "lat": coord[1],
-                                    "source": "combined_multipolygon", 
-                                    "properties": properties
-                                })
-        
-        # Añadir puntos de usuario
-        for point in self.user_points:
-            all_points.append({
-                "lng": point.get("lng"),
-                "lat": point.get("lat"),
-                "source": "user",
-                "properties": point
-            })
-        
-        print(f"📊 Puntos extraídos para ML: {len(all_points)} puntos totales")
-        return all_points
-    
-    def cluster_points(self, points, eps=0.05, min_samples=3):
+        Devuelve un PointStore columnar (coordenadas, feature de origen y
+        fuente en arrays NumPy). Los polígonos generados por ML se excluyen:
+        son el resultado del clustering y volver a usarlos como entrada
+        duplicaría sus vértices en cada ejecución
+        """
+        with metrics.stage('extraction'):
+            store = PointStore.from_data(self.combined_data.get("features", []), self.user_points)
+        
+        logger.info("📊 Puntos extraídos para ML: %s puntos totales", len(store))
+        return store
+    
+    def cluster_digest(self):
+        """
+        Hash de las entradas del clustering: parámetros, puntos del almacén y
+        nombres de los sitios originales (aparecen en las propiedades de los
+        polígonos ML)
+        """
+        store = self.point_store
+        return content_digest(
+            {"metric": self.metric, "eps": self.eps, "eps_km": self.eps_km,
+             "min_samples": self.min_samples, "hull": self.hull_mode},
+            store.coords, store.source, store.feature_idx, store.weights,
+            [p.get("Site") for p in store.properties])
+    
+    def load_clusters(self):
+        """
+        Restaura el clustering desde el snapshot si las entradas no cambiaron
+        desde que se guardó; si no, ejecuta DBSCAN completo
+        """
+        start = time.perf_counter()
+        # point_store ya se llenó en load_data mientras se leía la base combinada
+        snapshot = self.cluster_snapshot.load(self.cluster_digest())
+        if snapshot is None:
+            self.auto_generate_ml_polygons(checkpoint=False)
+            return
+        
+        arrays, meta = snapshot
+        self.pending_cluster_points = []
+        self.clusterer = self.make_clusterer()
+        with metrics.stage('snapshot_restore'):
+            self.clusterer.restore(self.engine_coords(self.point_store.coords), arrays)
+        self.cluster_polygons = {int(root): polygon for root, polygon in meta["polygons"].items()}
+        
+        # Los polígonos del snapshot ya se guardaron junto con él
+        ml_dirty = self.ml_dirty
+        self.publish_ml_polygons()
+        self.ml_dirty = ml_dirty
+        self.snapshot_dirty = False
+        logger.info("✅ Clustering restaurado desde snapshot en %.2fs", time.perf_counter() - start)
+    
+    def make_clusterer(self):
+        """Motor DBSCAN incremental para la métrica configurada"""
+        if self.metric == 'haversine':
+            # Vectores unitarios 3D: la distancia de cuerda es monótona con la
+            # de gran círculo, así que basta una rejilla euclídea en 3D
+            return IncrementalDBSCAN(eps=chord_length(self.eps_km), min_samples=self.min_samples, dim=3)
+        return IncrementalDBSCAN(eps=self.eps, min_samples=self.min_samples)
+    
+    def engine_coords(self, lnglat):
+        """Coordenadas en el espacio del motor incremental"""
+        if self.metric == 'haversine':
+            return unit_vectors(lnglat)
+        return np.asarray(lnglat, dtype=np.float64)
+    
+    def cluster_radius(self, metric, eps=None, eps_km=None):
+        """Radio de DBSCAN en las unidades de la métrica (grados o km)"""
+        if metric == 'haversine':
+            return self.eps_km if eps_km is None else eps_km
+        return self.eps if eps is None else eps
+    
+    def cluster_points(self, coords, eps=None, min_samples=None, metric=None, eps_km=None, weights=None):
         """
         Agrupa puntos usando DBSCAN - ALGORITMO DE MACHINE LEARNING
         
@@ -163,239 +835,515 @@ class WildflowerMLSystem:
         3. Considera puntos aislados como ruido
         
         Parámetros:
-        - eps (ε): Radio de búsqueda para encontrar vecinos (0.05 grados ≈ 5.5 km)
+        - eps (ε): Radio de búsqueda en grados con métrica 'euclidean' (0.05 grados ≈ 5.5 km)
+        - eps_km: Radio de búsqueda en km con métrica 'haversine' (distancia sobre la esfera)
         - min_samples: Mínimo de puntos para formar un cluster denso (3 puntos)
+        - metric: 'euclidean' (grados lng/lat) o 'haversine' (BallTree, km)
+        - weights: reportes que representa cada punto (sample_weight): un
+          punto con peso 3 cuenta como 3 puntos para formar un núcleo
+        
+        Las vecindades se toman de la caché RadiusNeighborGraph: cambiar
+        min_samples o añadir puntos no recalcula todas las vecindades
+        
+        Recibe las coordenadas [lng, lat] como array (n, 2) y devuelve los
+        índices de los puntos de cada cluster
         """
-        if len(points) < 3:
+        if len(coords) < 3:
             return []
         
-        coords = [[p['lng'], p['lat']] for p in points]
+        metric = metric or self.metric
+        min_samples = min_samples or self.min_samples
+        radius = self.cluster_radius(metric, eps, eps_km)
         
-        # Usar DBSCAN para clustering - MACHINE LEARNING
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-        labels = dbscan.fit_predict(coords)
+        with metrics.stage('dbscan'):
+            graph = self.neighbor_graph.get(coords, radius, metric)
+            
+            # Usar DBSCAN para clustering - MACHINE LEARNING
+            from sklearn.cluster import DBSCAN
+            dbscan = DBSCAN(eps=radius, min_samples=min_samples, metric='precomputed')
+            labels = dbscan.fit_predict(graph, sample_weight=weights)
         
         # Análisis de los resultados del clustering
-        unique_labels = set(labels)
-        n_clusters = len(unique_labels) - (1 if -1 in unique_labels else 0)
-        n_noise = list(labels).count(-1)
+        n_clusters = int(labels.max()) + 1
+        n_noise = int((labels == -1).sum())
         
-        print(f"🔍 DBSCAN encontró {n_clusters} clusters y {n_noise} puntos de ruido")
+        logger.info("🔍 DBSCAN encontró %s clusters y %s puntos de ruido", n_clusters, n_noise)
         
-        clusters = {}
-        for i, label in enumerate(labels):
-            if label != -1:  # Ignorar ruido (-1)
-                if label not in clusters:
-                    clusters[label] = []
-                clusters[label].append(points[i])
+        # Agrupar índices por etiqueta ignorando el ruido (-1)
+        clustered = np.flatnonzero(labels != -1)
+        order = clustered[np.argsort(labels[clustered], kind='stable')]
+        clusters = np.split(order, np.flatnonzero(np.diff(labels[order])) + 1) if len(order) else []
         
-        print(f"🔍 Clusters válidos para polígonos: {len(clusters)} clusters")
-        return list(clusters.values())
+        logger.info("🔍 Clusters válidos para polígonos: %s clusters", len(clusters))
+        return clusters
     
-    def convex_hull(self, points):
+    def convex_hull(self, coords):
         """
-        Algoritmo del Gift Wrapping (Jarvis March) para calcular la envolvente convexa
+        Cadena monótona de Andrew para calcular la envolvente convexa
         
         Este algoritmo:
-        1. Encuentra el punto más a la izquierda como punto inicial
-        2. Para cada punto, encuentra el punto que forma el menor giro a la izquierda
-        3. Continúa hasta volver al punto inicial
+        1. Ordena los puntos por longitud (y latitud para desempatar)
+        2. Construye la cadena inferior y la superior descartando los giros a la derecha
+        3. Une ambas cadenas en un anillo cerrado
         
-        La envolvente convexa representa el área mínima que contiene todos los puntos
+        La envolvente convexa representa el área mínima que contiene todos los puntos.
+        Los clusters degenerados (puntos repetidos o colineales) devuelven None
         """
-        if len(points) < 3:
-            return None
-        
-        # Convertir a array de coordenadas
-        coords = [[p['lng'], p['lat']] for p in points]
-        
-        # Encontrar el punto más a la izquierda
-        leftmost = min(coords, key=lambda p: p[0])
+        return cluster_hull(coords, 'convex')
+    
+    def concave_hull(self, coords, radius=None):
+        """
+        Envolvente cóncava (alpha shape) para áreas de floración alargadas
         
-        hull = []
-        current_point = leftmost
+        Conserva los triángulos de Delaunay con circunradio menor que radius
+        (por defecto el radio de DBSCAN, en grados)
+        """
+        return cluster_hull(coords, 'concave', self.hull_radius() if radius is None else radius)
+    
+    def hull_radius(self):
+        """Radio de la envolvente cóncava en grados (el radio de DBSCAN)"""
+        return self.eps_km / 111.32 if self.metric == 'haversine' else self.eps
+    
+    def cluster_hull(self, coords):
+        """Envolvente del cluster según el modo configurado (convexa o cóncava)"""
+        return cluster_hull(coords, self.hull_mode, self.hull_radius())
+    
+    def cluster_polygon_parts(self, clusters, label):
+        """
+        Envolvente, área y procedencia de cada cluster (listas de filas de
+        point_store), construidas en paralelo por polygon_pipeline
         
-        while True:
-            hull.append(current_point)
-            next_point = coords[0]
-            
-            for point in coords:
-                if (next_point == current_point or 
-                    self.cross_product(current_point, next_point, point) > 0):
-                    next_point = point
-            
-            current_point = next_point
-            
-            if current_point == leftmost:
-                break
+        Devuelve (posición en clusters, envolvente, área, procedencia) de los
+        clusters con envolvente válida, en el orden de clusters
+        """
+        with metrics.stage('hull'):
+            results = self.polygon_pipeline.build(self.point_store, clusters, self.hull_mode, self.hull_radius())
         
-        # Cerrar el polígono
-        if hull and hull[0] != hull[-1]:
-            hull.append(hull[0])
-            
-        return hull
-    
-    def cross_product(self, o, a, b):
-        """Producto cruzado para determinar orientación (sentido horario/antihorario)"""
-        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+        parts = []
+        for i, (hull, area, stats, error) in enumerate(results):
+            if error is not None:
+                logger.error("❌ Error creando polígono ML %s: %s", label, error)
+            elif hull is not None:
+                parts.append((i, hull, area, stats))
+        return parts
     
     def calculate_area(self, polygon):
-        """Calcula área usando fórmula del shoelace (Gauss)"""
+        """
+        Área en m² de un anillo [[lng, lat], ...]
+        
+        Fórmula del shoelace (Gauss) sobre la proyección equivalente de
+        Lambert del elipsoide WGS84: es correcta a cualquier latitud. Para
+        muchos polígonos usar geometry.polygon_stats en una sola llamada
+        """
         if len(polygon) < 3:
             return 0.0
-        
-        area = 0.0
-        n = len(polygon)
-        
-        for i in range(n):
-            j = (i + 1) % n
-            area += polygon[i][0] * polygon[j][1]
-            area -= polygon[j][0] * polygon[i][1]
-        
-        return abs(area) / 2.0 * 111000 * 111000  # Convertir a m²
+        return geometry.polygon_area([polygon])
     
     def calculate_polygon_centroid(self, polygon_coords):
         """
         Calcula el centroide (centro geométrico) de un polígono
         
-        El centroide es el punto promedio de todos los vértices del polígono
-        y se usa para el heatmap en lugar de los vértices individuales
+        Es el centroide ponderado por área (no el promedio de los vértices,
+        que depende de cómo estén repartidos y cuenta dos veces el punto de
+        cierre) y se usa para el heatmap en lugar de los vértices individuales
         """
         if len(polygon_coords) < 3:
             return None
-            
-        lons = [coord[0] for coord in polygon_coords]
-        lats = [coord[1] for coord in polygon_coords]
-        
-        centroid_lon = sum(lons) / len(lons)
-        centroid_lat = sum(lats) / len(lats)
-        
-        return [centroid_lon, centroid_lat]
+        return geometry.polygon_centroid([polygon_coords])
+    
+    def ml_polygon_centroids(self, features):
+        """
+        Polígonos ML de features y sus centroides, calculados en una sola
+        llamada vectorizada
+        """
+        polygons = [f for f in features
+                    if f.get("properties", {}).get("generated_auto", False)
+                    and f.get("geometry", {}).get("type") == "Polygon"
+                    and f["geometry"].get("coordinates")]
+        _, centroids = geometry.polygon_stats([f["geometry"]["coordinates"] for f in polygons])
+        return polygons, centroids
     
     def extract_ml_vertices(self, ml_polygons):
         """
         Extrae todos los vértices de los polígonos ML como puntos individuales
         
         Cada vértice se guarda como un punto visible en el mapa, similar a los
-        puntos de investigación del usuario
+        puntos de investigación del usuario. El id y el timestamp salen del
+        polígono, así que extraer dos veces los mismos polígonos da los mismos
+        vértices; el punto de cierre del anillo no se repite
         """
         vertices = []
         
         for polygon in ml_polygons:
             properties = polygon.get("properties", {})
             coordinates = polygon.get("geometry", {}).get("coordinates", [])
+            polygon_id = properties.get("id", "ml")
             
-            if coordinates:
-                for ring in coordinates:
-                    for coord in ring:
-                        vertex = {
-                            "id": f"ml_vertex_{len(vertices)}_{datetime.now().strftime('%H%M%S')}",
-                            "lng": coord[0],
-                            "lat": coord[1],
-                            "source_polygon": properties.get("Site", "ML Polygon"),
-                            "type": "ML Vertex",
-                            "season": "Auto-generated",
-                            "area": 0,
-                            "timestamp": datetime.now().isoformat()
-                        }
-                        vertices.append(vertex)
+            for r, ring in enumerate(coordinates):
+                if len(ring) > 1 and ring[0] == ring[-1]:
+                    ring = ring[:-1]
+                for k, coord in enumerate(ring):
+                    vertex = {
+                        "id": f"ml_vertex_{polygon_id}_{r}_{k}",
+                        "lng": coord[0],
+                        "lat": coord[1],
+                        "source_polygon": properties.get("Site", "ML Polygon"),
+                        "polygon_id": polygon_id,
+                        "type": "ML Vertex",
+                        "season": "Auto-generated",
+                        "area": 0,
+                        "timestamp": properties.get("timestamp")
+                    }
+                    vertices.append(vertex)
         
         return vertices
     
-    def auto_generate_ml_polygons(self):
-        """Genera polígonos ML automáticamente al iniciar el sistema"""
-        print("🔄 Generando polígonos ML automáticamente...")
+    def encode_ml_vertices(self, ml_polygons):
+        """Vértices ML en formato compacto: un encoded polyline por anillo de cada polígono"""
+        return {
+            "encoding": lod.ENCODING,
+            "polygons": [{
+                "id": f["properties"].get("id"),
+                "source_polygon": f["properties"].get("Site", "ML Polygon"),
+                "timestamp": f["properties"].get("timestamp"),
+                "vertices": [lod.encode_polyline(ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else ring)
+                             for ring in f["geometry"]["coordinates"]]
+            } for f in ml_polygons]
+        }
+    
+    def build_ml_polygon(self, indices, hull, area, stats, polygon_id, site, auto=True):
+        """
+        Construye el feature GeoJSON de un cluster (envolvente + estadísticas)
+        
+        indices son las filas del cluster en point_store y stats su
+        procedencia (fuentes, puntos de usuario y polígonos originales
+        involucrados). auto=False para los de la generación manual
+        """
+        return {
+            "type": "Feature",
+            "properties": {
+                "id": polygon_id,
+                "Site": site,
+                "Type": "ML Generated",
+                "Season": "Variable", 
+                "Area": area,
+                "point_count": len(indices),
+                "reports": int(self.point_store.weights[indices].sum()),
+                "user_points": stats["user_count"],
+                "sources": stats["sources"],
+                "original_polygons_involved": stats["original_polygons"],
+                "generated_auto": True,
+                "auto_generated": auto,
+                "timestamp": datetime.now().isoformat()
+            },
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [hull]
+            }
+        }
+    
+    def auto_generate_ml_polygons(self, checkpoint=True):
+        """
+        Genera polígonos ML automáticamente desde cero
+        
+        Ejecuta DBSCAN completo sobre todos los puntos y deja el estado del
+        motor incremental listo para que add_user_point solo actualice los
+        clusters afectados. Con checkpoint=False los resultados se guardan en
+        el próximo checkpoint (el arranque no escribe en disco)
+        """
+        logger.info("🔄 Generando polígonos ML automáticamente...")
         
         # Extraer TODOS los puntos de la base de datos combinada + puntos usuario
-        all_points = self.extract_points_from_combined_data()
+        # (incluye los pendientes de clustering incremental)
+        self.pending_cluster_points = []
+        self.point_store = self.extract_points_from_combined_data()
+        lnglat = self.point_store.coords
         
-        if len(all_points) < 3:
-            print("❌ No hay suficientes puntos para generar polígonos ML automáticamente")
-            return
+        self.clusterer = self.make_clusterer()
+        if len(lnglat):
+            with metrics.stage('dbscan'):
+                radius = self.cluster_radius(self.metric)
+                graph = self.neighbor_graph.get(lnglat, radius, self.metric)
+                labels = self.clusterer.fit(self.engine_coords(lnglat), graph=graph, graph_eps=radius,
+                                            sample_weight=self.point_store.weights)
+        else:
+            labels = np.empty(0, dtype=np.int64)
+        metrics.CLUSTERING_RUNS.inc(mode='full')
         
-        # Agrupar puntos usando DBSCAN
-        clusters = self.cluster_points(all_points, eps=0.05, min_samples=3)
+        self.cluster_polygons = {}
+        if len(lnglat) < 3:
+            logger.warning("❌ No hay suficientes puntos para generar polígonos ML automáticamente")
+            self.publish_ml_polygons()
+        else:
+            n_noise = int((labels == -1).sum())
+            logger.info("🔍 DBSCAN encontró %s clusters y %s puntos de ruido", len(self.clusterer.members), n_noise)
+            self.refresh_clusters(self.clusterer.members)
+        
+        if checkpoint:
+            self.checkpoint()
+    
+    def refresh_clusters(self, touched, removed=()):
+        """Recalcula la envolvente solo de los clusters modificados"""
+        for root in removed:
+            self.cluster_polygons.pop(root, None)
+        
+        roots = list(touched)
+        clusters = [np.asarray(self.clusterer.members[root], dtype=np.int64) for root in roots]
+        for root in roots:
+            self.cluster_polygons.pop(root, None)
+        
+        # Polígonos publicados por id: un cluster recalculado sin cambios
+        # conserva su feature (el feed de cambios no lo ve modificado)
+        published = {f["properties"].get("id"): f for f in self.combined_data.get("features", [])
+                     if f.get("properties", {}).get("auto_generated", False)}
+        taken = {p["properties"]["id"] for p in self.cluster_polygons.values()}
+        
+        for i, hull, area, stats in self.cluster_polygon_parts(clusters, "automático"):
+            root = roots[i]
+            polygon_id = self.cluster_id(clusters[i], "ml_auto")
+            if polygon_id in taken:
+                polygon_id = f"{polygon_id}_{root}"
+            taken.add(polygon_id)
+            polygon = self.build_ml_polygon(clusters[i], hull, area, stats, polygon_id, "Área ML Auto")
+            previous = published.get(polygon_id)
+            if previous is not None and self.same_ml_polygon(previous, polygon):
+                polygon = previous
+            self.cluster_polygons[root] = polygon
+        
+        self.publish_ml_polygons()
+    
+    def cluster_id(self, indices, prefix):
+        """
+        Id estable de un cluster derivado de su contenido: hash de su punto
+        ancla (el menor en orden lng, lat). Recalcular el clustering desde
+        cero da los mismos ids, y un cluster conserva el suyo al ganar o
+        perder puntos mientras conserve el ancla
+        """
+        coords = np.round(self.point_store.coords[indices], 7)
+        anchor = coords[np.lexsort((coords[:, 1], coords[:, 0]))[0]]
+        return f"{prefix}_{content_digest(anchor)[:12]}"
+    
+    def same_ml_polygon(self, old, new):
+        """True si new solo difiere de old en timestamp y nombre de sitio"""
+        ignored = ("timestamp", "Site")
+        return (old.get("geometry") == new.get("geometry")
+                and {k: v for k, v in old["properties"].items() if k not in ignored}
+                == {k: v for k, v in new["properties"].items() if k not in ignored})
+    
+    def publish_ml_polygons(self):
+        """Sustituye los polígonos auto-generados de la base combinada y guarda"""
+        # Números de sitio estables: cada polígono conserva el suyo mientras
+        # conserve su id y los nuevos toman los números libres más bajos
+        roots = sorted(self.cluster_polygons)
+        numbers, used = {}, set()
+        for root in roots:
+            properties = self.cluster_polygons[root]["properties"]
+            number = self.site_numbers.get(properties["id"])
+            if number is None:
+                suffix = str(properties.get("Site", "")).rsplit(' ', 1)[-1]
+                number = int(suffix) if suffix.isdigit() else None
+            if number is not None and number not in used:
+                numbers[properties["id"]] = number
+                used.add(number)
+        free = (n for n in itertools.count(1) if n not in used)
         
         new_polygons = []
+        for root in roots:
+            polygon = self.cluster_polygons[root]
+            polygon_id = polygon["properties"]["id"]
+            if polygon_id not in numbers:
+                numbers[polygon_id] = next(free)
+            site = f"Área ML Auto {numbers[polygon_id]}"
+            if polygon["properties"].get("Site") != site:
+                # Copia al renumerar: el feature anterior puede estar en un snapshot publicado
+                polygon = dict(polygon, properties=dict(polygon["properties"], Site=site))
+                self.cluster_polygons[root] = polygon
+            new_polygons.append(polygon)
+        self.site_numbers = numbers
         
-        for i, cluster in enumerate(clusters):
-            if len(cluster) >= 3:
-                try:
-                    hull = self.convex_hull(cluster)
-                    if hull and len(hull) >= 4:
-                        area = self.calculate_area(hull)
-                        
-                        # Encontrar fuentes únicas
-                        sources = set()
-                        user_count = 0
-                        original_polygons = set()
-                        
-                        for point in cluster:
-                            if point.get("source") == "user":
-                                user_count += 1
-                            sources.add(point.get("source", "unknown"))
-                            
-                            # Identificar polígonos originales involucrados
-                            props = point.get("properties", {})
-                            if props.get("Site"):
-                                original_polygons.add(props.get("Site"))
-                        
-                        polygon_feature = {
-                            "type": "Feature",
-                            "properties": {
-                                "id": f"ml_auto_{i}_{datetime.now().strftime('%H%M%S')}",
-                                "Site": f"Área ML Auto {i+1}",
-                                "Type": "ML Generated",
-                                "Season": "Variable", 
-                                "Area": area,
-                                "point_count": len(cluster),
-                                "user_points": user_count,
-                                "sources": list(sources),
-                                "original_polygons_involved": list(original_polygons),
-                                "generated_auto": True,
-                                "auto_generated": True,
-                                "timestamp": datetime.now().isoformat()
-                            },
-                            "geometry": {
-                                "type": "Polygon",
-                                "coordinates": [hull]
-                            }
-                        }
-                        
-                        new_polygons.append(polygon_feature)
-                        print(f"✅ Polígono ML Auto {i+1} generado con {len(cluster)} puntos")
-                        
-                except Exception as e:
-                    print(f"❌ Error creando polígono ML automático: {e}")
+        # Eliminar polígonos ML auto-generados anteriores para evitar duplicados
+        existing_features = [f for f in self.combined_data.get("features", [])
+                             if not f.get("properties", {}).get("auto_generated", False)]
+        
+        # Añadir los nuevos polígonos auto-generados (en una colección nueva)
+        existing_features.extend(new_polygons)
+        self.combined_data = dict(self.combined_data, features=existing_features)
+        
+        # Sustituir los polígonos auto-generados en el índice espacial
+        with self.index_lock.writing():
+            for key in self.ml_index_keys:
+                self.spatial_index.remove(key)
+            self.ml_index_keys = [key for key in (self.spatial_index.insert_feature("ml", p) for p in new_polygons)
+                                  if key is not None]
+        
+        # Extraer vértices de los polígonos ML; se guardan en el próximo checkpoint
+        self.ml_vertices = self.extract_ml_vertices(new_polygons)
+        self.ml_dirty = True
+        self.snapshot_dirty = True
+        self.ml_version += 1
+        self.publish_data()
+        self.update_cluster_metrics()
         
         if new_polygons:
-            # Agregar nuevos polígonos a la base de datos combinada
-            existing_features = self.combined_data.get("features", [])
-            
-            # Eliminar polígonos ML auto-generados anteriores para evitar duplicados
-            existing_features = [f for f in existing_features 
-                               if not f.get("properties", {}).get("auto_generated", False)]
-            
-            # Añadir los nuevos polígonos auto-generados
-            existing_features.extend(new_polygons)
-            self.combined_data["features"] = existing_features
+            logger.info("✅ %s polígonos ML generados automáticamente", len(new_polygons))
+            logger.info("✅ %s vértices ML extraídos", len(self.ml_vertices))
+        else:
+            logger.info("ℹ️ No se generaron nuevos polígonos ML automáticamente")
+    
+    def update_cluster_metrics(self):
+        """Gauges de puntos por fuente, clusters, ruido y polígonos del estado actual"""
+        for source, count in self.point_store.source_counts().items():
+            metrics.POINTS.set(count, source=source)
+        clustered = sum(len(members) for members in self.clusterer.members.values())
+        metrics.CLUSTERS.set(len(self.clusterer.members))
+        metrics.NOISE_POINTS.set(self.clusterer.n_points - clustered)
+        metrics.ML_POLYGONS.set(len(self.cluster_polygons))
+    
+    def partition_polygons(self, season=None, since=None, until=None):
+        """
+        Polígonos ML del clustering particionado por temporada y ventana de tiempo
+        
+        Solo se agrupan las particiones seleccionadas que no están en caché
+        (nuevas o con puntos añadidos desde la última consulta); el resto se
+        sirve tal cual. since / until seleccionan las ventanas que se solapan
+        con el rango; los datos sin fecha solo aparecen sin filtro de tiempo
+        """
+        self.refresh()
+        with self.lock:
+            partitions = self.partitions
+            params = (self.metric, self.cluster_radius(self.metric), self.min_samples, self.hull_mode)
+            partitions.sync(self.point_store, params)
+            codes = partitions.select(season, since, until)
+            stale = [code for code in codes if code not in partitions.polygons]
+            if stale:
+                self.build_partitions(stale)
+            return [polygon for code in codes for polygon in partitions.polygons[code]]
+    
+    def build_partitions(self, codes):
+        """Agrupa las particiones codes en paralelo y construye y guarda sus polígonos"""
+        partitions = self.partitions
+        members = partitions.members(codes)
+        coords, weights = self.point_store.coords, self.point_store.weights
+        radius = self.cluster_radius(self.metric)
+        start = time.perf_counter()
+        
+        with metrics.stage('partition_dbscan'):
+            with ThreadPoolExecutor(self.polygon_pipeline.workers, thread_name_prefix='partition-worker') as executor:
+                clusterings = list(executor.map(
+                    lambda code: cluster_partition(coords[members[code]], radius, self.min_samples, self.metric,
+                                                   weights[members[code]]),
+                    codes))
+        metrics.CLUSTERING_RUNS.inc(len(codes), mode='partition')
+        
+        # Envolventes de los clusters de todas las particiones en una sola pasada
+        clusters, owners = [], []
+        for code, clustering in zip(codes, clusterings):
+            partitions.polygons[code] = []
+            for cluster in clustering:
+                clusters.append(members[code][cluster])
+                owners.append(code)
+        
+        for i, hull, area, stats in self.cluster_polygon_parts(clusters, "por partición"):
+            code = owners[i]
+            season, window = partitions.keys[code]
+            polygons = partitions.polygons[code]
+            polygon = self.build_ml_polygon(
+                clusters[i], hull, area, stats,
+                self.cluster_id(clusters[i], f"ml_{season}_{window or 'all'}".replace(' ', '_')),
+                f"Área ML {partitions.seasons[code]} {len(polygons) + 1}" + (f" ({window})" if window else ""))
+            polygon["properties"].update(Season=partitions.seasons[code], time_window=window)
+            polygons.append(polygon)
+        
+        logger.info("🗓️ %s particiones agrupadas (%s clusters) en %.2fs",
+                    len(codes), len(clusters), time.perf_counter() - start)
+    
+    def cluster_sweep(self, eps_values=None, min_samples_values=None, metric=None):
+        """
+        Ajuste de eps y min_samples sin re-ejecutar DBSCAN por cada candidato
+        
+        La curva k-distancia se calcula una sola vez (para el min_samples
+        máximo) y su codo da el eps recomendado de cada min_samples. La
+        rejilla (por defecto el eps del codo × DEFAULT_EPS_FACTORS) se evalúa
+        en paralelo sobre un único grafo de vecinos con el eps máximo. eps va
+        en grados con métrica 'euclidean' y en km con 'haversine'
+        
+        Los puntos y pesos se copian bajo el cerrojo y el barrido corre sin
+        él, así que no bloquea la ingesta
+        """
+        self.refresh()
+        with self.lock:
+            metric = metric or self.metric
+            min_samples = self.min_samples
+            current = {"eps": self.cluster_radius(metric), "min_samples": min_samples}
+            coords = self.point_store.coords.copy()
+            weights = self.point_store.weights.copy()
+        min_samples_values = sorted(set(min_samples_values or SWEEP_MIN_SAMPLES + (min_samples,)))
+        
+        if len(coords) < 3:
+            return {
+                "status": "insufficient_points",
+                "message": "No hay suficientes puntos para ajustar los parámetros",
+                "current": current
+            }
+        
+        with self.sweep_lock:
+            with metrics.stage('k_distance'):
+                distances = self.k_distances.get(coords, max(min_samples_values), metric)
+            knees = {m: knee(distances[:, m - 1]) for m in min_samples_values if m <= distances.shape[1]}
+            recommended = min_samples if min_samples in knees else min_samples_values[0]
             
-            # Extraer y guardar vértices de los polígonos ML
-            self.ml_vertices = self.extract_ml_vertices(new_polygons)
-            self.save_ml_vertices()
+            if eps_values is None:
+                base = knees.get(recommended) or current["eps"]
+                eps_values = [min(base * factor, sweep_max_eps(metric)) for factor in DEFAULT_EPS_FACTORS]
+            eps_values = sorted(set(eps_values))
+            if len(eps_values) * len(min_samples_values) > SWEEP_MAX_CANDIDATES:
+                raise ValueError(f"Máximo {SWEEP_MAX_CANDIDATES} candidatos (eps × min_samples)")
             
-            self.save_combined_data()
-            print(f"✅ {len(new_polygons)} polígonos ML generados automáticamente")
-            print(f"✅ {len(self.ml_vertices)} vértices ML extraídos")
+            start = time.perf_counter()
+            with metrics.stage('cluster_sweep'):
+                graph = self.sweep_graph.get(coords, max(eps_values), metric)
+                candidates = sweep(graph, eps_values, min_samples_values, self.polygon_pipeline.workers,
+                                   weights)
+        logger.info("🔍 Barrido de parámetros: %s candidatos sobre %s puntos en %.2fs",
+                    len(candidates), len(coords), time.perf_counter() - start)
+        
+        return {
+            "status": "success",
+            "metric": metric,
+            "eps_unit": "km" if metric == 'haversine' else "grados",
+            "points": len(coords),
+            "current": current,
+            "recommended": {"eps": knees.get(recommended), "min_samples": recommended},
+            "knees": [{"min_samples": m, "eps": eps} for m, eps in knees.items()],
+            "candidates": candidates
+        }
+    
+    def apply_cluster_params(self, eps, min_samples, metric=None):
+        """
+        Usa (eps, min_samples) en los próximos clusterings (p. ej. los
+        recomendados por cluster_sweep). Solo cambia la configuración en
+        memoria: hace falta un re-clustering completo para aplicarla
+        """
+        self.metric = metric or self.metric
+        if self.metric == 'haversine':
+            self.eps_km = float(eps)
         else:
-            print("ℹ️ No se generaron nuevos polígonos ML automáticamente")
+            self.eps = float(eps)
+        self.min_samples = int(min_samples)
+        logger.info("⚙️ Parámetros de DBSCAN: metric=%s eps=%s min_samples=%s", self.metric, eps, min_samples)
     
-    def generate_ml_polygons(self):
-        """Genera polígonos usando machine learning desde la base de datos combinada"""
-        # Extraer TODOS los puntos de la base de datos combinada + puntos usuario
-        all_points = self.extract_points_from_combined_data()
+    def generate_ml_polygons(self, eps=None, min_samples=None, metric=None, eps_km=None):
+        """
+        Genera polígonos usando machine learning desde la base de datos combinada
+        
+        Los parámetros permiten probar otra configuración de DBSCAN sin
+        cambiar la del sistema (p. ej. metric='haversine', eps_km=3)
+        """
+        # Puntos de la base de datos combinada + puntos usuario (ya extraídos
+        # y mantenidos al día en el almacén columnar)
+        store = self.point_store
         
-        if len(all_points) < 3:
+        if len(store) < 3:
             return {
                 "status": "insufficient_points",
                 "message": "No hay suficientes puntos para generar polígonos",
@@ -403,59 +1351,16 @@ class WildflowerMLSystem:
             }
         
         # Agrupar puntos usando DBSCAN
-        clusters = self.cluster_points(all_points, eps=0.05, min_samples=3)
+        clusters = self.cluster_points(store.coords, eps=eps, min_samples=min_samples,
+                                       metric=metric, eps_km=eps_km, weights=store.weights)
+        metrics.CLUSTERING_RUNS.inc(mode='manual')
         
         new_polygons = []
-        
-        for i, cluster in enumerate(clusters):
-            if len(cluster) >= 3:
-                try:
-                    hull = self.convex_hull(cluster)
-                    if hull and len(hull) >= 4:
-                        area = self.calculate_area(hull)
-                        
-                        # Encontrar fuentes únicas
-                        sources = set()
-                        user_count = 0
-                        original_polygons = set()
-                        
-                        for point in cluster:
-                            if point.get("source") == "user":
-                                user_count += 1
-                            sources.add(point.get("source", "unknown"))
-                            
-                            # Identificar polígonos originales involucrados
-                            props = point.get("properties", {})
-                            if props.get("Site"):
-                                original_polygons.add(props.get("Site"))
-                        
-                        polygon_feature = {
-                            "type": "Feature",
-                            "properties": {
-                                "id": f"ml_manual_{i}_{datetime.now().strftime('%H%M%S')}",
-                                "Site": f"Área ML Manual {i+1}",
-                                "Type": "ML Generated",
-                                "Season": "Variable", 
-                                "Area": area,
-                                "point_count": len(cluster),
-                                "user_points": user_count,
-                                "sources": list(sources),
-                                "original_polygons_involved": list(original_polygons),
-                                "generated_auto": True,
-                                "auto_generated": False,
-                                "timestamp": datetime.now().isoformat()
-                            },
-                            "geometry": {
-                                "type": "Polygon",
-                                "coordinates": [hull]
-                            }
-                        }
-                        
-                        new_polygons.append(polygon_feature)
-                        print(f"✅ Polígono ML Manual {i+1} generado con {len(cluster)} puntos")
-                        
-                except Exception as e:
-                    print(f"❌ Error creando polígono ML manual: {e}")
+        for i, hull, area, stats in self.cluster_polygon_parts(clusters, "manual"):
+            new_polygons.append(self.build_ml_polygon(
+                clusters[i], hull, area, stats, self.cluster_id(clusters[i], "ml_manual"),
+                f"Área ML Manual {i+1}", auto=False))
+            logger.debug("✅ Polígono ML Manual %s generado con %s puntos", i+1, len(clusters[i]))
         
         # Agregar nuevos polígonos a la base de datos combinada
         existing_features = self.combined_data.get("features", [])
@@ -466,14 +1371,17 @@ class WildflowerMLSystem:
         
         # Añadir los nuevos polígonos
         existing_features.extend(new_polygons)
-        self.combined_data["features"] = existing_features
+        self.combined_data = dict(self.combined_data, features=existing_features)
+        self.ml_version += 1
         
         # Extraer y guardar vértices de los polígonos ML
         if new_polygons:
             self.ml_vertices = self.extract_ml_vertices(new_polygons)
             self.save_ml_vertices()
+        self.publish_data()
         
         self.save_combined_data()
+        self.rebuild_spatial_index()
         
         return {
             "status": "success",
@@ -481,29 +1389,228 @@ class WildflowerMLSystem:
             "polygons": self.combined_data
         }
     
-    def add_user_point(self, point_data):
-        """Añade punto de usuario"""
+    def build_user_point(self, point_data):
+        """
+        Valida los datos de un punto y construye su registro
+        
+        Acepta el formato de /api/add-user-point ({"lat", "lng", "name", ...})
+        o un Feature GeoJSON de tipo Point. Lanza ValueError si el punto no
+        es válido. Las coordenadas se redondean a SNAP_DECIMALS decimales; el
+        id definitivo se asigna al registrarlo (append_user_points)
+        """
+        if not isinstance(point_data, dict):
+            raise ValueError("El punto debe ser un objeto JSON")
+        
+        if point_data.get("type") == "Feature":
+            geometry = point_data.get("geometry") or {}
+            if not isinstance(geometry, dict) or geometry.get("type") != "Point":
+                raise ValueError("Solo se admiten Features con geometría Point")
+            coordinates = geometry.get("coordinates") or []
+            if not isinstance(coordinates, (list, tuple)) or len(coordinates) < 2:
+                raise ValueError("Coordenadas de Point incompletas")
+            properties = point_data.get("properties") or {}
+            if not isinstance(properties, dict):
+                raise ValueError("properties debe ser un objeto JSON")
+            point_data = dict(properties, lng=coordinates[0], lat=coordinates[1])
+        
+        lat, lng = parse_lat_lng(point_data.get("lat"), point_data.get("lng"))
+        lng, lat = self.dedup.snap(lng, lat)
+        
         point_id = f"user_point_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        new_point = {
+        return {
             "id": point_id,
             "name": point_data.get("name", "Punto de usuario"),
             "type": point_data.get("type", "Wild"),
             "season": point_data.get("season", "Variable"),
             "area": point_data.get("area", 1000),
-            "lat": point_data.get("lat"),
-            "lng": point_data.get("lng"),
+            "lat": lat,
+            "lng": lng,
             "timestamp": datetime.now().isoformat()
         }
+    
+    def append_user_points(self, new_points):
+        """
+        Registra puntos ya validados (lista, log e índice espacial) y los deja
+        pendientes de clustering en pending_cluster_points
         
-        self.user_points.append(new_point)
-        self.save_user_points()
+        Cada punto pasa antes por la deduplicación: si repite un punto
+        registrado cercano (ver dedup) ese punto se sustituye por una copia
+        con un reporte más de peso; si no, se añade al final con un id libre.
+        Devuelve el registro resultante de cada punto (el nuevo o el que lo
+        absorbió)
+        """
+        self.tag_sites(new_points)
+        start = len(self.user_points)
+        records, replaced = [], set()
+        with self.index_lock.writing():
+            for new_point in new_points:
+                position = self.dedup.match(new_point)
+                if position is None:
+                    new_point["id"] = self.dedup.unique_id(new_point["id"])
+                    position = len(self.user_points)
+                    self.user_points.append(new_point)
+                    self.user_index_keys.append(None)
+                    self.dedup.add(position, new_point)
+                    record = new_point
+                else:
+                    # Copia: el punto anterior puede estar en un snapshot publicado
+                    record = self.dedup.merge(self.user_points[position], new_point)
+                    self.user_points[position] = record
+                    self.spatial_index.remove(self.user_index_keys[position])
+                    if position < start:
+                        replaced.add(position)
+                self.user_index_keys[position] = self.spatial_index.insert_point("user", record["lng"], record["lat"], record)
+                if self.database is None:
+                    # Solo se anexa el registro al log: el costo no depende del tamaño de la base
+                    self.point_log.append(record)
+                records.append(record)
+        
+        changed = [self.user_points[position] for position in sorted(replaced)]
+        appended = self.user_points[start:]
+        if self.database is not None:
+            # Una sola transacción para todo el lote
+            self.database.append_user_points(appended, changed)
+        self.pending_cluster_points.extend(changed + appended)
+        if new_points:
+            metrics.POINTS_INGESTED.inc(len(new_points))
+            metrics.POINTS_MERGED.inc(len(new_points) - len(appended))
+            self.publish_data()
+        return records
+    
+    def cluster_pending_points(self):
+        """
+        Inserta los puntos pendientes en el motor incremental y recalcula una
+        sola vez las envolventes de todos los clusters afectados
+        
+        Si la inserción de un punto falla, ese punto y los siguientes vuelven
+        a pendientes (el próximo trabajo los reintenta) en vez de perderse
+        """
+        new_points, self.pending_cluster_points = self.pending_cluster_points, []
+        touched_all, removed_all = set(), set()
+        store, reweighted = self.point_store, []
+        processed = 0
+        
+        try:
+            with metrics.stage('dbscan_incremental'):
+                for new_point in new_points:
+                    # Actualizar solo los clusters que alcanza la vecindad del
+                    # punto; el almacén se toca después del motor, que es lo que puede fallar
+                    row = store.user_rows.get(user_key(new_point))
+                    if row is None:
+                        touched, removed = self.clusterer.insert(
+                            self.engine_coords([[new_point["lng"], new_point["lat"]]])[0], point_weight(new_point))
+                        store.append(new_point["lng"], new_point["lat"], "user", new_point, point_weight(new_point))
+                    else:
+                        # Reporte fusionado en un punto ya agrupado: solo cambia su peso
+                        touched, removed = self.clusterer.reweight(row, point_weight(new_point))
+                        store.update_user_point(row, new_point)
+                        reweighted.append(row)
+                    processed += 1
+                    removed_all |= removed
+                    touched_all = (touched_all - removed) | touched
+        finally:
+            self.pending_cluster_points[:0] = new_points[processed:]
+            self.partitions.invalidate(store, reweighted)
+        
+        if new_points:
+            metrics.CLUSTERING_RUNS.inc(mode='incremental')
+            self.refresh_clusters(touched_all, removed_all)
+        
+        if self.point_log.count >= WAL_COMPACT_EVERY:
+            self.checkpoint()
+        
+        return {"clustered_points": len(new_points), "ml_version": self.ml_version}
+    
+    def add_user_point(self, point_data, defer_clustering=False):
+        """
+        Añade punto de usuario
         
-        print(f"✅ Punto de usuario añadido: {new_point['name']}")
+        Con defer_clustering=True el punto queda registrado pero el
+        clustering se deja para cluster_pending_points (trabajo en segundo
+        plano). Devuelve el punto registrado: el nuevo o, si el reporte era
+        un duplicado, el punto existente con su peso aumentado
+        """
+        new_point = self.build_user_point(point_data)
+        record = self.append_user_points([new_point])[0]
+        if not defer_clustering:
+            self.cluster_pending_points()
         
-        # Generar polígonos ML automáticamente después de añadir un punto
-        self.auto_generate_ml_polygons()
+        if record is new_point:
+            logger.debug("✅ Punto de usuario añadido: %s", new_point['name'])
+        else:
+            logger.debug("🔁 Reporte fusionado en el punto %s (peso %s)", record['id'], point_weight(record))
         
-        return new_point
+        return record
+    
+    def add_user_points(self, rows, defer_clustering=False):
+        """
+        Ingesta masiva de puntos de usuario
+        
+        rows es un iterable de puntos (dicts o líneas JSON sin decodificar,
+        p. ej. de un upload NDJSON). Las filas inválidas se reportan con su
+        número y no detienen la carga; el clustering se actualiza una sola
+        vez al final (o en segundo plano con defer_clustering=True)
+        """
+        start = time.perf_counter()
+        accepted = []
+        errors = []
+        
+        for row_number, row in enumerate(rows):
+            try:
+                if isinstance(row, (str, bytes)):
+                    row = json.loads(row)
+                accepted.append(self.build_user_point(row))
+            except ValueError as e:
+                errors.append({"row": row_number, "error": str(e)})
+        
+        records = self.append_user_points(accepted)
+        self.point_log.sync()
+        metrics.POINTS_REJECTED.inc(len(errors))
+        if not defer_clustering:
+            self.cluster_pending_points()
+        merged = sum(record is not point for record, point in zip(records, accepted))
+        
+        elapsed = time.perf_counter() - start
+        logger.info("✅ Carga masiva: %s puntos aceptados (%s fusionados con puntos existentes), %s rechazados en %.2fs",
+                    len(accepted), merged, len(errors), elapsed)
+        
+        return {
+            "status": "success" if accepted or not errors else "error",
+            "accepted": len(accepted),
+            "merged": merged,
+            "rejected": len(errors),
+            "errors": errors,
+            "elapsed_s": elapsed,
+            "points_per_second": len(accepted) / elapsed if elapsed > 0 else None
+        }
+    
+    def reset_database(self, defer_clustering=False):
+        """
+        Resetea la base de datos combinada a los datos originales
+        
+        Con defer_clustering=True la regeneración de polígonos ML se deja
+        para un trabajo en segundo plano
+        """
+        # Recargar datos originales (en streaming y con el mismo filtro de carga)
+        self.combined_data = self.load_geojson(self.primary_geojson, LOAD_FILTER)
+        self.sites_version += 1
+        self.save_combined_data()
+        
+        # Limpiar puntos de usuario
+        self.user_points = []
+        self.pending_cluster_points = []
+        self.dedup.reset(self.user_points)
+        self.save_user_points()
+        self.rebuild_spatial_index()
+        
+        # Limpiar vértices ML
+        self.ml_vertices = []
+        self.save_ml_vertices()
+        self.publish_data()
+        
+        # Regenerar polígonos ML automáticamente después del reset
+        if not defer_clustering:
+            self.auto_generate_ml_polygons()
     
     # app.py (modificar solo la función get_heatmap_data)
     def get_heatmap_data(self):
@@ -514,33 +1621,112 @@ class WildflowerMLSystem:
         heatmap_data = []
         
         # Añadir SOLO centroides de polígonos ML (NO puntos de usuario)
-        for feature in self.combined_data.get("features", []):
-            properties = feature.get("properties", {})
-            if properties.get("generated_auto", False):
-                geometry = feature.get("geometry", {})
-                if geometry.get("type") == "Polygon":
-                    coords = geometry.get("coordinates", [])
-                    if coords and len(coords) > 0:
-                        centroid = self.calculate_polygon_centroid(coords[0])
-                        if centroid:
-                            heatmap_data.append({
-                                "lng": centroid[0],
-                                "lat": centroid[1],
-                                "intensity": 1.0,
-                                "source": "ml_centroid",
-                                "polygon_name": properties.get("Site", "ML Polygon")
-                            })
-        
-        print(f"🔥 Heatmap generado con {len(heatmap_data)} centroides ML (sin puntos usuario)")
+        polygons, centroids = self.ml_polygon_centroids(self.published.combined_data.get("features", []))
+        for feature, centroid in zip(polygons, centroids.tolist()):
+            if not np.isnan(centroid).any():
+                heatmap_data.append({
+                    "lng": centroid[0],
+                    "lat": centroid[1],
+                    "intensity": 1.0,
+                    "source": "ml_centroid",
+                    "polygon_name": feature["properties"].get("Site", "ML Polygon")
+                })
+        
+        logger.debug("🔥 Heatmap generado con %s centroides ML (sin puntos usuario)", len(heatmap_data))
         return {
             "point_count": len(heatmap_data),
             "heatmap_data": heatmap_data
         }
     
+    def heatmap_points(self):
+        """
+        Puntos que alimentan las teselas de densidad: puntos de usuario,
+        vértices de los polígonos originales y centroides de polígonos ML
+        
+        Devuelve (coordenadas, pesos): un punto de usuario pesa tantos
+        reportes como absorbió en la deduplicación; el resto pesa 1
+        """
+        blocks, weights = [], []
+        if self.user_points:
+            blocks.append(np.array([[p["lng"], p["lat"]] for p in self.user_points], dtype=np.float64))
+            weights.append(np.array([point_weight(p) for p in self.user_points], dtype=np.float64))
+        
+        store = self.point_store
+        blocks.append(store.coords[store.source != USER])
+        
+        _, centroids = self.ml_polygon_centroids(self.combined_data.get("features", []))
+        blocks.append(centroids[~np.isnan(centroids).any(axis=1)])
+        weights.append(np.ones(len(blocks[-2]) + len(blocks[-1])))
+        
+        return np.concatenate(blocks), np.concatenate(weights)
+    
+    def get_heatmap_tiles(self):
+        """Pirámide de densidad al día con data_version (se reconstruye si cambió)"""
+        self.refresh()
+        version = self.data_version
+        if self.heatmap_tiles.version != version:
+            with self.lock:
+                if self.heatmap_tiles.version != self.data_version:
+                    version = self.data_version
+                    start = time.perf_counter()
+                    with metrics.stage('heatmap_tiles'):
+                        lnglat, weights = self.heatmap_points()
+                        self.heatmap_tiles.build(lnglat, weights=weights, version=version)
+                    logger.info("🔥 Pirámide de heatmap: %s puntos en %.2fs",
+                                self.heatmap_tiles.point_count, time.perf_counter() - start)
+        return self.heatmap_tiles
+    
+    def get_locator(self):
+        """Localizador de los polígonos publicados, al día con data_version (se reconstruye si cambió)"""
+        self.refresh()
+        if self.locator.version != self.data_version:
+            with self.lock:
+                if self.locator.version != self.data_version:
+                    start = time.perf_counter()
+                    with metrics.stage('locator'):
+                        self.locator.build(self.published.combined_data.get("features", []), version=self.data_version)
+                    logger.info("📍 Localizador: %s polígonos en %.2fs", len(self.locator), time.perf_counter() - start)
+        return self.locator
+    
+    def locate_points(self, lnglat):
+        """
+        Sitios originales y áreas ML que contienen cada punto [lng, lat]: una
+        lista de coincidencias por punto
+        """
+        results = []
+        for features in self.get_locator().locate(lnglat):
+            matches = []
+            for feature in features:
+                properties = feature.get("properties", {})
+                matches.append({
+                    "layer": "ml" if properties.get("generated_auto", False) else "original",
+                    "id": properties.get("id"),
+                    "Site": properties.get("Site"),
+                    "Type": properties.get("Type"),
+                    "Season": properties.get("Season")
+                })
+            results.append(matches)
+        return results
+    
+    def tag_sites(self, points):
+        """
+        Guarda en cada punto nuevo el sitio original que lo contiene ("site",
+        None si no cae en ninguno), con una sola consulta para todo el lote
+        """
+        if not points:
+            return
+        if self.site_locator.version != self.sites_version:
+            originals = [f for f in self.combined_data.get("features", [])
+                         if not f.get("properties", {}).get("generated_auto", False)]
+            self.site_locator.build(originals, version=self.sites_version)
+        matches = self.site_locator.locate([[p["lng"], p["lat"]] for p in points])
+        for point, features in zip(points, matches):
+            point["site"] = features[0].get("properties", {}).get("Site") if features else None
+    
     def get_original_polygons(self):
         """Obtiene solo los polígonos originales (no generados por ML)"""
         original_features = []
-        for feature in self.combined_data.get("features", []):
+        for feature in self.published.combined_data.get("features", []):
             properties = feature.get("properties", {})
             if not properties.get("generated_auto", False):
                 original_features.append(feature)
@@ -553,7 +1739,7 @@ class WildflowerMLSystem:
     def get_ml_polygons(self):
         """Obtiene solo los polígonos generados por ML"""
         ml_features = []
-        for feature in self.combined_data.get("features", []):
+        for feature in self.published.combined_data.get("features", []):
             properties = feature.get("properties", {})
             if properties.get("generated_auto", False):
                 ml_features.append(feature)
@@ -569,9 +1755,13 @@ class WildflowerMLSystem:
             "algorithm": "DBSCAN (Density-Based Spatial Clustering of Applications with Noise)",
             "purpose": "Agrupar puntos geográficos basándose en su densidad espacial",
             "parameters": {
-                "eps": 0.05,
-                "min_samples": 3,
-                "eps_meaning": "Radio de búsqueda (0.05 grados ≈ 5.5 km en el ecuador)",
+                "metric": self.metric,
+                "eps": self.eps,
+                "eps_km": self.eps_km,
+                "min_samples": self.min_samples,
+                "eps_meaning": (f"Radio de búsqueda ({self.eps_km} km sobre la esfera, BallTree haversine)"
+                                if self.metric == 'haversine'
+                                else f"Radio de búsqueda ({self.eps} grados ≈ {self.eps * 111:.1f} km en el ecuador)"),
                 "min_samples_meaning": "Mínimo de puntos para formar un cluster denso"
             },
             "decision_criteria": {
@@ -581,7 +1771,8 @@ class WildflowerMLSystem:
                 "cluster_formation": "Grupos conectados de core points y sus border points"
             },
             "polygon_formation": {
-                "algorithm": "Gift Wrapping (Jarvis March) - Envolvente Convexa",
+                "algorithm": ("Alpha Shape (Delaunay) - Envolvente Cóncava" if self.hull_mode == 'concave'
+                              else "Monotone Chain (Andrew) - Envolvente Convexa"),
                 "purpose": "Encontrar el polígono más pequeño que contiene todos los puntos del cluster",
                 "output": "Polígono que representa el área de densidad detectada"
             },
@@ -591,6 +1782,12 @@ class WildflowerMLSystem:
                 "Robusto ante valores atípicos (ruido)",
                 "Funciona bien con datos geográficos"
             ],
+            "parameter_tuning": {
+                "endpoint": "/api/cluster-sweep",
+                "method": ("eps en el codo de la curva k-distancia (distancia de cada punto a su "
+                           "min_samples-ésimo vecino, ordenada) y rejilla de candidatos evaluada "
+                           "sobre un único grafo de vecinos")
+            },
             "limitations": [
                 "Sensible a los parámetros eps y min_samples",
                 "Dificultad con clusters de densidad variable",
@@ -599,11 +1796,215 @@ class WildflowerMLSystem:
         }
         return explanation
 
-# In
+class LazyMLSystem:
+    """
+    Acceso diferido a WildflowerMLSystem
+    
+    El sistema se construye en el primer uso y no al importar app.py, así que
+    importar el módulo (workers, scripts, tests) es inmediato y no toca el
+    disco. Los atributos se delegan a la instancia real
+    """
+    def __init__(self):
+        self._instance = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    logger.info("🚀 Inicializando Sistema ML de Wildflowers...")
+                    self._instance = WildflowerMLSystem()
+        return self._instance
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+#Inicializar sistema ML (en la primera petición)
+ml_system = LazyMLSystem()
+
+def run_insert_job(payloads):
+    """Clustering incremental de todos los puntos anexados desde el último trabajo"""
+    with ml_system.writing():
+        return ml_system.cluster_pending_points()
+
+def run_recluster_job(payloads):
+    """Re-clustering completo (tras un reset)"""
+    with ml_system.writing():
+        ml_system.auto_generate_ml_polygons()
+        return {"ml_version": ml_system.ml_version}
 
-#Inicializar sistema ML
-print("🚀 Inicializando Sistema ML de Wildflowers...")
-ml_system = WildflowerMLSystem()
+def run_generate_job(payloads):
+    """Generación manual de polígonos ML con los parámetros de la petición"""
+    with ml_system.writing():
+        result = ml_system.generate_ml_polygons(**payloads[-1])
+        return {"status": result["status"], "message": result["message"], "ml_version": ml_system.ml_version}
+
+recluster_jobs = ReclusterScheduler({
+    "insert": run_insert_job,
+    "recluster": run_recluster_job,
+    "generate": run_generate_job
+}, debounce=RECLUSTER_DEBOUNCE, inline=not BACKGROUND_JOBS)
+
+# Respuestas de lectura serializadas una vez por generación de datos; las
+# teselas del heatmap van en una caché aparte de tamaño acotado
+response_cache = ResponseCache()
+tile_cache = ResponseCache(max_entries=4096)
+partition_cache = ResponseCache(max_entries=256)
+
+def serialize_json(data):
+    """Cuerpo JSON en bytes de un endpoint (etapa 'serialization' en las métricas)"""
+    with metrics.stage('serialization'):
+        return app.json.response(data).get_data()
+
+def cached_json(key, band=None, fmt='geojson'):
+    """
+    Responde con el endpoint de lectura key desde la caché de respuestas
+
+    En modo multi-proceso el cuerpo sale del snapshot compartido (publicado
+    por el último proceso que escribió). La versión se lee antes de construir
+    el cuerpo, así que una entrada nunca es más antigua que la generación con
+    la que queda guardada. Las variantes por nivel de detalle (band, fmt) se
+    construyen localmente una vez por generación
+    """
+    if band is not None or fmt != 'geojson':
+        ml_system.refresh()
+        version = ml_system.published.generation
+        entry = response_cache.get(f"{key}@{band}.{fmt}", version,
+                                   lambda: serialize_json(ml_system.lod_payload(key, band, fmt)))
+        return response_cache.respond(entry, request)
+    
+    if ml_system.shared is not None:
+        generation, bodies = ml_system.shared.read()
+        if key in bodies:
+            entry = response_cache.get(key, generation, lambda: bytes(bodies[key]))
+            return response_cache.respond(entry, request)
+    
+    version = ml_system.published.generation
+    entry = response_cache.get(key, version, lambda: serialize_json(ml_system.read_payload(key)))
+    return response_cache.respond(entry, request)
+
+def lod_query_args():
+    """
+    Lee el nivel de detalle pedido
+    
+    - ?zoom=N: polígonos simplificados para el zoom N del mapa
+    - ?format=polyline: anillos como encoded polylines (por defecto geojson)
+    
+    Devuelve (banda, formato); la banda es None a resolución completa
+    """
+    fmt = request.args.get('format', 'geojson')
+    if fmt not in ('geojson', 'polyline'):
+        raise ValueError("format debe ser geojson o polyline")
+    zoom = request.args.get('zoom')
+    if zoom is None:
+        return None, fmt
+    try:
+        zoom = int(zoom)
+    except ValueError:
+        raise ValueError("zoom debe ser un entero") from None
+    if not 0 <= zoom <= 24:
+        raise ValueError("zoom debe estar entre 0 y 24")
+    return lod.band_for_zoom(zoom), fmt
+
+def lod_collection(features, band, fmt):
+    """FeatureCollection de un resultado filtrado, al nivel de detalle pedido"""
+    collection = {"type": "FeatureCollection", "features": ml_system.lod_features(features, band)}
+    return lod.encode_collection(collection) if fmt == 'polyline' else collection
+
+def partition_query_args():
+    """
+    Lee los filtros del clustering particionado
+    
+    - ?season=Spring
+    - ?since=2025-03-01&until=2025-06-01 (fechas u horas ISO 8601)
+    
+    Devuelve None si la petición no trae ninguno
+    """
+    season = request.args.get('season') or None
+    since = request.args.get('since') or None
+    until = request.args.get('until') or None
+    if season is None and since is None and until is None:
+        return None
+    try:
+        since = parse_time(since) if since else None
+        until = parse_time(until) if until else None
+    except ValueError:
+        raise ValueError("since y until deben ser fechas ISO 8601 (p. ej. 2025-03-01)") from None
+    if since is not None and until is not None and since >= until:
+        raise ValueError("since debe ser anterior a until")
+    return {"season": season, "since": since, "until": until}
+
+def partition_json(partition, query, band, fmt):
+    """Respuesta de /api/ml-polygons filtrada por temporada / ventana de tiempo"""
+    if query is None:
+        ml_system.refresh()
+        version = ml_system.published.generation
+        key = f"ml-polygons?season={partition['season']}&since={partition['since']}&until={partition['until']}"
+        entry = partition_cache.get(f"{key}@{band}.{fmt}", version, lambda: serialize_json(
+            lod_collection(ml_system.partition_polygons(**partition), band, fmt)))
+        return partition_cache.respond(entry, request)
+    
+    # Con filtro espacial: índice temporal sobre los polígonos de las particiones
+    index = SpatialIndex()
+    for feature in ml_system.partition_polygons(**partition):
+        index.insert_feature("ml", feature)
+    if "bbox" in query:
+        features = index.query_bbox(query["bbox"])
+    else:
+        lat, lng = query["near"]
+        features = index.query_radius(lng, lat, query["radius_km"])
+    return jsonify(lod_collection(features, band, fmt))
+
+def spatial_query_args():
+    """
+    Lee los filtros espaciales de la petición
+    
+    - ?bbox=min_lng,min_lat,max_lng,max_lat
+    - ?near=lat,lng&radius_km=10
+    
+    Devuelve None si la petición no trae filtro espacial
+    """
+    bbox = request.args.get('bbox')
+    near = request.args.get('near')
+    
+    if bbox:
+        values = bbox.split(',')
+        if len(values) != 4:
+            raise ValueError("bbox debe tener el formato min_lng,min_lat,max_lng,max_lat")
+        # Mismas reglas que un punto: números finitos dentro de rango
+        min_lat, min_lng = parse_lat_lng(values[1], values[0])
+        max_lat, max_lng = parse_lat_lng(values[3], values[2])
+        if min_lng > max_lng or min_lat > max_lat:
+            raise ValueError("bbox debe tener el formato min_lng,min_lat,max_lng,max_lat")
+        return {"bbox": [min_lng, min_lat, max_lng, max_lat]}
+    
+    if near:
+        values = near.split(',')
+        if len(values) != 2:
+            raise ValueError("near debe tener el formato lat,lng")
+        radius_km = float(request.args.get('radius_km', 10))
+        if not isfinite(radius_km) or radius_km <= 0:
+            raise ValueError("radius_km debe ser un número positivo")
+        return {"near": list(parse_lat_lng(*values)), "radius_km": radius_km}
+    
+    return None
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Latencia por endpoint (la regla de la ruta, no la URL, para acotar las
+    series). En respuestas en streaming mide hasta el primer byte
+    """
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                        method=request.method, status=response.status_code)
+    return response
 
 @app.route('/')
 def index():
@@ -611,28 +2012,125 @@ def index():
 
 @app.route('/api/combined-data')
 def get_combined_data():
-    return jsonify(ml_system.combined_data)
+    try:
+        query = spatial_query_args()
+        band, fmt = lod_query_args()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if query is None:
+        return cached_json("combined-data", band, fmt)
+    return jsonify(lod_collection(ml_system.query_spatial(("original", "ml"), **query), band, fmt))
 
 @app.route('/api/original-polygons')
 def get_original_polygons():
-    return jsonify(ml_system.get_original_polygons())
+    try:
+        band, fmt = lod_query_args()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return cached_json("original-polygons", band, fmt)
 
 @app.route('/api/ml-polygons')
 def get_ml_polygons():
-    return jsonify(ml_system.get_ml_polygons())
+    """
+    Polígonos ML (?season=&since=&until= los del clustering particionado por
+    temporada y ventana de tiempo)
+    """
+    try:
+        query = spatial_query_args()
+        band, fmt = lod_query_args()
+        partition = partition_query_args()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if partition is not None:
+        return partition_json(partition, query, band, fmt)
+    if query is None:
+        return cached_json("ml-polygons", band, fmt)
+    return jsonify(lod_collection(ml_system.query_spatial(("ml",), **query), band, fmt))
 
 @app.route('/api/user-points')
 def get_user_points():
-    return jsonify(ml_system.user_points)
+    try:
+        query = spatial_query_args()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if query is None:
+        return cached_json("user-points")
+    return jsonify(ml_system.query_spatial(("user",), **query))
 
 @app.route('/api/ml-vertices')
 def get_ml_vertices():
-    return jsonify(ml_system.ml_vertices)
+    """Vértices de los polígonos ML (?zoom= los de los polígonos simplificados)"""
+    try:
+        band, fmt = lod_query_args()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return cached_json("ml-vertices", band, fmt)
 
 @app.route('/api/heatmap-data')
 def get_heatmap_data():
-    data = ml_system.get_heatmap_data()
-    return jsonify(data)
+    return cached_json("heatmap-data")
+
+@app.route('/api/heatmap/<int:z>/<int:x>/<int:y>')
+@app.route('/api/heatmap/<int:z>/<int:x>/<int:y>.<fmt>')
+def get_heatmap_tile(z, x, y, fmt=None):
+    """
+    Tesela XYZ de densidad calculada en el servidor
+    
+    - .png (o ?format=png): imagen RGBA coloreada, lista para un L.tileLayer
+    - .json (por defecto): celdas [col, fila, densidad] de una rejilla fija
+    """
+    fmt = fmt or request.args.get('format', 'json')
+    if fmt not in ('json', 'png'):
+        return jsonify({"status": "error", "message": "Formato no soportado (json o png)"}), 400
+    
+    tiles = ml_system.get_heatmap_tiles()
+    try:
+        if fmt == 'png':
+            entry = tile_cache.get(f"{z}/{x}/{y}.png", tiles.version,
+                                   lambda: tiles.tile_png(z, x, y), mimetype='image/png')
+        else:
+            entry = tile_cache.get(f"{z}/{x}/{y}.json", tiles.version,
+                                   lambda: serialize_json(tiles.tile_json(z, x, y)))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return tile_cache.respond(entry, request)
+
+@app.route('/api/locate', methods=['GET', 'POST'])
+def locate():
+    """
+    Sitios originales y áreas ML que contienen una coordenada
+    
+    - GET ?lat=&lng=: un punto
+    - POST: lote de puntos, lista de {"lat", "lng"} o {"points": [...]}
+    """
+    try:
+        if request.method == 'GET':
+            lat, lng = parse_lat_lng(request.args.get('lat'), request.args.get('lng'))
+            matches = ml_system.locate_points([[lng, lat]])[0]
+            return jsonify({"lat": lat, "lng": lng, "matches": matches})
+        
+        payload = request.get_json(silent=True)
+        points = payload.get("points") if isinstance(payload, dict) else payload
+        if not isinstance(points, list):
+            raise ValueError("Se esperaba una lista de puntos o {\"points\": [...]}")
+        if len(points) > LOCATE_MAX_POINTS:
+            raise ValueError(f"Máximo {LOCATE_MAX_POINTS} puntos por petición")
+        coords = []
+        for i, point in enumerate(points):
+            if not isinstance(point, dict):
+                raise ValueError(f"Punto {i}: se esperaba un objeto con lat y lng")
+            try:
+                coords.append(parse_lat_lng(point.get("lat"), point.get("lng")))
+            except ValueError as e:
+                raise ValueError(f"Punto {i}: {e}") from None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    matches = ml_system.locate_points([[lng, lat] for lat, lng in coords])
+    return jsonify({"results": [{"lat": lat, "lng": lng, "matches": m} for (lat, lng), m in zip(coords, matches)]})
 
 @app.route('/api/ml-explanation')
 def get_ml_explanation():
@@ -643,28 +2141,155 @@ def get_ml_explanation():
 def add_user_point():
     try:
         point_data = request.json
-        new_point = ml_system.add_user_point(point_data)
-        return jsonify({"status": "success", "point": new_point})
+        with ml_system.writing():
+            new_point = ml_system.add_user_point(point_data, defer_clustering=True)
+        job = recluster_jobs.submit("insert")
+        return jsonify({"status": "success", "point": new_point, "job_id": job["id"]})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)})
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                    'application/json-seq', 'application/geo+json-seq')
+
+def iter_ndjson_rows(stream):
+    """Líneas no vacías de un upload NDJSON / GeoJSON Text Sequence, sin cargarlo completo"""
+    for line in stream:
+        line = line.strip().lstrip(b'\x1e')
+        if line:
+            yield line
+
+@app.route('/api/add-user-points', methods=['POST'])
+def add_user_points():
+    """
+    Ingesta masiva de puntos de usuario
+    
+    Acepta:
+    - JSON: lista de puntos, {"points": [...]} o un FeatureCollection de Points
+    - NDJSON (application/x-ndjson) o GeoJSON Text Sequence, leídos en streaming
+    """
+    try:
+        if request.mimetype in NDJSON_MIMETYPES:
+            rows = iter_ndjson_rows(request.stream)
+        else:
+            payload = request.get_json(silent=True)
+            if isinstance(payload, list):
+                rows = payload
+            elif isinstance(payload, dict) and payload.get("type") == "FeatureCollection":
+                rows = payload.get("features", [])
+            elif isinstance(payload, dict) and isinstance(payload.get("points"), list):
+                rows = payload["points"]
+            else:
+                return jsonify({"status": "error", "message": "Se esperaba una lista de puntos, un FeatureCollection o NDJSON"}), 400
+        
+        with ml_system.writing():
+            report = ml_system.add_user_points(rows, defer_clustering=True)
+        if report["accepted"]:
+            report["job_id"] = recluster_jobs.submit("insert")["id"]
+        return jsonify(report)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
 @app.route('/api/generate-ml-polygons', methods=['POST'])
 def generate_ml_polygons():
     try:
-        result = ml_system.generate_ml_polygons()
-        return jsonify(result)
+        params = request.get_json(silent=True) or {}
+        job = recluster_jobs.submit("generate", {
+            "eps": params.get("eps"),
+            "min_samples": params.get("min_samples"),
+            "metric": params.get("metric"),
+            "eps_km": params.get("eps_km")
+        }, coalesce=False)
+        return jsonify({"status": "success", "job_id": job["id"],
+                        "message": "Generación de polígonos ML en curso"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
+def sweep_max_eps(metric):
+    """SWEEP_MAX_EPS_KM en las unidades de la métrica (km o grados)"""
+    return SWEEP_MAX_EPS_KM if metric == 'haversine' else SWEEP_MAX_EPS_KM / KM_PER_DEGREE
+
+def sweep_params(source):
+    """
+    Rejilla pedida a /api/cluster-sweep: eps y min_samples (listas o valores
+    separados por comas) y metric. Lanza ValueError si no son válidos o si
+    algún eps supera sweep_max_eps
+    """
+    def values(name, cast):
+        raw = source.get(name)
+        if raw is None or raw == '':
+            return None
+        items = raw.split(',') if isinstance(raw, str) else raw if isinstance(raw, list) else [raw]
+        try:
+            return [cast(v) for v in items]
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} debe ser una lista de números") from None
+    
+    metric = source.get('metric') or None
+    if metric not in (None, 'euclidean', 'haversine'):
+        raise ValueError("metric debe ser euclidean o haversine")
+    eps_values = values('eps', float)
+    if eps_values is not None and not all(isfinite(e) and e > 0 for e in eps_values):
+        raise ValueError("eps debe ser positivo")
+    limit = sweep_max_eps(metric or ml_system.metric)
+    if eps_values is not None and max(eps_values) > limit:
+        unit = "km" if (metric or ml_system.metric) == 'haversine' else f"grados ({SWEEP_MAX_EPS_KM:g} km)"
+        raise ValueError(f"eps no puede superar {limit:g} {unit}")
+    min_samples_values = values('min_samples', int)
+    if min_samples_values is not None and not all(m >= 1 for m in min_samples_values):
+        raise ValueError("min_samples debe ser al menos 1")
+    return {"eps_values": eps_values, "min_samples_values": min_samples_values, "metric": metric}
+
+@app.route('/api/cluster-sweep', methods=['GET', 'POST'])
+def cluster_sweep():
+    """
+    Ajuste automático de eps / min_samples
+    
+    - GET ?eps=0.02,0.05&min_samples=3,5&metric=: codo de la curva k-distancia
+      y estadísticas (clusters, ruido) de cada candidato
+    - POST con el mismo contenido en JSON y "apply": true: además usa los
+      parámetros recomendados y lanza un re-clustering completo
+    """
+    source = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    try:
+        params = sweep_params(source)
+        result = ml_system.cluster_sweep(**params)
+        apply = request.method == 'POST' and source.get('apply') is True
+        if apply and result["status"] == "success" and result["recommended"]["eps"] is not None:
+            with ml_system.writing():
+                ml_system.apply_cluster_params(result["recommended"]["eps"], result["recommended"]["min_samples"],
+                                               result["metric"])
+        else:
+            apply = False
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    if apply:
+        result["applied"] = result["recommended"]
+        result["job_id"] = recluster_jobs.submit("recluster")["id"]
+    return jsonify(result)
+
 @app.route('/api/export-combined')
 def export_combined():
+    """
+    Descarga la base combinada en streaming (sin archivo temporal)
+    
+    ?precision=N redondea las coordenadas a N decimales (por defecto
+    COORD_PRECISION); ?precision=full las deja sin redondear
+    """
     try:
-        # Crear archivo temporal para descarga
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.geojson', delete=False) as f:
-            json.dump(ml_system.combined_data, f, indent=2)
-            temp_path = f.name
-        
-        return send_file(temp_path, as_attachment=True, download_name='WildflowerBlooms_Combined.geojson')
+        precision = request.args.get('precision', COORD_PRECISION)
+        precision = None if precision == 'full' else int(precision)
+        if precision is not None and not 0 <= precision <= 15:
+            raise ValueError("precision debe estar entre 0 y 15")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    try:
+        ml_system.refresh()
+        # El snapshot publicado es inmutable: se puede codificar mientras llegan escrituras
+        data = ml_system.published.combined_data
+        return Response(serialization.iter_feature_collection(data, precision), mimetype='application/geo+json',
+                        headers={'Content-Disposition': 'attachment; filename=WildflowerBlooms_Combined.geojson'})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
@@ -672,29 +2297,58 @@ def export_combined():
 def reset_database():
     """Resetea la base de datos combinada a los datos originales"""
     try:
-        # Recargar datos originales
-        with open(ml_system.primary_geojson, 'r', encoding='utf-8') as f:
-            original_data = json.load(f)
-        
-        ml_system.combined_data = original_data
-        ml_system.save_combined_data()
+        with ml_system.writing():
+            ml_system.reset_database(defer_clustering=True)
         
-        # Limpiar puntos de usuario
-        ml_system.user_points = []
-        ml_system.save_user_points()
+        # Regenerar polígonos ML en segundo plano después del reset
+        job = recluster_jobs.submit("recluster")
         
-        # Limpiar vértices ML
-        ml_system.ml_vertices = []
-        ml_system.save_ml_vertices()
-        
-        # Regenerar polígonos ML automáticamente después del reset
-        ml_system.auto_generate_ml_polygons()
-        
-        return jsonify({"status": "success", "message": "Base de datos resetada a datos originales y polígonos ML regenerados"})
+        return jsonify({"status": "success", "job_id": job["id"],
+                        "message": "Base de datos resetada a datos originales y polígonos ML regenerados"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Estado de un trabajo de re-clustering (queued, running, done, error)"""
+    job = recluster_jobs.status(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+    return jsonify(job)
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Histogramas de latencia, contadores y gauges en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/ml-version')
+def get_ml_version():
+    """Versión actual de los polígonos ML y de los datos, y trabajos pendientes"""
+    return jsonify({"ml_version": ml_system.ml_version, "data_version": ml_system.generation(),
+                    "epoch": ml_system.changes.epoch, "pending_jobs": recluster_jobs.pending()})
+
+@app.route('/api/changes')
+def get_changes():
+    """
+    Cambios desde ?since=<versión> (con el ?epoch= de la respuesta anterior):
+    features, puntos de usuario y vértices ML añadidos, modificados y
+    eliminados. Admite ?zoom= y ?format= como los endpoints de polígonos
+    
+    Sin since (o con reset=true en la respuesta) el cliente debe cargar los
+    datos completos y seguir desde la versión devuelta
+    """
+    try:
+        band, fmt = lod_query_args()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"status": "error", "message": "since debe ser un entero"}), 400
+    ml_system.refresh()
+    return jsonify(ml_system.changes_payload(since, request.args.get('epoch'), band, fmt))
+
 if __name__ == '__main__':
-    print("🚀 Inicializando Sistema ML de Wildflowers con EPS Automático...")
-    ml_system = WildflowerMLSystem()
     app.run(debug=True, port=5000)
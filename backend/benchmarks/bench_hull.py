@@ -0,0 +1,93 @@
+"""
+Benchmark de envolventes: Jarvis March (implementación anterior) vs motor NumPy
+
+Genera clusters sintéticos de floración (nube gaussiana alrededor de un sitio)
+de 10^3 a 10^6 puntos y mide el tiempo de cada algoritmo. Jarvis es O(n·h) en
+Python puro, así que por encima de --legacy-max se omite.
+
+Uso:
+    python benchmarks/bench_hull.py
+    python benchmarks/bench_hull.py --sizes 1000 10000 --repeat 5 --concave
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geometry  # noqa: E402
+
+
+def jarvis_march(coords):
+    """Gift Wrapping tal como estaba en WildflowerMLSystem.convex_hull"""
+    def cross_product(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    leftmost = min(coords, key=lambda p: p[0])
+    hull = []
+    current_point = leftmost
+    while True:
+        hull.append(current_point)
+        next_point = coords[0]
+        for point in coords:
+            if next_point == current_point or cross_product(current_point, next_point, point) > 0:
+                next_point = point
+        current_point = next_point
+        if current_point == leftmost:
+            break
+    if hull and hull[0] != hull[-1]:
+        hull.append(hull[0])
+    return hull
+
+
+def synthetic_cluster(n, seed=0):
+    """Cluster gaussiano alrededor de Chino Hills (~0.02° de dispersión)"""
+    rng = np.random.default_rng(seed)
+    return rng.normal((-117.73, 33.95), 0.02, size=(n, 2))
+
+
+def best_time(func, arg, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--legacy-max', type=int, default=10**5,
+                        help='tamaño máximo para ejecutar Jarvis March')
+    parser.add_argument('--concave', action='store_true', help='incluir la alpha shape')
+    args = parser.parse_args()
+
+    print(f"{'puntos':>10} {'jarvis (s)':>12} {'numpy (s)':>12} {'aceleración':>12} {'vértices':>9}"
+          + (f" {'cóncava (s)':>12}" if args.concave else ""))
+    for n in args.sizes:
+        coords = synthetic_cluster(n)
+
+        fast, hull = best_time(geometry.convex_hull, coords, args.repeat)
+        row = f"{n:>10} "
+        if n <= args.legacy_max:
+            legacy, legacy_hull = best_time(jarvis_march, coords.tolist(), args.repeat)
+            assert abs(abs(geometry.signed_area(legacy_hull)) - abs(geometry.signed_area(hull))) < 1e-9
+            row += f"{legacy:>12.4f} {fast:>12.4f} {legacy / fast:>11.1f}x "
+        else:
+            row += f"{'-':>12} {fast:>12.4f} {'-':>12} "
+        row += f"{len(hull) - 1:>9}"
+
+        if args.concave:
+            concave, _ = best_time(lambda c: geometry.concave_hull(c, 0.01), coords, args.repeat)
+            row += f" {concave:>12.4f}"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark de serialización: json.dump(indent=2) (ruta anterior) vs serialization
+
+Genera FeatureCollections sintéticos de polígonos de floración con
+coordenadas de precisión completa y compara, para cada ruta, el tiempo de
+codificación y los bytes producidos:
+
+- legacy:    json.dump(indent=2) a un archivo temporal (export anterior)
+- compacto:  serialization.dumps (orjson si está instalado, si no json compacto)
+- cuantizado: igual, con coordenadas redondeadas a --precision decimales
+- streaming: serialization.iter_feature_collection (export actual)
+
+Uso:
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --features 100 10000 --vertices 64
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+
+
+def synthetic_collection(n_features, n_vertices, seed=0):
+    """Polígonos circulares irregulares alrededor del sur de California"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform((-120.0, 32.5), (-114.0, 36.0), size=(n_features, 2))
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    features = []
+    for i, center in enumerate(centers):
+        radius = rng.uniform(0.005, 0.05) * (1 + 0.2 * rng.standard_normal(n_vertices))
+        ring = np.column_stack((center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)))
+        ring = np.vstack((ring, ring[:1])).tolist()
+        features.append({
+            "type": "Feature",
+            "properties": {"Site": f"Sitio {i}", "Type": "Wild", "Season": "Spring",
+                           "Area": float(rng.uniform(1e4, 1e7))},
+            "geometry": {"type": "Polygon", "coordinates": [ring]}
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def legacy_export(data):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.geojson', delete=False) as f:
+        json.dump(data, f, indent=2)
+        path = f.name
+    size = os.path.getsize(path)
+    os.unlink(path)
+    return size
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--features', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--vertices', type=int, default=32)
+    parser.add_argument('--precision', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    encoder = "orjson" if serialization.orjson is not None else "json (stdlib)"
+    print(f"Codificador rápido: {encoder}; precisión {args.precision} decimales\n")
+    print(f"{'features':>9} {'ruta':>11} {'tiempo (s)':>11} {'MB':>9} {'vs legacy':>10}")
+
+    for n in args.features:
+        data = synthetic_collection(n, args.vertices)
+        legacy_time, legacy_size = best_time(lambda: legacy_export(data), args.repeat)
+        rows = [
+            ("legacy", legacy_time, legacy_size),
+            ("compacto", *best_time(lambda: len(serialization.dumps(data)), args.repeat)),
+            ("cuantizado", *best_time(
+                lambda: len(serialization.dumps(serialization.quantize_features(data, args.precision))),
+                args.repeat)),
+            ("streaming", *best_time(
+                lambda: sum(len(chunk) for chunk in serialization.iter_feature_collection(data, args.precision)),
+                args.repeat)),
+        ]
+
+        # El export en streaming debe ser JSON válido e igual al cuantizado
+        streamed = b''.join(serialization.iter_feature_collection(data, args.precision))
+        assert json.loads(streamed) == json.loads(serialization.dumps(
+            serialization.quantize_features(data, args.precision)))
+
+        for name, elapsed, size in rows:
+            print(f"{n:>9} {name:>11} {elapsed:>11.4f} {size / 1e6:>9.2f} {legacy_time / elapsed:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
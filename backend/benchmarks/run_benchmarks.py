@@ -0,0 +1,372 @@
+"""
+Suite de benchmarks y perfilado del pipeline de clustering
+
+Para cada tamaño genera un conjunto sintético de floraciones (polígonos de
+sitios + puntos de usuario alrededor de ellos, con densidad constante), lo
+escribe en un directorio temporal y mide cada etapa del pipeline sobre un
+WildflowerMLSystem real:
+
+    boot_cold → extract → cluster → hulls → areas → save → boot_snapshot
+    → incremental_insert
+
+Por etapa se registra el tiempo (s) y, con tracemalloc en una segunda
+ejecución, el pico de memoria y el número de bloques asignados que quedan
+vivos. Después se lanza una prueba de carga de la API con el cliente de
+pruebas de Flask (varios hilos, latencias p50/p95/p99 y peticiones/s).
+
+Los resultados se guardan en JSON; con --compare se contrastan contra un
+resultado anterior y el script termina con código 1 si alguna etapa es más
+lenta que la tolerancia.
+
+Uso:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1000 100000 --output base.json
+    python benchmarks/run_benchmarks.py --compare base.json --tolerance 0.3
+    python benchmarks/run_benchmarks.py --sizes 10000000 --no-memory --no-api   # ~20 GB de RAM
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Solo avisos y errores: los logs de cada etapa falsearían los tiempos
+os.environ.setdefault('EARTHBLOOM_LOG_LEVEL', 'WARNING')
+
+import app as earthbloom  # noqa: E402
+import geometry  # noqa: E402
+import serialization  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Composición del conjunto sintético
+VERTICES_PER_SITE = 50
+USER_SHARE = 0.2
+POINTS_PER_SITE = 100
+SITE_SPREAD = 0.1
+
+API_ENDPOINTS = (
+    '/api/combined-data',
+    '/api/ml-polygons',
+    '/api/original-polygons',
+    '/api/user-points',
+    '/api/heatmap-data',
+    '/api/user-points?bbox=-120,33,-115,36',
+    '/api/heatmap/6/11/25.png',
+)
+
+
+def synthetic_dataset(n, seed=0):
+    """
+    FeatureCollection de sitios y lista de puntos de usuario con n puntos en
+    total. El número de sitios crece con n para que la densidad (y por tanto
+    el tamaño de las vecindades ε) sea constante entre tamaños
+    """
+    rng = np.random.default_rng(seed)
+    n_users = int(n * USER_SHARE)
+    n_features = max(1, (n - n_users) // VERTICES_PER_SITE)
+    n_sites = max(1, n // POINTS_PER_SITE)
+
+    sites = rng.uniform((-124.0, 26.0), (-66.0, 49.0), size=(n_sites, 2))
+    angles = np.linspace(0, 2 * np.pi, VERTICES_PER_SITE - 1, endpoint=False)
+
+    features = []
+    centers = sites[rng.integers(0, n_sites, n_features)] + rng.normal(0, SITE_SPREAD, (n_features, 2))
+    radii = rng.uniform(0.01, SITE_SPREAD, n_features)
+    for i, (center, radius) in enumerate(zip(centers, radii)):
+        ring = center + radius * np.column_stack((np.cos(angles), np.sin(angles)))
+        ring = np.vstack((ring, ring[:1])).round(6).tolist()
+        features.append({
+            "type": "Feature",
+            "properties": {"Site": f"Sitio sintético {i}", "Type": "Wild", "Season": "Spring"},
+            "geometry": {"type": "Polygon", "coordinates": [ring]}
+        })
+
+    user_coords = sites[rng.integers(0, n_sites, n_users)] + rng.normal(0, SITE_SPREAD, (n_users, 2))
+    user_points = [{
+        "id": f"user_point_bench_{i}",
+        "name": "Punto sintético",
+        "type": "Wild",
+        "season": "Spring",
+        "area": 1000,
+        "lat": lat,
+        "lng": lng,
+        "timestamp": "2025-01-01T00:00:00"
+    } for i, (lng, lat) in enumerate(user_coords.round(6).tolist())]
+
+    return {"type": "FeatureCollection", "features": features}, user_points
+
+
+def write_dataset(directory, collection, user_points):
+    with open(os.path.join(directory, 'WildflowerBlooms_AreaOfInterest.geojson'), 'wb') as f:
+        f.write(serialization.dumps(collection))
+    with open(os.path.join(directory, 'user_points.json'), 'wb') as f:
+        f.write(serialization.dumps(user_points))
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silencia los mensajes del sistema durante las mediciones"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(func, memory=True, repeatable=True):
+    """
+    Ejecuta func y devuelve (resultado, métricas)
+
+    El tiempo se mide sin tracemalloc; si memory y la etapa es repetible, se
+    ejecuta otra vez con tracemalloc para el pico de memoria y los bloques
+    """
+    with quiet():
+        start = time.perf_counter()
+        result = func()
+        metrics = {"seconds": time.perf_counter() - start}
+
+        if memory and repeatable:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            stats = after.compare_to(before, 'filename')
+            metrics["peak_bytes"] = peak
+            metrics["allocated_blocks"] = sum(max(s.count_diff, 0) for s in stats)
+    return result, metrics
+
+
+def run_pipeline(n, memory, insert_batch):
+    """Etapas del pipeline sobre un conjunto de n puntos"""
+    directory = tempfile.mkdtemp(prefix='earthbloom-bench-')
+    stages = {}
+    try:
+        collection, user_points = synthetic_dataset(n)
+        write_dataset(directory, collection, user_points)
+        del collection, user_points
+
+        system, stages["boot_cold"] = measure(lambda: earthbloom.WildflowerMLSystem(data_dir=directory),
+                                              memory, repeatable=False)
+
+        store, stages["extract"] = measure(system.extract_points_from_combined_data, memory)
+        coords = store.coords
+
+        def cluster():
+            system.neighbor_graph.clear()
+            return system.cluster_points(coords)
+
+        clusters, stages["cluster"] = measure(cluster, memory)
+        hulls, stages["hulls"] = measure(lambda: [h for h in (system.cluster_hull(coords[c]) for c in clusters) if h],
+                                         memory)
+        _, stages["areas"] = measure(lambda: geometry.polygon_stats([[h] for h in hulls]), memory)
+
+        def save():
+            system.save_combined_data()
+            system.save_ml_vertices()
+            system.save_user_points()
+
+        _, stages["save"] = measure(save, memory)
+
+        with quiet():
+            system.checkpoint()
+            system.close()
+        restored, stages["boot_snapshot"] = measure(lambda: earthbloom.WildflowerMLSystem(data_dir=directory),
+                                                    memory, repeatable=False)
+
+        rng = np.random.default_rng(1)
+        batch = [{"lat": float(lat), "lng": float(lng)}
+                 for lng, lat in coords[rng.integers(0, len(coords), insert_batch)] + rng.normal(0, 0.01, (insert_batch, 2))]
+        def insert():
+            with restored.writing():
+                return restored.add_user_points(batch)
+
+        _, stages["incremental_insert"] = measure(insert, memory, repeatable=False)
+        stages["incremental_insert"]["points_per_second"] = insert_batch / stages["incremental_insert"]["seconds"]
+
+        summary = {
+            "n_points": int(len(coords)),
+            "n_clusters": len(clusters),
+            "n_polygons": len(hulls),
+            "stages": stages
+        }
+        return summary, restored, directory
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_api_load(system, requests_per_thread, threads):
+    """Prueba de carga con el cliente de Flask: lecturas, 304 e inserciones"""
+    earthbloom.ml_system._instance = system
+    earthbloom.response_cache.clear()
+    earthbloom.tile_cache.clear()
+
+    def worker(paths, latencies, statuses, headers=None):
+        client = earthbloom.app.test_client()
+        for i in range(requests_per_thread):
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            response = client.get(path, headers=headers(path) if headers else None)
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    def load(paths, headers=None):
+        latencies, statuses = [], []
+        pool = [threading.Thread(target=worker, args=(paths, latencies, statuses, headers)) for _ in range(threads)]
+        start = time.perf_counter()
+        with quiet():
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+        elapsed = time.perf_counter() - start
+        return {
+            "requests": len(latencies),
+            "requests_per_second": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1e3,
+            "p95_ms": percentile(latencies, 95) * 1e3,
+            "p99_ms": percentile(latencies, 99) * 1e3,
+            "errors": sum(1 for s in statuses if s >= 400)
+        }
+
+    results = {"reads": load(API_ENDPOINTS)}
+
+    client = earthbloom.app.test_client()
+    with quiet():
+        etags = {path: client.get(path).headers.get('ETag') for path in API_ENDPOINTS}
+    results["conditional_reads"] = load(API_ENDPOINTS, headers=lambda path: {'If-None-Match': etags[path] or ''})
+
+    latencies = []
+    with quiet():
+        start = time.perf_counter()
+        for i in range(requests_per_thread):
+            t0 = time.perf_counter()
+            client.post('/api/add-user-point', json={"lat": 35.0 + i * 1e-4, "lng": -118.0})
+            latencies.append(time.perf_counter() - t0)
+        earthbloom.recluster_jobs.wait_idle(timeout=600)
+        elapsed = time.perf_counter() - start
+    results["writes"] = {
+        "requests": len(latencies),
+        "requests_per_second_including_reclustering": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3
+    }
+    return results
+
+
+def environment():
+    import scipy
+    import sklearn
+    from importlib.metadata import version
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit-learn": sklearn.__version__,
+        "flask": version("flask"),
+        "fast_json": serialization.orjson is not None
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Lista de regresiones de tiempo respecto a un resultado anterior"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {run["n_points_requested"]: run for run in baseline.get("runs", [])}
+
+    regressions = []
+    for run in results["runs"]:
+        base = previous.get(run["n_points_requested"])
+        if not base:
+            continue
+        for stage, metrics in run["stages"].items():
+            old = base["stages"].get(stage, {}).get("seconds")
+            new = metrics["seconds"]
+            # Por debajo de 10 ms el ruido domina
+            if old and old > 0.01 and new > old * (1 + tolerance):
+                regressions.append(f"n={run['n_points_requested']} {stage}: {old:.4f}s → {new:.4f}s "
+                                   f"(+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument('--insert-batch', type=int, default=1000, help='puntos de la etapa incremental_insert')
+    parser.add_argument('--no-memory', action='store_true', help='no medir memoria (tracemalloc)')
+    parser.add_argument('--no-api', action='store_true', help='omitir la prueba de carga de la API')
+    parser.add_argument('--api-max', type=int, default=10**5, help='tamaño máximo para la prueba de carga')
+    parser.add_argument('--api-requests', type=int, default=200, help='peticiones por hilo')
+    parser.add_argument('--api-threads', type=int, default=4)
+    parser.add_argument('--output', help='archivo JSON de resultados (por defecto benchmarks/results/)')
+    parser.add_argument('--compare', help='resultado anterior para detectar regresiones')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='margen de regresión (0.25 = +25%%)')
+    args = parser.parse_args()
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "environment": environment(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "runs": []
+    }
+
+    for n in args.sizes:
+        print(f"\n📊 {n:,} puntos")
+        summary, system, directory = run_pipeline(n, not args.no_memory, args.insert_batch)
+        summary["n_points_requested"] = n
+        try:
+            for stage, metrics in summary["stages"].items():
+                line = f"   {stage:<20} {metrics['seconds']:>9.4f} s"
+                if "peak_bytes" in metrics:
+                    line += f"   pico {metrics['peak_bytes'] / 1e6:>9.1f} MB   bloques {metrics['allocated_blocks']:>10,}"
+                print(line)
+            print(f"   {summary['n_clusters']} clusters, {summary['n_polygons']} polígonos")
+
+            if not args.no_api and n <= args.api_max:
+                summary["api"] = run_api_load(system, args.api_requests, args.api_threads)
+                for name, metrics in summary["api"].items():
+                    rps = metrics.get("requests_per_second") or metrics.get("requests_per_second_including_reclustering")
+                    print(f"   api {name:<16} {rps:>9.1f} req/s   p50 {metrics['p50_ms']:.2f} ms   "
+                          f"p95 {metrics['p95_ms']:.2f} ms")
+        finally:
+            with quiet():
+                system.close()
+            shutil.rmtree(directory, ignore_errors=True)
+        results["runs"].append(summary)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Resultados guardados en {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print("❌ Regresiones detectadas:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ Sin regresiones respecto a", args.compare)
+
+
+if __name__ == '__main__':
+    main()
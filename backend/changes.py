@@ -0,0 +1,168 @@
+"""
+Feed de cambios: qué features, puntos y vértices cambiaron desde una versión
+
+Cada publicación (publish_data) registra en ChangeLog la diferencia con la
+anterior, por capa:
+
+- features: los features de la base combinada, por properties.id (o
+  feature_<posición> si no tienen)
+- user_points: los puntos de usuario, por id
+- ml_vertices: los vértices ML agrupados por polygon_id
+
+Una clave repetida se desambigua con su posición (clave#posición).
+
+Los escritores no modifican en el sitio lo publicado (copy-on-write), así que
+un feature o un punto sin cambios es el mismo objeto: la comparación es por
+identidad y solo se recorren las capas cuyo contenedor cambió. Los puntos de
+usuario se añaden al final o se sustituyen en su posición (un reporte
+duplicado fusionado en un punto existente, ver dedup), o se vacían en un
+reset: si la lista no se acortó solo se reindexan las posiciones sustituidas
+y la cola. Los grupos de
+vértices se comparan por valor, porque se extraen de nuevo en cada
+publicación.
+
+Cada entrada del historial guarda, por clave cambiada, si existía antes del
+cambio. changes(since) encadena las entradas desde since y resuelve cada
+clave contra el estado actual: añadida (no existía en since y existe),
+modificada (existía y existe) o eliminada (existía y ya no). Un since fuera
+del historial devuelve None y el cliente debe recargarlo todo. El epoch
+distingue las secuencias de versiones de distintos procesos y arranques: una
+versión de otro epoch nunca se interpreta en este.
+"""
+import itertools
+import operator
+import os
+import threading
+from collections import deque
+
+
+def _keyed(items, key, start=0, into=None):
+    into = {} if into is None else into
+    for position, item in enumerate(items, start):
+        k = key(item, position)
+        if k in into:
+            k = f"{k}#{position}"
+        into[k] = item
+    return into
+
+
+def feature_key(feature, position):
+    feature_id = (feature.get("properties") or {}).get("id")
+    return str(feature_id) if feature_id is not None else f"feature_{position}"
+
+
+def point_key(point, position):
+    point_id = point.get("id")
+    return str(point_id) if point_id is not None else f"point_{position}"
+
+
+def index_features(collection, previous=None, previous_source=None):
+    return _keyed(collection.get("features", []), feature_key)
+
+
+def index_points(points, previous=None, previous_source=None):
+    if previous is None or previous_source is None or len(points) < len(previous_source):
+        return _keyed(points, point_key)
+    # Sobre una copia del índice anterior: sustituir las posiciones cambiadas
+    # (con la misma clave) e indexar la cola
+    index = dict(previous)
+    n = len(previous_source)
+    for position in itertools.compress(range(n), map(operator.is_not, points, previous_source)):
+        old, new = previous_source[position], points[position]
+        k = point_key(old, position)
+        if index.get(k) is not old:
+            k = f"{k}#{position}"
+        if index.get(k) is not old or point_key(new, position) != point_key(old, position):
+            return _keyed(points, point_key)
+        index[k] = new
+    return _keyed(points[n:], point_key, n, index)
+
+
+def index_vertices(vertices, previous=None, previous_source=None):
+    groups = {}
+    for vertex in vertices:
+        groups.setdefault(str(vertex.get("polygon_id")), []).append(vertex)
+    return groups
+
+
+# Capa -> (función de índice, comparación de un elemento sin cambios)
+LAYERS = {
+    "features": (index_features, operator.is_),
+    "user_points": (index_points, operator.is_),
+    "ml_vertices": (index_vertices, operator.eq),
+}
+
+
+class ChangeLog:
+    """Historial de las claves cambiadas en las últimas `history` publicaciones"""
+
+    def __init__(self, history=256):
+        self.epoch = os.urandom(4).hex()
+        self.entries = deque(maxlen=history)   # (versión anterior, versión, {capa: {clave: existía}})
+        self.version = None
+        self.sources = {}                      # capa -> contenedor publicado
+        self.state = {}                        # capa -> {clave: elemento}
+        self._lock = threading.Lock()
+
+    def record(self, version, sources):
+        """
+        Registra la publicación de version. sources es {capa: contenedor}
+        (la colección de features, la tupla de puntos, la lista de vértices)
+        """
+        with self._lock:
+            changes = {}
+            for layer, source in sources.items():
+                previous_source = self.sources.get(layer)
+                if source is previous_source:
+                    continue
+                index, same = LAYERS[layer]
+                before = self.state.get(layer, {})
+                after = index(source, self.state.get(layer), previous_source)
+                changed = {k: True for k, item in before.items() if k not in after or not same(item, after[k])}
+                changed.update((k, False) for k in after if k not in before)
+                if changed:
+                    changes[layer] = changed
+                self.state[layer] = after
+                self.sources[layer] = source
+            if self.version is not None:
+                self.entries.append((self.version, version, changes))
+            self.version = version
+
+    def changes(self, since, epoch):
+        """
+        (versión actual, {capa: {"added": [(clave, elemento)], "modified": [...],
+        "removed": [clave]}}) desde la versión since de este epoch. La parte de
+        cambios es None si since no está en el historial o si epoch no es el
+        de este registro (también si falta: since de otro proceso o de antes
+        de un reinicio no es comparable)
+        """
+        with self._lock:
+            if epoch != self.epoch:
+                return self.version, None
+            entries = list(self.entries)
+            if since == self.version:
+                start = len(entries)
+            else:
+                start = next((i for i, entry in enumerate(entries) if entry[0] == since), None)
+                if start is None:
+                    return self.version, None
+
+            # Por clave, si existía en since: lo dice la primera entrada que la cambió
+            merged = {}
+            for _, _, changes in entries[start:]:
+                for layer, changed in changes.items():
+                    layer_changes = merged.setdefault(layer, {})
+                    for k, existed in changed.items():
+                        layer_changes.setdefault(k, existed)
+
+            result = {}
+            for layer in LAYERS:
+                state = self.state.get(layer, {})
+                added, modified, removed = [], [], []
+                for k, existed in merged.get(layer, {}).items():
+                    if k in state:
+                        (modified if existed else added).append((k, state[k]))
+                    elif existed:
+                        removed.append(k)
+                result[layer] = {"added": added, "modified": modified, "removed": removed}
+            return self.version, result
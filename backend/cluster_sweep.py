@@ -0,0 +1,157 @@
+"""
+Ajuste automático de los parámetros de DBSCAN (eps, min_samples)
+
+- KDistanceCache: distancias de cada punto a sus k vecinos más cercanos
+  (NearestNeighbors), calculadas una sola vez para el k máximo pedido. La
+  columna m - 1 es la curva k-distancia de min_samples = m (el propio punto
+  cuenta como vecino, igual que en DBSCAN)
+- knee: eps en el "codo" de la curva k-distancia ordenada: el punto más
+  alejado de la recta entre sus extremos una vez normalizada (Kneedle)
+- sweep: evalúa una rejilla de candidatos (eps, min_samples) sobre un único
+  grafo de vecinos calculado con el eps máximo. Cada candidato solo filtra
+  las aristas del grafo (distancia <= eps), marca los puntos núcleo por su
+  grado (la suma de los pesos de sus vecinos si los puntos tienen peso) y
+  etiqueta los clusters con connected_components entre núcleos; los
+  puntos frontera toman la etiqueta de su primer vecino núcleo. El número de
+  clusters y de puntos de ruido es exactamente el de DBSCAN
+
+Los candidatos se evalúan en paralelo en un pool de hilos (las operaciones de
+NumPy y SciPy sobre el grafo compartido sueltan el GIL).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from spatial_index import EARTH_RADIUS_KM
+
+# Factores aplicados al eps del codo en la rejilla por defecto
+DEFAULT_EPS_FACTORS = (0.5, 0.75, 1.0, 1.25, 1.5, 2.0)
+
+# Percentil de la curva k-distancia usado como extremo superior del codo:
+# unos pocos puntos aislados no deben aplanar el resto de la curva
+KNEE_PERCENTILE = 99.0
+
+
+class KDistanceCache:
+    """Distancias a los k vecinos más cercanos, reutilizadas mientras no cambien los puntos"""
+
+    def __init__(self):
+        self.metric = None
+        self.points = None
+        self.distances = None
+
+    def get(self, lnglat, k, metric='euclidean'):
+        """
+        Array (n, k): distancia de cada punto a su j-ésimo vecino más cercano
+        (j = 1..k, el primero es el propio punto), en grados con métrica
+        'euclidean' y en km con 'haversine'
+        """
+        lnglat = np.asarray(lnglat, dtype=np.float64).reshape(-1, 2)
+        k = min(k, len(lnglat))
+        reusable = (self.distances is not None and metric == self.metric
+                    and self.distances.shape[1] >= k and np.array_equal(lnglat, self.points))
+        if not reusable:
+            # Importación diferida: scikit-learn solo se carga al primer uso
+            from sklearn.neighbors import NearestNeighbors
+
+            if metric == 'haversine':
+                nn = NearestNeighbors(n_neighbors=k, algorithm='ball_tree', metric='haversine')
+                points = np.radians(lnglat[:, ::-1])
+            elif metric == 'euclidean':
+                nn = NearestNeighbors(n_neighbors=k)
+                points = lnglat
+            else:
+                raise ValueError(f"Métrica no soportada: {metric}")
+            distances, _ = nn.fit(points).kneighbors(points)
+            if metric == 'haversine':
+                distances = distances * EARTH_RADIUS_KM
+            self.metric, self.points, self.distances = metric, lnglat.copy(), distances
+        return self.distances[:, :k]
+
+    def clear(self):
+        self.metric = None
+        self.points = None
+        self.distances = None
+
+
+def knee(distances):
+    """
+    eps en el codo de una curva k-distancia (distancias al k-ésimo vecino)
+
+    La curva se ordena de menor a mayor, se recorta en KNEE_PERCENTILE y se
+    normaliza a [0, 1] en ambos ejes; el codo es el punto más alejado por
+    debajo de la diagonal. Devuelve None si la curva es plana
+    """
+    curve = np.sort(np.asarray(distances, dtype=np.float64))
+    if len(curve) < 3:
+        return None
+    curve = curve[:max(3, int(np.ceil(len(curve) * KNEE_PERCENTILE / 100)))]
+    span = curve[-1] - curve[0]
+    if span <= 0:
+        return None
+    x = np.linspace(0.0, 1.0, len(curve))
+    y = (curve - curve[0]) / span
+    return float(curve[int(np.argmax(x - y))])
+
+
+def _labels(rows, cols, within, n, min_samples, weights=None):
+    """Etiquetas DBSCAN (-1 = ruido) a partir de las aristas del grafo dentro de eps"""
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    edge_weights = None if weights is None else weights[cols[within]]
+    core = np.bincount(rows[within], weights=edge_weights, minlength=n) >= min_samples
+    labels = np.full(n, -1, dtype=np.int64)
+    if not core.any():
+        return labels
+
+    # Componentes conexas del subgrafo de puntos núcleo
+    edges = within & core[rows] & core[cols]
+    graph = sparse.csr_matrix((np.ones(np.count_nonzero(edges), dtype=np.int8), (rows[edges], cols[edges])),
+                              shape=(n, n))
+    _, component = connected_components(graph, directed=False)
+    _, labels[core] = np.unique(component[core], return_inverse=True)
+
+    # Frontera: puntos no núcleo con algún núcleo a distancia <= eps
+    border = within & ~core[rows] & core[cols]
+    points, first = np.unique(rows[border], return_index=True)
+    labels[points] = labels[cols[border][first]]
+    return labels
+
+
+def _evaluate(rows, cols, data, n, eps, min_samples_values, weights=None):
+    within = data <= eps
+    results = []
+    for min_samples in min_samples_values:
+        labels = _labels(rows, cols, within, n, min_samples, weights)
+        sizes = np.bincount(labels[labels >= 0]) if (labels >= 0).any() else np.empty(0, dtype=np.int64)
+        n_noise = int((labels == -1).sum())
+        results.append({
+            "eps": eps,
+            "min_samples": min_samples,
+            "clusters": len(sizes),
+            "noise_points": n_noise,
+            "noise_ratio": n_noise / n if n else 0.0,
+            "largest_cluster": int(sizes.max()) if len(sizes) else 0,
+            "mean_cluster_size": float(sizes.mean()) if len(sizes) else 0.0
+        })
+    return results
+
+
+def sweep(graph, eps_values, min_samples_values, workers=None, weights=None):
+    """
+    Estadísticas de DBSCAN para cada combinación (eps, min_samples)
+
+    graph es el grafo CSR de vecinos con radio >= max(eps_values) (distancias
+    explícitas, incluido cada punto consigo mismo) y weights el peso de cada
+    punto (sample_weight de DBSCAN; 1 si se omite). Devuelve una lista en el
+    orden de la rejilla: eps exterior, min_samples interior
+    """
+    graph = graph.tocsr()
+    n = graph.shape[0]
+    rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+    cols, data = graph.indices, graph.data
+    with ThreadPoolExecutor(workers, thread_name_prefix='sweep-worker') as executor:
+        per_eps = executor.map(lambda eps: _evaluate(rows, cols, data, n, eps, min_samples_values, weights),
+                               eps_values)
+        return [result for results in per_eps for result in results]
@@ -0,0 +1,122 @@
+"""
+Deduplicación de los puntos de usuario en la ingesta
+
+Varios reportes del mismo prado inflan la entrada de DBSCAN y los conteos de
+los clusters. Antes de registrar un punto nuevo:
+
+1. Sus coordenadas se redondean a `decimals` decimales (5 ≈ 1 m)
+2. Un hash espacial (rejilla de celda radius_m, continua en el antimeridiano)
+   busca los puntos ya registrados a menos de radius_m metros (haversine)
+   con la misma temporada y tipo, cuyo último reporte está a menos de
+   window_s segundos (las horas con zona se comparan en UTC)
+3. Si hay alguno, el más cercano absorbe el reporte: conserva su posición,
+   su id y su timestamp, su peso (`weight`, número de reportes) aumenta y
+   `last_seen` pasa a ser el timestamp del reporte nuevo. DBSCAN recibe el
+   peso como sample_weight en lugar de filas repetidas
+4. Si no, el punto se registra con un id libre: user_point_<fecha>, con
+   sufijo _2, _3, ... si ese id ya existe
+
+radius_m = 0 desactiva la fusión (solo se redondea y se asignan ids) y
+window_s = 0 quita el límite de tiempo.
+"""
+import math
+from collections import defaultdict
+from itertools import count
+
+from partitions import parse_time
+from spatial_index import haversine_km
+
+# Metros por grado de latitud
+METERS_PER_DEGREE = 111320.0
+
+
+def point_weight(point):
+    """Número de reportes que representa un punto de usuario"""
+    return int(point.get("weight", 1))
+
+
+class PointDeduplicator:
+    """Hash espacial e ids de los puntos de usuario registrados"""
+
+    def __init__(self, radius_m=25.0, window_s=86400.0, decimals=5):
+        self.radius_m = radius_m
+        self.window_s = window_s
+        self.decimals = decimals
+        self.cell = radius_m / METERS_PER_DEGREE if radius_m > 0 else None
+        # Columnas que dan la vuelta al mundo: la longitud se toma módulo
+        # este número para que 179.9 y -179.9 sean celdas vecinas
+        self.columns = round(360 / self.cell) if self.cell is not None else None
+        self.reset([])
+
+    def reset(self, points):
+        """Indexa la lista de puntos de usuario (posición en la lista = entrada del índice)"""
+        self.points = points
+        self.ids = set()
+        self._cells = defaultdict(list)
+        self._columns = defaultdict(set)   # fila de la rejilla -> columnas ocupadas
+        for position, point in enumerate(points):
+            self.add(position, point)
+
+    def snap(self, lng, lat):
+        return round(lng, self.decimals), round(lat, self.decimals)
+
+    def unique_id(self, base):
+        """base si está libre; si no, base_2, base_3, ..."""
+        if base not in self.ids:
+            return base
+        return next(f"{base}_{n}" for n in count(2) if f"{base}_{n}" not in self.ids)
+
+    def add(self, position, point):
+        """Registra el punto de la posición position de la lista"""
+        self.ids.add(point.get("id"))
+        if self.cell is not None and point.get("lng") is not None and point.get("lat") is not None:
+            col, row = self._cell(point["lng"], point["lat"])
+            self._cells[col, row].append(position)
+            self._columns[row].add(col)
+
+    def match(self, point):
+        """Posición del punto registrado que debe absorber point, o None"""
+        if self.cell is None:
+            return None
+        lng, lat = point["lng"], point["lat"]
+        col, row = self._cell(lng, lat)
+        # Una celda abarca menos metros de longitud cuanto más lejos del ecuador:
+        # cerca de los polos la ventana de columnas crece sin límite, así que
+        # se recorren las columnas ocupadas de la fila si son menos
+        shrink = math.cos(math.radians(min(90.0, abs(lat) + self.cell)))
+        reach = math.ceil(1 / shrink) if shrink > 1e-9 else math.inf
+
+        best, best_km = None, self.radius_m / 1000
+        for r in (row - 1, row, row + 1):
+            occupied = self._columns.get(r, ())
+            if 2 * reach + 1 > len(occupied):
+                columns = [c for c in occupied if min((c - col) % self.columns, (col - c) % self.columns) <= reach]
+            else:
+                columns = [c % self.columns for c in range(col - reach, col + reach + 1)]
+            for c in columns:
+                for position in self._cells.get((c, r), ()):
+                    candidate = self.points[position]
+                    distance = haversine_km(lng, lat, candidate["lng"], candidate["lat"])
+                    if distance <= best_km and self._same_report(candidate, point):
+                        best, best_km = position, distance
+        return best
+
+    def merge(self, existing, point):
+        """Punto nuevo (copy-on-write) con el reporte point sumado a existing"""
+        return dict(existing, weight=point_weight(existing) + point_weight(point),
+                    last_seen=point.get("timestamp"))
+
+    def _cell(self, lng, lat):
+        return math.floor(lng / self.cell) % self.columns, math.floor(lat / self.cell)
+
+    def _same_report(self, existing, point):
+        for key in ("season", "type"):
+            if str(existing.get(key, "")).casefold() != str(point.get(key, "")).casefold():
+                return False
+        if not self.window_s:
+            return True
+        try:
+            last = parse_time(existing.get("last_seen") or existing["timestamp"])
+            return abs((parse_time(point["timestamp"]) - last).total_seconds()) <= self.window_s
+        except (KeyError, TypeError, ValueError):
+            return False
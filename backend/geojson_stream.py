@@ -0,0 +1,220 @@
+"""
+Lectura incremental (en streaming) de FeatureCollections GeoJSON grandes
+
+json.load necesita el texto completo del archivo y el árbol de objetos a la
+vez, así que el pico de memoria es varias veces el tamaño del archivo y nada
+está disponible hasta que termina. Aquí el archivo se lee por bloques y cada
+feature se decodifica en cuanto está completo (json.JSONDecoder.raw_decode
+sobre un buffer que se va compactando): la memoria extra es del orden de un
+bloque más el feature más grande, y el llamador puede indexar cada feature
+mientras llegan los siguientes.
+
+- FeatureFilter: conserva solo los features que cortan una caja
+  [min_lng, min_lat, max_lng, max_lat] y/o con ciertos Season / Type
+- iter_features: generador de features (filtrados) con progreso por bloque
+- load_feature_collection: FeatureCollection completo (miembros de primer
+  nivel como name o crs incluidos) con un callback por feature aceptado
+"""
+import codecs
+import json
+import os
+import re
+
+from spatial_index import geometry_bbox
+
+# Bytes leídos del archivo en cada bloque
+CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+class FeatureFilter:
+    """Filtro de features por caja envolvente y por propiedades Season / Type"""
+
+    def __init__(self, bbox=None, seasons=None, types=None):
+        if bbox is not None:
+            bbox = [float(v) for v in bbox]
+            if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                raise ValueError("bbox debe tener el formato min_lng,min_lat,max_lng,max_lat")
+        self.bbox = bbox
+        # Comparación sin distinguir mayúsculas ("spring" == "Spring")
+        self.seasons = {str(s).strip().casefold() for s in seasons} if seasons else None
+        self.types = {str(t).strip().casefold() for t in types} if types else None
+
+    @classmethod
+    def parse(cls, bbox=None, seasons=None, types=None):
+        """Filtro desde cadenas separadas por comas (variables de entorno, query string)"""
+        return cls(
+            bbox=bbox.split(',') if bbox else None,
+            seasons=[s for s in seasons.split(',') if s.strip()] if seasons else None,
+            types=[t for t in types.split(',') if t.strip()] if types else None
+        )
+
+    def __bool__(self):
+        return self.bbox is not None or self.seasons is not None or self.types is not None
+
+    def __call__(self, feature):
+        properties = feature.get("properties") or {}
+        if self.seasons is not None and str(properties.get("Season", "")).casefold() not in self.seasons:
+            return False
+        if self.types is not None and str(properties.get("Type", "")).casefold() not in self.types:
+            return False
+        if self.bbox is not None:
+            box = geometry_bbox(feature.get("geometry") or {})
+            if box is None:
+                return False
+            min_lng, min_lat, max_lng, max_lat = self.bbox
+            if box[0] > max_lng or box[2] < min_lng or box[1] > max_lat or box[3] < min_lat:
+                return False
+        return True
+
+    def describe(self):
+        parts = []
+        if self.bbox is not None:
+            parts.append(f"bbox={','.join(str(v) for v in self.bbox)}")
+        if self.seasons is not None:
+            parts.append(f"Season∈{sorted(self.seasons)}")
+        if self.types is not None:
+            parts.append(f"Type∈{sorted(self.types)}")
+        return ' '.join(parts) or 'sin filtro'
+
+
+class _Reader:
+    """Buffer de texto sobre un archivo binario, rellenado bajo demanda"""
+
+    def __init__(self, stream, total_bytes, chunk_size, progress):
+        self.stream = stream
+        self.total_bytes = total_bytes
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self.features = 0
+
+    def fill(self):
+        """Lee otro bloque; al menos tantos bytes como los pendientes (crecimiento geométrico)"""
+        if self.eof:
+            return False
+        data = self.stream.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.bytes_read += len(data)
+        self.eof = not data
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += self.decoder.decode(data, final=self.eof)
+        if self.progress is not None:
+            self.progress(self.bytes_read, self.total_bytes, self.features)
+        return True
+
+    def peek(self):
+        """Siguiente carácter distinto de espacio ('' al final del archivo)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"GeoJSON no válido: se esperaba '{char}' y se encontró "
+                             f"'{found or 'fin de archivo'}' (byte ~{self.bytes_read})")
+        self.pos += 1
+
+    def value(self):
+        """Siguiente valor JSON completo"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self.fill():
+                    continue
+                raise ValueError(f"GeoJSON no válido cerca del byte {self.bytes_read}: {e.msg}") from None
+            # Un número que termina justo en el borde del buffer puede seguir en el próximo bloque
+            if end == len(self.buffer) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(stream, feature_filter=None, progress=None, head=None, chunk_size=CHUNK_SIZE):
+    """
+    Features de un FeatureCollection leído en streaming
+
+    stream es un archivo binario (o una ruta). Solo se entregan los features
+    que aceptan feature_filter. progress(bytes_leídos, bytes_totales, features)
+    se llama tras cada bloque leído. Si head es un dict, recibe los miembros
+    de primer nivel distintos de "features"
+    """
+    if isinstance(stream, (str, os.PathLike)):
+        with open(stream, 'rb') as f:
+            yield from iter_features(f, feature_filter, progress, head, chunk_size)
+        return
+
+    try:
+        total_bytes = os.fstat(stream.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        total_bytes = None
+    reader = _Reader(stream, total_bytes, chunk_size, progress)
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError("GeoJSON no válido: clave de primer nivel no es una cadena")
+        reader.expect(':')
+        if key == "features":
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    feature = reader.value()
+                    reader.features += 1
+                    if isinstance(feature, dict) and (not feature_filter or feature_filter(feature)):
+                        yield feature
+                    separator = reader.peek()
+                    reader.pos += 1
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise ValueError(f"GeoJSON no válido: se esperaba ',' o ']' tras el feature "
+                                         f"{reader.features} (byte ~{reader.bytes_read})")
+        else:
+            value = reader.value()
+            if head is not None:
+                head[key] = value
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == '}':
+            break
+        if separator != ',':
+            raise ValueError(f"GeoJSON no válido: se esperaba ',' o '}}' (byte ~{reader.bytes_read})")
+
+
+def load_feature_collection(stream, feature_filter=None, progress=None, on_feature=None, chunk_size=CHUNK_SIZE):
+    """
+    FeatureCollection completo leído en streaming
+
+    on_feature(feature) se llama con cada feature aceptado en cuanto se
+    decodifica (p. ej. para indexarlo mientras se lee el resto)
+    """
+    head = {}
+    features = []
+    for feature in iter_features(stream, feature_filter, progress, head, chunk_size):
+        if on_feature is not None:
+            on_feature(feature)
+        features.append(feature)
+    collection = {"type": head.pop("type", "FeatureCollection")}
+    collection.update(head)
+    collection["features"] = features
+    return collection
@@ -0,0 +1,307 @@
+"""
+Geometría vectorizada con NumPy para los polígonos ML
+
+Envolventes de clusters:
+- convex_hull: cadena monótona de Andrew, O(n log n), precedida por el filtro
+  de Akl-Toussaint que descarta en bloque los puntos interiores del octágono
+  formado por los puntos extremos
+- concave_hull: alpha shape sobre la triangulación de Delaunay, para áreas de
+  floración alargadas que la envolvente convexa exagera
+
+Ambas devuelven un anillo cerrado [[lng, lat], ...] en sentido antihorario
+(regla de la mano derecha de GeoJSON), o None si el cluster es degenerado
+(menos de 3 puntos distintos o todos colineales).
+
+Área y centroide:
+- polygon_stats: área en m² y centroide ponderado por área de muchos
+  polígonos (con huecos) en una sola pasada vectorizada. Los vértices se
+  proyectan con la proyección cilíndrica equivalente de Lambert sobre el
+  elipsoide WGS84, que conserva las áreas, así que el shoelace en metros da el
+  área elipsoidal a cualquier latitud (el factor fijo 111 km × 111 km solo es
+  correcto en el ecuador)
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from point_store import ring_coords
+
+# Elipsoide WGS84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+WGS84_E = np.sqrt(WGS84_E2)
+
+
+def as_coords(points):
+    """Array (n, 2) float64 a partir de puntos [[lng, lat], ...] o de un array"""
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def signed_area(ring):
+    """Área con signo (shoelace) de un anillo; positiva si es antihorario"""
+    ring = as_coords(ring)
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _akl_toussaint(coords):
+    """Descarta los puntos estrictamente dentro del octágono de puntos extremos"""
+    x, y = coords[:, 0], coords[:, 1]
+    s, d = x + y, x - y
+    extremes = [np.argmin(x), np.argmin(s), np.argmin(y), np.argmax(d),
+                np.argmax(x), np.argmax(s), np.argmax(y), np.argmin(d)]
+    # Octágono antihorario sin vértices repetidos consecutivos
+    polygon = []
+    for i in extremes:
+        if not polygon or polygon[-1] != i:
+            polygon.append(i)
+    if len(polygon) > 1 and polygon[0] == polygon[-1]:
+        polygon.pop()
+    if len(polygon) < 3:
+        return coords
+
+    vertices = coords[polygon]
+    edges_from = vertices
+    edges_to = np.roll(vertices, -1, axis=0)
+    # cross > 0 para cada arista => estrictamente a la izquierda => interior
+    inside = np.ones(len(coords), dtype=bool)
+    for a, b in zip(edges_from, edges_to):
+        inside &= (b[0] - a[0]) * (y - a[1]) - (b[1] - a[1]) * (x - a[0]) > 0
+    return coords[~inside]
+
+
+def convex_hull(points):
+    """
+    Envolvente convexa por cadena monótona (Andrew)
+
+    Los duplicados se eliminan con np.unique, que además deja los puntos
+    ordenados por (lng, lat); los colineales se descartan del resultado.
+    """
+    coords = as_coords(points)
+    if len(coords) > 64:
+        coords = _akl_toussaint(coords)
+    coords = np.unique(coords, axis=0)
+    if len(coords) < 3:
+        return None
+
+    pts = coords.tolist()
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and _cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and _cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+
+    hull = lower[:-1] + upper[:-1]
+    if len(hull) < 3:
+        return None  # todos los puntos son colineales
+    hull.append(hull[0])
+    return hull
+
+
+def concave_hull(points, radius):
+    """
+    Envolvente cóncava (alpha shape) con radio de circunferencia máximo radius
+
+    Se conservan los triángulos de Delaunay cuyo circunradio es menor que
+    radius; el borde de esa unión se encadena en anillos y se devuelve el de
+    mayor área. Si no queda ningún triángulo se recurre a la envolvente
+    convexa.
+    """
+    from scipy.spatial import Delaunay, QhullError
+
+    coords = np.unique(as_coords(points), axis=0)
+    if len(coords) < 4:
+        return convex_hull(coords)
+    try:
+        triangles = Delaunay(coords).simplices
+    except QhullError:
+        return None  # puntos colineales
+
+    a, b, c = (coords[triangles[:, k]] for k in range(3))
+    ab = np.linalg.norm(b - a, axis=1)
+    bc = np.linalg.norm(c - b, axis=1)
+    ca = np.linalg.norm(a - c, axis=1)
+    twice_area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        circumradius = ab * bc * ca / (2.0 * np.abs(twice_area))
+    keep = circumradius < radius
+    if not keep.any():
+        return convex_hull(coords)
+
+    # Orientar los triángulos en sentido antihorario para que el borde
+    # exterior quede antihorario y los huecos en sentido horario
+    kept = triangles[keep]
+    clockwise = twice_area[keep] < 0
+    kept[clockwise] = kept[clockwise][:, [0, 2, 1]]
+
+    edges = np.concatenate([kept[:, [0, 1]], kept[:, [1, 2]], kept[:, [2, 0]]])
+    undirected = np.sort(edges, axis=1)
+    _, inverse, counts = np.unique(undirected, axis=0, return_inverse=True, return_counts=True)
+    boundary = edges[counts[inverse.reshape(-1)] == 1]
+
+    ring = _largest_ring(boundary, coords)
+    if ring is None:
+        return convex_hull(coords)
+    return ring
+
+
+def _largest_ring(edges, coords):
+    """Encadena aristas dirigidas de borde en anillos y devuelve el de mayor área"""
+    outgoing = defaultdict(list)
+    for start, end in edges.tolist():
+        outgoing[start].append(end)
+
+    best, best_area = None, 0.0
+    while outgoing:
+        start = next(iter(outgoing))
+        ring = [start]
+        current = start
+        while True:
+            ends = outgoing.get(current)
+            if not ends:
+                break
+            nxt = ends.pop()
+            if not ends:
+                del outgoing[current]
+            if nxt == start:
+                break
+            ring.append(nxt)
+            current = nxt
+        if len(ring) < 3:
+            continue
+        ring_coords = coords[ring]
+        area = signed_area(ring_coords)
+        if area > best_area:
+            best, best_area = ring_coords, area
+
+    if best is None:
+        return None
+    hull = best.tolist()
+    hull.append(hull[0])
+    return hull
+
+
+def _authalic_q(sin_lat):
+    """q(φ) de la proyección equivalente (Snyder, ec. 3-12)"""
+    e, e2 = WGS84_E, WGS84_E2
+    return (1 - e2) * (sin_lat / (1 - e2 * sin_lat ** 2)
+                       - np.log((1 - e * sin_lat) / (1 + e * sin_lat)) / (2 * e))
+
+
+def equal_area(lnglat):
+    """[lng, lat] en grados → [x, y] en metros (cilíndrica equivalente de Lambert, WGS84)"""
+    lnglat = as_coords(lnglat)
+    x = WGS84_A * np.radians(lnglat[:, 0])
+    y = WGS84_A * _authalic_q(np.sin(np.radians(lnglat[:, 1]))) / 2
+    return np.column_stack((x, y))
+
+
+def inverse_equal_area(xy):
+    """Inversa de equal_area (Newton sobre la latitud, converge en pocas iteraciones)"""
+    xy = as_coords(xy)
+    q = 2 * xy[:, 1] / WGS84_A
+    # Latitud auténtica como punto de partida
+    lat = np.arcsin(np.clip(q / _authalic_q(1.0), -1.0, 1.0))
+    for _ in range(5):
+        sin_lat = np.sin(lat)
+        cos_lat = np.maximum(np.cos(lat), 1e-12)
+        dq = 2 * (1 - WGS84_E2) * cos_lat / (1 - WGS84_E2 * sin_lat ** 2) ** 2
+        lat = np.clip(lat - (_authalic_q(sin_lat) - q) / dq, -np.pi / 2, np.pi / 2)
+    return np.column_stack((np.degrees(xy[:, 0] / WGS84_A), np.degrees(lat)))
+
+
+def polygon_stats(polygons, geodesic=True):
+    """
+    Área y centroide ponderado por área de muchos polígonos a la vez
+
+    polygons es una lista de coordenadas de Polygon GeoJSON (lista de anillos:
+    el primero es el exterior y los demás huecos). Devuelve (areas, centroids):
+    áreas en m² (grados² con geodesic=False) y centroides [lng, lat] en un
+    array (k, 2). Los polígonos sin área (vacíos, colineales) usan el promedio
+    de los vértices del exterior sin contar dos veces el punto de cierre; los
+    vacíos quedan con centroide NaN.
+    """
+    rings, owners, holes = [], [], []
+    for p, polygon in enumerate(polygons):
+        for r, ring in enumerate(polygon or []):
+            coords = ring_coords(ring)
+            if len(coords) >= 3 or (r == 0 and len(coords)):
+                rings.append(coords)
+                owners.append(p)
+                holes.append(r > 0)
+
+    k = len(polygons)
+    areas = np.zeros(k)
+    centroids = np.full((k, 2), np.nan)
+    if not rings:
+        return areas, centroids
+
+    owners = np.asarray(owners, dtype=np.int64)
+    holes = np.asarray(holes, dtype=bool)
+    lengths = np.fromiter((len(r) for r in rings), dtype=np.int64, count=len(rings))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    lnglat = np.concatenate(rings)
+    xy = equal_area(lnglat) if geodesic else lnglat
+
+    # Coordenadas relativas al primer vértice de cada anillo: evita perder
+    # precisión al restar productos de coordenadas en metros (~1e7)
+    origin = xy[starts]
+    local = xy - np.repeat(origin, lengths, axis=0)
+    following = np.arange(1, len(xy) + 1)
+    following[starts + lengths - 1] = starts  # cada anillo se cierra sobre sí mismo
+    x, y = local[:, 0], local[:, 1]
+    xn, yn = x[following], y[following]
+    cross = x * yn - xn * y
+
+    twice_area = np.add.reduceat(cross, starts)
+    moment_x = np.add.reduceat((x + xn) * cross, starts) / 6
+    moment_y = np.add.reduceat((y + yn) * cross, starts) / 6
+
+    # Exteriores suman y huecos restan, sea cual sea la orientación del anillo
+    sign = np.where(holes, -1.0, 1.0) * np.sign(twice_area)
+    ring_area = sign * twice_area / 2
+    ring_mx = sign * moment_x + ring_area * origin[:, 0]
+    ring_my = sign * moment_y + ring_area * origin[:, 1]
+
+    areas = np.bincount(owners, weights=ring_area, minlength=k)
+    total_mx = np.bincount(owners, weights=ring_mx, minlength=k)
+    total_my = np.bincount(owners, weights=ring_my, minlength=k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weighted = np.column_stack((total_mx / areas, total_my / areas))
+    centroids = inverse_equal_area(weighted) if geodesic else weighted
+
+    # Sin área: promedio de los vértices del exterior (sin el punto de cierre)
+    degenerate = ~(np.abs(areas) > 0)
+    if degenerate.any():
+        exterior = np.flatnonzero(~holes)
+        exterior = exterior[degenerate[owners[exterior]]]
+        for i in exterior:
+            coords = rings[i]
+            if len(coords) > 1 and np.array_equal(coords[0], coords[-1]):
+                coords = coords[:-1]
+            centroids[owners[i]] = coords.mean(axis=0)
+
+    return np.abs(areas), centroids
+
+
+def polygon_area(polygon, geodesic=True):
+    """Área en m² de un Polygon GeoJSON (lista de anillos)"""
+    return float(polygon_stats([polygon], geodesic)[0][0])
+
+
+def polygon_centroid(polygon, geodesic=True):
+    """Centroide [lng, lat] ponderado por área de un Polygon GeoJSON, o None si está vacío"""
+    centroid = polygon_stats([polygon], geodesic)[1][0]
+    if np.isnan(centroid).any():
+        return None
+    return centroid.tolist()
@@ -0,0 +1,235 @@
+"""
+Heatmap de densidad calculado en el servidor, servido como teselas XYZ
+
+Los puntos (de usuario, vértices de los polígonos originales y centroides
+ML) se proyectan a Web Mercator y se agrupan en celdas de una pirámide por
+zoom:
+
+- El nivel más fino (MAX_ZOOM) tiene TILE_BINS x TILE_BINS celdas por tesela.
+  Cada celda se identifica por su clave Morton (bits de x e y intercalados),
+  así que las celdas de una tesela forman un rango contiguo de claves
+  ordenadas y se encuentran con dos searchsorted
+- Cada nivel inferior se obtiene del siguiente desplazando las claves dos bits
+  y sumando pesos (np.add.reduceat): es un histograma 2D disperso por zoom que
+  solo ocupa memoria para las celdas con puntos
+
+Una tesela es la rejilla TILE_BINS x TILE_BINS de su rango de claves, suavizada
+con un núcleo gaussiano separable. Se incluyen las teselas vecinas como margen
+para que el suavizado no deje costuras. El tamaño de la respuesta es fijo, sin
+importar cuántos puntos haya.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+# Celdas por lado de una tesela (2**TILE_BITS) y zoom máximo de la pirámide;
+# con zooms mayores se amplía la tesela ancestro de MAX_ZOOM
+TILE_BITS = 6
+TILE_BINS = 1 << TILE_BITS
+MAX_ZOOM = 16
+LEVEL_BITS = MAX_ZOOM + TILE_BITS
+
+# Núcleo gaussiano (en celdas) para la densidad de cada tesela
+KERNEL_SIGMA = 1.0
+KERNEL_RADIUS = 2
+
+# Las teselas PNG se escalan a TILE_PIXELS píxeles por lado
+TILE_PIXELS = 256
+
+# Rampa de color (igual a la del heatmap del mapa): posición, RGB
+GRADIENT = (
+    (0.0, (0, 0, 255)),
+    (0.4, (0, 255, 255)),
+    (0.6, (0, 255, 0)),
+    (0.8, (255, 255, 0)),
+    (1.0, (255, 0, 0))
+)
+MAX_OPACITY = 0.6
+
+MAX_LAT = 85.0511287798
+
+
+def _part1by1(v):
+    """Separa los bits de v (uint64) dejando un cero entre cada uno"""
+    v = v & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def _compact1by1(v):
+    """Inversa de _part1by1: recoge los bits pares de v"""
+    v = v & np.uint64(0x5555555555555555)
+    v = (v | (v >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return v
+
+
+def morton_key(x, y):
+    """Clave Morton de celdas enteras (x, y)"""
+    return _part1by1(np.asarray(x, dtype=np.uint64)) | (_part1by1(np.asarray(y, dtype=np.uint64)) << np.uint64(1))
+
+
+def mercator(lnglat):
+    """Coordenadas Web Mercator normalizadas a [0, 1) (y crece hacia el sur)"""
+    lnglat = np.asarray(lnglat, dtype=np.float64).reshape(-1, 2)
+    lng = lnglat[:, 0]
+    lat = np.radians(np.clip(lnglat[:, 1], -MAX_LAT, MAX_LAT))
+    x = (lng + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """[oeste, sur, este, norte] en grados de la tesela z/x/y"""
+    n = float(1 << z)
+
+    def lat(row):
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * row / n)))))
+
+    return [x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)]
+
+
+def _kernel():
+    offsets = np.arange(-KERNEL_RADIUS, KERNEL_RADIUS + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 * (offsets / KERNEL_SIGMA) ** 2)
+    return kernel / kernel.sum()
+
+
+def _smooth(grid, kernel):
+    """Convolución gaussiana separable (filas y columnas) con bordes en cero"""
+    r = len(kernel) // 2
+    padded = np.pad(grid, r)
+    rows = sum(k * padded[:, i:i + grid.shape[1]] for i, k in enumerate(kernel))
+    return sum(k * rows[i:i + grid.shape[0], :] for i, k in enumerate(kernel))
+
+
+class HeatmapTiles:
+    def __init__(self):
+        self.version = None
+        self.point_count = 0
+        # levels[z] = (claves Morton ordenadas, pesos, peso máximo)
+        self.levels = []
+        self.kernel = _kernel()
+
+    def build(self, lnglat, weights=None, version=None):
+        """Construye la pirámide completa a partir de puntos [[lng, lat], ...]"""
+        lnglat = np.asarray(lnglat, dtype=np.float64).reshape(-1, 2)
+        weights = (np.ones(len(lnglat)) if weights is None
+                   else np.asarray(weights, dtype=np.float64).reshape(-1))
+        valid = np.isfinite(lnglat).all(axis=1) & (np.abs(lnglat[:, 0]) <= 180.0)
+        lnglat, weights = lnglat[valid], weights[valid]
+
+        size = 1 << LEVEL_BITS
+        mx, my = mercator(lnglat)
+        cx = np.clip((mx * size).astype(np.int64), 0, size - 1)
+        cy = np.clip((my * size).astype(np.int64), 0, size - 1)
+        keys, inverse = np.unique(morton_key(cx, cy), return_inverse=True)
+        cell_weights = np.bincount(inverse.reshape(-1), weights=weights, minlength=len(keys))
+
+        levels = [None] * (MAX_ZOOM + 1)
+        for z in range(MAX_ZOOM, -1, -1):
+            levels[z] = (keys, cell_weights, float(cell_weights.max()) if len(keys) else 0.0)
+            if z:
+                parent = keys >> np.uint64(2)
+                starts = np.concatenate([[0], np.flatnonzero(np.diff(parent)) + 1]) if len(parent) else parent
+                keys = parent[starts]
+                cell_weights = np.add.reduceat(cell_weights, starts) if len(starts) else cell_weights
+
+        self.levels = levels
+        self.point_count = len(lnglat)
+        self.version = version
+
+    def density(self, z, x, y):
+        """
+        Rejilla TILE_BINS x TILE_BINS de densidad normalizada [0, 1] de la
+        tesela z/x/y (fila 0 = norte). Lanza ValueError si la tesela no existe
+        """
+        if not (0 <= z <= 30 and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError(f"Tesela fuera de rango: {z}/{x}/{y}")
+
+        if z > MAX_ZOOM:
+            # Ampliar la porción correspondiente de la tesela ancestro
+            shift = z - MAX_ZOOM
+            parent = self.density(MAX_ZOOM, x >> shift, y >> shift)
+            span = max(TILE_BINS >> shift, 1)
+            sub = (1 << shift) // (TILE_BINS // span)
+            ox = (x % (1 << shift)) // sub * span
+            oy = (y % (1 << shift)) // sub * span
+            block = parent[oy:oy + span, ox:ox + span]
+            return np.repeat(np.repeat(block, TILE_BINS // span, axis=0), TILE_BINS // span, axis=1)
+
+        keys, weights, level_max = self.levels[z] if self.levels else ((), (), 0.0)
+        if not level_max:
+            return np.zeros((TILE_BINS, TILE_BINS))
+
+        # Tesela central más las 8 vecinas como margen del suavizado
+        grid = np.zeros((3 * TILE_BINS, 3 * TILE_BINS))
+        tiles = 1 << z
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                tx, ty = x + dx, y + dy
+                if not (0 <= ty < tiles):
+                    continue
+                tx %= tiles  # el mundo se repite en longitud
+                prefix = morton_key(tx, ty) << np.uint64(2 * TILE_BITS)
+                lo, hi = np.searchsorted(keys, [prefix, prefix + np.uint64(1 << (2 * TILE_BITS))])
+                if lo == hi:
+                    continue
+                local = keys[lo:hi] & np.uint64((1 << (2 * TILE_BITS)) - 1)
+                col = _compact1by1(local).astype(np.int64) + (dx + 1) * TILE_BINS
+                row = _compact1by1(local >> np.uint64(1)).astype(np.int64) + (dy + 1) * TILE_BINS
+                grid[row, col] = weights[lo:hi]
+
+        smoothed = _smooth(grid, self.kernel)[TILE_BINS:2 * TILE_BINS, TILE_BINS:2 * TILE_BINS]
+        # Escala logarítmica relativa a la celda más densa del zoom (suavizada)
+        peak = level_max * self.kernel[KERNEL_RADIUS] ** 2
+        return np.clip(np.log1p(smoothed) / np.log1p(peak), 0.0, 1.0)
+
+    def tile_json(self, z, x, y):
+        """Tesela dispersa: solo las celdas con densidad apreciable"""
+        density = self.density(z, x, y)
+        rows, cols = np.nonzero(density > 1e-3)
+        values = np.round(density[rows, cols], 4)
+        return {
+            "z": z, "x": x, "y": y,
+            "size": TILE_BINS,
+            "bounds": tile_bounds(z, x, y),
+            "cells": np.column_stack((cols, rows, values)).tolist()
+        }
+
+    def tile_png(self, z, x, y):
+        """Tesela coloreada como PNG RGBA de TILE_PIXELS x TILE_PIXELS"""
+        density = self.density(z, x, y)
+        scale = TILE_PIXELS // TILE_BINS
+        density = np.repeat(np.repeat(density, scale, axis=0), scale, axis=1)
+
+        stops = np.array([s for s, _ in GRADIENT])
+        colors = np.array([c for _, c in GRADIENT], dtype=np.float64)
+        rgba = np.empty(density.shape + (4,), dtype=np.uint8)
+        for channel in range(3):
+            rgba[..., channel] = np.interp(density, stops, colors[:, channel]).astype(np.uint8)
+        rgba[..., 3] = (np.clip(density * 1.5, 0.0, 1.0) * MAX_OPACITY * 255).astype(np.uint8)
+        return encode_png(rgba)
+
+
+def encode_png(rgba):
+    """PNG RGBA de 8 bits sin dependencias externas (filtro 0 en cada fila)"""
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
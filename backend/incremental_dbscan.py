@@ -0,0 +1,361 @@
+"""
+DBSCAN incremental para la ingesta de puntos
+
+DBSCAN de scikit-learn descarta, al terminar fit_predict, todo el estado que
+calculó (vecindades, puntos núcleo, conexiones entre clusters). Esta clase lo
+conserva entre llamadas para que añadir un punto solo toque los clusters cuya
+vecindad ε alcanza:
+
+1. Una rejilla uniforme de celda ε localiza los vecinos del punto nuevo
+   revisando únicamente las 3^d celdas adyacentes
+2. El conteo de vecinos de cada punto se actualiza y los puntos que alcanzan
+   min_samples se promueven a núcleo. Con pesos (sample_weight, p. ej.
+   reportes repetidos fusionados en la ingesta) el conteo es la suma de los
+   pesos de la vecindad, igual que en DBSCAN
+3. Un union-find sobre los puntos núcleo fusiona los clusters conectados; la
+   raíz de cada cluster es siempre su índice núcleo más bajo, igual que el
+   orden en que DBSCAN numera sus etiquetas
+
+Aumentar el peso de un punto existente (reweight) se propaga igual que una
+inserción sin punto nuevo. Las inserciones y los aumentos de peso solo
+pueden crear o fusionar clusters, nunca dividirlos, por
+lo que el resultado es equivalente a volver a ejecutar DBSCAN completo (salvo
+la asignación de puntos frontera alcanzables desde dos clusters, que en
+DBSCAN también depende del orden).
+
+El estado completo se puede exportar (state) y restaurar (restore) para
+arrancar desde un snapshot sin volver a calcular las vecindades.
+"""
+from collections import defaultdict
+from itertools import product
+
+import numpy as np
+
+
+class IncrementalDBSCAN:
+    def __init__(self, eps=0.05, min_samples=3, dim=2):
+        self.eps = eps
+        self.min_samples = min_samples
+        self.dim = dim
+        self._offsets = list(product((-1, 0, 1), repeat=dim))
+        self.reset()
+
+    def reset(self):
+        """Descarta todo el estado del clustering"""
+        self.n_points = 0
+        self._coords = np.empty((0, self.dim), dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._weights = np.empty(0, dtype=np.int64)
+        self._core = np.empty(0, dtype=bool)
+        self._parent = np.empty(0, dtype=np.int64)
+        self._border_of = np.empty(0, dtype=np.int64)
+        self.members = {}
+        self._grid = defaultdict(list)
+
+    # ------------------------------------------------------------------
+    # Construcción completa
+    # ------------------------------------------------------------------
+    def fit(self, coords, graph=None, graph_eps=None, sample_weight=None):
+        """
+        Ejecuta DBSCAN completo y conserva su estado para inserciones futuras
+
+        Las vecindades se calculan una sola vez como grafo de radio ε, que
+        sirve tanto para DBSCAN (métrica precomputada) como para los conteos
+        de vecinos que necesita la inserción incremental.
+
+        graph permite pasar un grafo de vecinos ya calculado (por ejemplo desde
+        RadiusNeighborGraph) cuyas distancias están en otras unidades; graph_eps
+        es el radio equivalente a ε en esas unidades. sample_weight es el peso
+        entero de cada punto (1 si se omite).
+        """
+        # scikit-learn se importa al primer uso: cuesta cientos de ms al arrancar
+        from sklearn.cluster import DBSCAN
+        from sklearn.neighbors import NearestNeighbors
+
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, self.dim)
+        self.reset()
+        n = len(coords)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+
+        self._reserve(n)
+        self._coords[:n] = coords
+        self._weights[:n] = 1 if sample_weight is None else sample_weight
+        self.n_points = n
+
+        if graph is None:
+            graph = NearestNeighbors(radius=self.eps).fit(coords).radius_neighbors_graph(coords, mode='distance')
+            graph_eps = self.eps
+        # El grafo incluye al propio punto (distancia 0), igual que DBSCAN
+        if sample_weight is None:
+            self._counts[:n] = np.diff(graph.indptr)
+        else:
+            rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+            self._counts[:n] = np.bincount(rows, weights=self._weights[graph.indices], minlength=n)
+
+        dbscan = DBSCAN(eps=graph_eps, min_samples=self.min_samples, metric='precomputed')
+        labels = dbscan.fit_predict(graph, sample_weight=sample_weight)
+        core_idx = dbscan.core_sample_indices_
+        self._core[:n] = False
+        self._core[core_idx] = True
+
+        # Raíz de cada etiqueta = índice núcleo más bajo del cluster
+        n_labels = int(labels.max()) + 1 if n else 0
+        roots = np.full(n_labels, n, dtype=np.int64)
+        np.minimum.at(roots, labels[core_idx], core_idx)
+
+        self._parent[:n] = -1
+        self._parent[core_idx] = roots[labels[core_idx]]
+        border = (labels >= 0) & ~self._core[:n]
+        self._border_of[:n] = -1
+        self._border_of[:n][border] = roots[labels[border]]
+
+        clustered = np.flatnonzero(labels >= 0)
+        order = clustered[np.argsort(labels[clustered], kind='stable')]
+        if len(order):
+            splits = np.flatnonzero(np.diff(labels[order])) + 1
+            for group in np.split(order, splits):
+                self.members[int(roots[labels[group[0]]])] = group.tolist()
+
+        # La rejilla solo hace falta para insertar: se construye al primer insert
+        self._grid = None
+        return self.labels()
+
+    def state(self):
+        """Estado del clustering como arrays NumPy (para guardarlo en un snapshot)"""
+        n = self.n_points
+        roots = np.array(sorted(self.members), dtype=np.int64)
+        sizes = np.array([len(self.members[r]) for r in roots.tolist()], dtype=np.int64)
+        indices = ([np.asarray(self.members[r], dtype=np.int64) for r in roots.tolist()]
+                   or [np.empty(0, dtype=np.int64)])
+        return {
+            "counts": self._counts[:n].copy(),
+            "weights": self._weights[:n].copy(),
+            "core": self._core[:n].copy(),
+            "parent": self._parent[:n].copy(),
+            "border_of": self._border_of[:n].copy(),
+            "member_roots": roots,
+            "member_offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            "member_indices": np.concatenate(indices)
+        }
+
+    def restore(self, coords, state):
+        """
+        Restaura el estado exportado por state() para las mismas coordenadas
+        (y los mismos eps, min_samples y dim con que se calculó)
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, self.dim)
+        self.reset()
+        n = len(coords)
+        if len(state["counts"]) != n:
+            raise ValueError("El estado no corresponde a las coordenadas")
+
+        self._reserve(n)
+        self._coords[:n] = coords
+        self._counts[:n] = state["counts"]
+        # Los snapshots anteriores a los pesos no traen la columna
+        self._weights[:n] = state["weights"] if "weights" in state else 1
+        self._core[:n] = state["core"]
+        self._parent[:n] = state["parent"]
+        self._border_of[:n] = state["border_of"]
+        self.n_points = n
+
+        offsets = state["member_offsets"]
+        indices = state["member_indices"]
+        for k, root in enumerate(state["member_roots"].tolist()):
+            self.members[root] = indices[offsets[k]:offsets[k + 1]].tolist()
+        self._grid = None
+
+    # ------------------------------------------------------------------
+    # Inserción incremental
+    # ------------------------------------------------------------------
+    def insert(self, coord, weight=1):
+        """
+        Añade un punto de peso weight y actualiza solo los clusters que
+        alcanza su vecindad
+
+        Devuelve (raíces modificadas, raíces eliminadas): las primeras son
+        clusters nuevos o que cambiaron de miembros; las segundas, clusters
+        absorbidos por una fusión que ya no existen.
+        """
+        coord = np.asarray(coord, dtype=np.float64).reshape(self.dim)
+        if self._grid is None:
+            self._build_grid()
+        p = self.n_points
+        self._reserve(p + 1)
+        self._coords[p] = coord
+        self._weights[p] = weight
+        self._counts[p] = weight
+        self._core[p] = False
+        self._parent[p] = -1
+        self._border_of[p] = -1
+        self.n_points = p + 1
+
+        neighbors = self._neighbors(p)
+        self._grid[self._cell(coord)].append(p)
+        self._counts[p] += self._weights[neighbors].sum()
+        self._counts[neighbors] += weight
+
+        promoted = neighbors[~self._core[neighbors] & (self._counts[neighbors] >= self.min_samples)].tolist()
+        if self._counts[p] >= self.min_samples:
+            promoted.append(p)
+        removed = self._promote(p, neighbors, promoted)
+
+        if not self._core[p] and self._border_of[p] < 0:
+            core_neighbors = neighbors[self._core[neighbors]]
+            if len(core_neighbors):
+                owner = int(core_neighbors.min())
+                self._border_of[p] = owner
+                self.members[self._find(owner)].append(p)
+
+        touched = {self._find(c) for c in promoted}
+        label = self.label_of(p)
+        if label >= 0:
+            touched.add(label)
+        return touched, removed - touched
+
+    def reweight(self, i, weight):
+        """
+        Aumenta el peso del punto i (p. ej. un reporte repetido fusionado en
+        él) y actualiza los clusters que alcanza su vecindad
+
+        Devuelve (raíces modificadas, raíces eliminadas) como insert. El
+        cluster del punto cuenta como modificado aunque no cambien sus
+        miembros (su peso total sí cambia). El peso no puede disminuir:
+        eso podría dividir clusters
+        """
+        delta = int(weight) - int(self._weights[i])
+        if delta < 0:
+            raise ValueError("El peso de un punto solo puede aumentar")
+        if self._grid is None:
+            self._build_grid()
+        self._weights[i] = weight
+        neighbors = self._neighbors(i)
+        self._counts[i] += delta
+        self._counts[neighbors] += delta
+
+        promoted = neighbors[~self._core[neighbors] & (self._counts[neighbors] >= self.min_samples)].tolist()
+        if not self._core[i] and self._counts[i] >= self.min_samples:
+            promoted.append(i)
+        removed = self._promote(i, neighbors, promoted)
+
+        touched = {self._find(c) for c in promoted}
+        label = self.label_of(i)
+        if label >= 0:
+            touched.add(label)
+        return touched, removed - touched
+
+    def _promote(self, p, neighbors, promoted):
+        """
+        Convierte en núcleo los puntos promoted (p y sus vecinos neighbors)
+        y fusiona sus clusters; devuelve las raíces absorbidas
+        """
+        removed = set()
+        for c in promoted:
+            self._core[c] = True
+            self._parent[c] = c
+            # Un punto frontera ya figura en los miembros de su cluster
+            self.members[c] = [] if self._border_of[c] >= 0 else [c]
+            self._border_of[c] = -1
+
+            c_neighbors = neighbors if c == p else self._neighbors(c)
+            core_mask = self._core[c_neighbors]
+            for root in np.unique(self._roots(c_neighbors[core_mask])).tolist():
+                absorbed = self._union(c, root)
+                if absorbed is not None:
+                    removed.add(absorbed)
+
+            unassigned = c_neighbors[~core_mask & (self._border_of[c_neighbors] < 0)]
+            if len(unassigned):
+                self._border_of[unassigned] = c
+                self.members[self._find(c)].extend(unassigned.tolist())
+        return removed
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def label_of(self, i):
+        """Raíz del cluster del punto i, o -1 si es ruido"""
+        if self._core[i]:
+            return self._find(i)
+        if self._border_of[i] >= 0:
+            return self._find(int(self._border_of[i]))
+        return -1
+
+    def labels(self):
+        """Etiqueta (raíz del cluster o -1) de todos los puntos"""
+        labels = np.full(self.n_points, -1, dtype=np.int64)
+        for root, idx in self.members.items():
+            labels[idx] = root
+        return labels
+
+    def clusters(self):
+        """Miembros de cada cluster ordenados por raíz (orden de DBSCAN)"""
+        return {root: self.members[root] for root in sorted(self.members)}
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _build_grid(self):
+        self._grid = defaultdict(list)
+        cells = np.floor(self._coords[:self.n_points] / self.eps).astype(np.int64)
+        for i, cell in enumerate(map(tuple, cells.tolist())):
+            self._grid[cell].append(i)
+
+    def _cell(self, coord):
+        return tuple(np.floor(coord / self.eps).astype(np.int64).tolist())
+
+    def _neighbors(self, i):
+        """Índices a distancia ≤ ε del punto i (sin incluirlo)"""
+        coord = self._coords[i]
+        cell = self._cell(coord)
+        candidates = []
+        for offset in self._offsets:
+            candidates.extend(self._grid.get(tuple(c + o for c, o in zip(cell, offset)), ()))
+        candidates = np.asarray(candidates, dtype=np.int64)
+        candidates = candidates[candidates != i]
+        if not len(candidates):
+            return candidates
+        dist = np.linalg.norm(self._coords[candidates] - coord, axis=1)
+        return candidates[dist <= self.eps]
+
+    def _roots(self, indices):
+        """Raíces de varios puntos núcleo a la vez (saltos de puntero vectorizados)"""
+        roots = self._parent[indices]
+        while True:
+            parents = self._parent[roots]
+            if np.array_equal(parents, roots):
+                return roots
+            roots = parents
+
+    def _find(self, i):
+        parent = self._parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return int(root)
+
+    def _union(self, a, b):
+        """Fusiona dos clusters; devuelve la raíz absorbida o None"""
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return None
+        if rb < ra:
+            ra, rb = rb, ra
+        self._parent[rb] = ra
+        self.members[ra].extend(self.members.pop(rb))
+        return rb
+
+    def _reserve(self, size):
+        capacity = len(self._counts)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        self._coords = np.resize(self._coords, (capacity, self.dim))
+        self._counts = np.resize(self._counts, capacity)
+        self._weights = np.resize(self._weights, capacity)
+        self._core = np.resize(self._core, capacity)
+        self._parent = np.resize(self._parent, capacity)
+        self._border_of = np.resize(self._border_of, capacity)
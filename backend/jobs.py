@@ -0,0 +1,150 @@
+"""
+Planificador de re-clustering en segundo plano
+
+Las mutaciones (puntos nuevos, generación manual, reset) se encolan como
+trabajos y la petición HTTP responde de inmediato con un job id. Un hilo
+trabajador espera una ventana de `debounce` segundos sin trabajos nuevos
+(como máximo `max_delay`) y ejecuta todo lo acumulado de una vez: los
+trabajos consecutivos del mismo tipo se fusionan en una sola ejecución, de
+modo que una ráfaga de puntos produce un único re-clustering.
+
+Con inline=True los trabajos se ejecutan en el mismo hilo al encolarse
+(útil para scripts, benchmarks y depuración).
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger('earthbloom.jobs')
+
+
+class ReclusterScheduler:
+    def __init__(self, handlers, debounce=0.25, max_delay=2.0, inline=False, history=1000):
+        """
+        handlers: {tipo: función(payloads) -> resultado}. Cada función recibe
+        la lista de payloads de los trabajos fusionados, en orden de llegada
+        """
+        self.handlers = handlers
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.inline = inline
+        self.history = history
+
+        self._jobs = OrderedDict()
+        self._pending = []
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._last_submit = 0.0
+        self._thread = None
+
+    def submit(self, kind, payload=None, coalesce=True):
+        """
+        Encola un trabajo y devuelve su estado inicial
+
+        coalesce=False impide fusionarlo con trabajos vecinos del mismo tipo
+        (p. ej. generaciones manuales con parámetros distintos)
+        """
+        with self._cond:
+            job = {
+                "id": f"job_{next(self._ids)}",
+                "kind": kind,
+                "status": "queued",
+                "submitted_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+
+            if self.inline:
+                self._run_batch([(job, payload, coalesce)])
+                return dict(job)
+
+            self._pending.append((job, payload, coalesce))
+            self._last_submit = time.monotonic()
+            self._ensure_worker()
+            self._cond.notify()
+            return dict(job)
+
+    def status(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def wait_idle(self, timeout=None):
+        """Bloquea hasta que no queden trabajos pendientes ni en ejecución"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or any(j["status"] == "running" for j in self._jobs.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name="recluster-worker", daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                first_submit = time.monotonic()
+                # Ventana de debounce: esperar a que la ráfaga termine
+                while True:
+                    now = time.monotonic()
+                    quiet_until = self._last_submit + self.debounce
+                    if now >= quiet_until or now - first_submit >= self.max_delay:
+                        break
+                    self._cond.wait(quiet_until - now)
+                batch, self._pending = self._pending, []
+                for job, _, _ in batch:
+                    job["status"] = "running"
+
+            self._run_batch(batch)
+
+            with self._cond:
+                self._cond.notify_all()
+
+    def _run_batch(self, batch):
+        """Ejecuta los trabajos en orden, fusionando los consecutivos del mismo tipo"""
+        groups = []
+        for item in batch:
+            job, _, coalesce = item
+            last = groups[-1] if groups else None
+            if last and coalesce and last[0][2] and last[0][0]["kind"] == job["kind"]:
+                last.append(item)
+            else:
+                groups.append([item])
+
+        for group in groups:
+            kind = group[0][0]["kind"]
+            with self._cond:
+                for job, _, _ in group:
+                    job["status"] = "running"
+            try:
+                result = self.handlers[kind]([payload for _, payload, _ in group])
+                status, error = "done", None
+            except Exception as e:
+                result, status, error = None, "error", str(e)
+                logger.error("❌ Error en trabajo de re-clustering (%s): %s", kind, e)
+
+            finished_at = datetime.now().isoformat()
+            # Bajo el cerrojo: status() y wait_idle copian los trabajos con él
+            # y nunca deben ver uno a medio actualizar
+            with self._cond:
+                for job, _, _ in group:
+                    job.update(status=status, result=result, error=error, finished_at=finished_at,
+                               batch_size=len(group))
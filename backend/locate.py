@@ -0,0 +1,182 @@
+"""
+Localización punto-en-polígono: ¿en qué sitio o área ML cae una coordenada?
+
+Recorrer todos los features de la base combinada y probar cada anillo cuesta
+O(vértices totales) por consulta. PolygonLocator prepara los polígonos una
+sola vez por generación de datos:
+
+- Cada parte de polígono (un Polygon, o cada polígono de un MultiPolygon)
+  guarda su caja envolvente y sus aristas en arrays contiguos (x1, y1, x2, y2
+  y la pendiente dx/dy precalculada)
+- Las cajas se empaquetan en un R-tree STR (Sort-Tile-Recursive) con
+  NODE_CAPACITY hijos por nodo. La consulta desciende el árbol para todos los
+  puntos a la vez: en cada nivel los pares (punto, nodo) se filtran con una
+  comparación vectorizada y se expanden a los hijos del nodo
+- Los pares (punto, parte) que llegan a las hojas se prueban con ray casting
+  par-impar vectorizado (puntos × aristas de la parte), así que los huecos
+  se descartan sin tratarlos aparte
+
+El costo de una consulta depende de la profundidad del árbol y de las aristas
+de las partes candidatas, no del número total de polígonos.
+"""
+import numpy as np
+
+from point_store import ring_coords
+
+# Hijos por nodo del R-tree
+NODE_CAPACITY = 16
+
+# Pares punto × arista evaluados por bloque en el ray casting
+MAX_CELLS = 1 << 20
+
+
+def _polygon_parts(geometry):
+    geom_type = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+    if geom_type == "Polygon":
+        return [coordinates]
+    if geom_type == "MultiPolygon":
+        return coordinates
+    return []
+
+
+def _str_order(boxes, capacity):
+    """Orden Sort-Tile-Recursive: franjas verticales por x, cada una ordenada por y"""
+    n = len(boxes)
+    cx = boxes[:, 0] + boxes[:, 2]
+    cy = boxes[:, 1] + boxes[:, 3]
+    slab = int(np.ceil(np.sqrt(np.ceil(n / capacity)))) * capacity
+    by_x = np.argsort(cx, kind='stable')
+    return np.concatenate([
+        part[np.argsort(cy[part], kind='stable')] for part in np.array_split(by_x, range(slab, n, slab))
+    ])
+
+
+def _build_tree(boxes, capacity):
+    """
+    Niveles del R-tree, de la raíz a las hojas: (cajas, inicio de hijos, fin de
+    hijos). Los hijos de cada nodo son un rango contiguo del nivel inferior;
+    en las hojas el "hijo" es la posición de la parte en el orden STR
+    """
+    levels = [(boxes, np.arange(len(boxes)), np.arange(1, len(boxes) + 1))]
+    while len(boxes) > capacity:
+        starts = np.arange(0, len(boxes), capacity)
+        ends = np.minimum(starts + capacity, len(boxes))
+        boxes = np.column_stack((
+            np.minimum.reduceat(boxes[:, 0], starts), np.minimum.reduceat(boxes[:, 1], starts),
+            np.maximum.reduceat(boxes[:, 2], starts), np.maximum.reduceat(boxes[:, 3], starts)
+        ))
+        levels.append((boxes, starts, ends))
+    return levels[::-1]
+
+
+class _Index:
+    """Arrays preparados de una colección (se sustituyen enteros en cada build)"""
+
+    def __init__(self, features, capacity):
+        owners, boxes, edges, offsets = [], [], [], [0]
+        for position, feature in enumerate(features):
+            for polygon in _polygon_parts(feature.get("geometry") or {}):
+                rings = [r for r in (ring_coords(ring) for ring in polygon) if len(r) >= 3]
+                if not rings:
+                    continue
+                exterior = rings[0]
+                boxes.append((*exterior.min(axis=0), *exterior.max(axis=0)))
+                for ring in rings:
+                    # Cada vértice con el siguiente (el anillo se cierra con el primero)
+                    edges.append(np.hstack((ring, np.roll(ring, -1, axis=0))))
+                offsets.append(offsets[-1] + sum(len(r) for r in rings))
+                owners.append(position)
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        edges = np.concatenate(edges) if edges else np.empty((0, 4))
+        offsets = np.asarray(offsets, dtype=np.int64)
+
+        order = _str_order(boxes, capacity) if len(boxes) else np.empty(0, dtype=np.int64)
+        self.features = features
+        self.owners = np.asarray(owners, dtype=np.int64)[order] if len(order) else np.empty(0, dtype=np.int64)
+        self.starts = offsets[:-1][order]
+        self.ends = offsets[1:][order]
+        self.levels = _build_tree(boxes[order], capacity) if len(order) else []
+
+        self.x1, self.y1, self.x2, self.y2 = (edges[:, k].copy() for k in range(4))
+        dy = self.y2 - self.y1
+        # Las aristas horizontales nunca cruzan el rayo (ver _contains); pendiente 0
+        self.slope = np.divide(self.x2 - self.x1, dy, out=np.zeros_like(dy), where=dy != 0)
+
+    def candidates(self, lng, lat):
+        """Pares (punto, parte) cuya caja contiene el punto"""
+        if not self.levels:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        top = len(self.levels[0][0])
+        points = np.repeat(np.arange(len(lng)), top)
+        nodes = np.tile(np.arange(top), len(lng))
+        for depth, (boxes, starts, ends) in enumerate(self.levels):
+            box = boxes[nodes]
+            px, py = lng[points], lat[points]
+            inside = (box[:, 0] <= px) & (px <= box[:, 2]) & (box[:, 1] <= py) & (py <= box[:, 3])
+            points, nodes = points[inside], nodes[inside]
+            if depth == len(self.levels) - 1:
+                break
+            # Expandir cada nodo a su rango de hijos en el nivel inferior
+            first, count = starts[nodes], ends[nodes] - starts[nodes]
+            points = np.repeat(points, count)
+            nodes = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+        return points, nodes
+
+    def contains(self, part, px, py):
+        """Ray casting par-impar de los puntos (px, py) contra una parte"""
+        edges = slice(self.starts[part], self.ends[part])
+        x1, y1, y2, slope = self.x1[edges], self.y1[edges], self.y2[edges], self.slope[edges]
+        inside = np.zeros(len(px), dtype=bool)
+        step = max(1, MAX_CELLS // max(1, len(x1)))
+        for i in range(0, len(px), step):
+            qx, qy = px[i:i + step, None], py[i:i + step, None]
+            crosses = ((y1 > qy) != (y2 > qy)) & (qx < x1 + (qy - y1) * slope)
+            inside[i:i + step] = np.count_nonzero(crosses, axis=1) % 2 == 1
+        return inside
+
+
+class PolygonLocator:
+    """Índice punto-en-polígono de una colección de features"""
+
+    def __init__(self, capacity=NODE_CAPACITY):
+        self.capacity = capacity
+        self.version = None
+        self._index = _Index([], capacity)
+
+    def __len__(self):
+        return len(self._index.features)
+
+    def build(self, features, version=None):
+        """Prepara los polígonos de features (los que no son Polygon/MultiPolygon se ignoran)"""
+        self._index = _Index(list(features), self.capacity)
+        self.version = version
+
+    def locate(self, lnglat):
+        """
+        Features que contienen cada punto [lng, lat] de lnglat, en el orden de
+        la colección: una lista por punto
+        """
+        index = self._index  # una sola lectura: build() puede sustituirlo en paralelo
+        lnglat = np.asarray(lnglat, dtype=np.float64).reshape(-1, 2)
+        lng, lat = lnglat[:, 0], lnglat[:, 1]
+        points, parts = index.candidates(lng, lat)
+
+        hits = set()
+        order = np.argsort(parts, kind='stable')
+        points, parts = points[order], parts[order]
+        bounds = np.flatnonzero(np.diff(parts)) + 1
+        for group_points, part in zip(np.split(points, bounds), parts[np.r_[0, bounds]] if len(parts) else []):
+            inside = index.contains(part, lng[group_points], lat[group_points])
+            owner = int(index.owners[part])
+            hits.update((int(p), owner) for p in group_points[inside])
+
+        results = [[] for _ in range(len(lnglat))]
+        for point, owner in sorted(hits):
+            results[point].append(index.features[owner])
+        return results
+
+    def locate_one(self, lng, lat):
+        """Features que contienen (lng, lat)"""
+        return self.locate([[lng, lat]])[0]
@@ -0,0 +1,229 @@
+"""
+Nivel de detalle (LOD) de los polígonos que se sirven al mapa
+
+A zoom bajo un polígono con miles de vértices ocupa unos pocos píxeles: se
+simplifica con Douglas–Peucker en coordenadas Web Mercator, con una
+tolerancia de medio píxel de la banda de zoom pedida (ver ZOOM_BANDS). A
+partir de MAX_BAND + 1 se sirve la resolución completa.
+
+Douglas–Peucker se ejecuta una sola vez por anillo: cada vértice guarda su
+"importancia" (la distancia con la que la recursión lo seleccionó, limitada
+por la de su padre para que las simplificaciones queden anidadas), así que
+la versión de cualquier banda es un filtro importancia > tolerancia.
+LevelOfDetail guarda esas importancias por feature y solo calcula las de
+los features nuevos (p. ej. los polígonos ML de una generación nueva).
+
+Formato compacto (?format=polyline): cada anillo se codifica como una cadena
+"encoded polyline" (algoritmo de Google) con 6 decimales: enteros en deltas,
+en zigzag y en grupos de 5 bits como caracteres ASCII. El orden de cada
+posición es [lat, lng], como en cualquier decodificador de polylines.
+"""
+import threading
+
+import numpy as np
+
+from heatmap_tiles import mercator
+from point_store import ring_coords
+
+# Bandas de zoom precalculadas; una petición usa la banda más pequeña >= zoom
+ZOOM_BANDS = (4, 6, 8, 10, 12, 14)
+MAX_BAND = ZOOM_BANDS[-1]
+TILE_SIZE = 256
+
+POLYLINE_PRECISION = 6
+ENCODING = f"polyline{POLYLINE_PRECISION}"
+
+
+def band_for_zoom(zoom):
+    """Banda de zoom para un nivel de zoom del mapa (None = resolución completa)"""
+    for band in ZOOM_BANDS:
+        if zoom <= band:
+            return band
+    return None
+
+
+def tolerance(band):
+    """Medio píxel de la banda, en coordenadas Web Mercator normalizadas [0, 1)"""
+    return 0.5 / (TILE_SIZE * 2 ** band)
+
+
+def _segment_distances(xy, i, j):
+    """Distancias de los puntos i+1..j-1 al segmento i-j"""
+    points = xy[i + 1:j] - xy[i]
+    segment = xy[j] - xy[i]
+    length2 = segment @ segment
+    if length2 > 0:
+        t = np.clip(points @ segment / length2, 0.0, 1.0)
+        points = points - t[:, None] * segment
+    return np.sqrt(np.einsum('ij,ij->i', points, points))
+
+
+def _douglas_peucker(xy, importance, start, end, floor):
+    """Importancias de los vértices entre start y end (exclusivos)"""
+    stack = [(start, end, np.inf)]
+    while stack:
+        i, j, parent = stack.pop()
+        if j <= i + 1:
+            continue
+        distances = _segment_distances(xy, i, j)
+        k = int(np.argmax(distances))
+        # Por debajo de la banda más fina el vértice solo se usa a resolución completa
+        if distances[k] <= floor:
+            continue
+        m = i + 1 + k
+        value = min(distances[k], parent)
+        importance[m] = value
+        stack.append((i, m, value))
+        stack.append((m, j, value))
+
+
+def ring_importance(ring):
+    """
+    (posiciones, importancias) de un anillo. Los extremos (y, en un anillo
+    cerrado, el vértice más alejado del primero) tienen importancia infinita
+    """
+    coords = ring_coords(ring)
+    n = len(coords)
+    importance = np.zeros(n)
+    if n == 0:
+        return coords, importance
+    x, y = mercator(coords)
+    xy = np.column_stack((x, y))
+    importance[0] = importance[-1] = np.inf
+    floor = tolerance(MAX_BAND)
+    if n > 2 and np.array_equal(coords[0], coords[-1]):
+        # Anillo cerrado: se parte en el vértice más lejano del primero
+        far = int(np.argmax(np.einsum('ij,ij->i', xy - xy[0], xy - xy[0])))
+        importance[far] = np.inf
+        _douglas_peucker(xy, importance, 0, far, floor)
+        _douglas_peucker(xy, importance, far, n - 1, floor)
+    else:
+        _douglas_peucker(xy, importance, 0, n - 1, floor)
+    return coords, importance
+
+
+def _simplify_ring(entry, tol, exterior):
+    coords, importance = entry
+    keep = importance > tol
+    if len(coords) >= 4 and keep.sum() < 4:
+        if not exterior:
+            return None  # el hueco es más pequeño que medio píxel
+        # Triángulo mínimo: se añade el vértice más importante restante
+        candidates = np.where(keep, -1.0, importance)
+        keep[int(np.argmax(candidates))] = True
+    return coords[keep].tolist()
+
+
+def _geometry_importance(geometry):
+    geom_type = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+    if geom_type == "Polygon":
+        return [ring_importance(ring) for ring in coordinates]
+    if geom_type == "MultiPolygon":
+        return [[ring_importance(ring) for ring in polygon] for polygon in coordinates]
+    return None
+
+
+def _simplify_polygon(entries, tol):
+    rings = []
+    for r, entry in enumerate(entries):
+        ring = _simplify_ring(entry, tol, exterior=(r == 0))
+        if ring is not None:
+            rings.append(ring)
+        elif r == 0:
+            return None
+    return rings
+
+
+class LevelOfDetail:
+    """Importancias de Douglas–Peucker por feature, calculadas una sola vez"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _importance(self, feature):
+        # Los features publicados son inmutables: la identidad del objeto basta
+        entry = self._entries.get(id(feature))
+        if entry is None or entry[0] is not feature:
+            entry = (feature, _geometry_importance(feature.get("geometry") or {}))
+            self._entries[id(feature)] = entry
+        return entry[1]
+
+    def sync(self, features):
+        """Descarta las importancias de features que ya no están en la colección"""
+        with self._lock:
+            current = {id(f) for f in features}
+            self._entries = {key: entry for key, entry in self._entries.items() if key in current}
+
+    def simplify(self, features, band):
+        """Copias de los features simplificadas para la banda (None = sin simplificar)"""
+        if band is None:
+            return features
+        tol = tolerance(band)
+        simplified = []
+        with self._lock:
+            importances = [self._importance(f) for f in features]
+        for feature, entries in zip(features, importances):
+            if entries is None:
+                simplified.append(feature)
+                continue
+            geometry = feature["geometry"]
+            if geometry["type"] == "Polygon":
+                coordinates = _simplify_polygon(entries, tol)
+            else:
+                coordinates = [p for p in (_simplify_polygon(e, tol) for e in entries) if p is not None]
+            if coordinates:
+                simplified.append(dict(feature, geometry=dict(geometry, coordinates=coordinates)))
+        return simplified
+
+
+def encode_polyline(coords, precision=POLYLINE_PRECISION):
+    """Cadena encoded polyline de una secuencia de posiciones [lng, lat]"""
+    arr = ring_coords(coords)
+    if not len(arr):
+        return ""
+    ints = np.round(arr[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=0).ravel()
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    # Hasta 7 grupos de 5 bits por valor (35 bits, suficiente para 1e6 * 360 en zigzag)
+    shifts = 5 * np.arange(7)
+    groups = (zigzag[:, None] >> shifts) & 31
+    lengths = np.maximum(1, (zigzag[:, None] >> shifts > 0).sum(axis=1))
+    used = np.arange(7) < lengths[:, None]
+    more = np.arange(7) < (lengths - 1)[:, None]
+    chars = groups + 0x20 * more + 63
+    return chars[used].astype(np.uint8).tobytes().decode('ascii')
+
+
+def decode_polyline(text, precision=POLYLINE_PRECISION):
+    """Posiciones [lng, lat] de una cadena encoded polyline"""
+    values, current, shift = [], 0, 0
+    for char in text.encode('ascii'):
+        chunk = char - 63
+        current |= (chunk & 31) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(current >> 1) if current & 1 else current >> 1)
+            current, shift = 0, 0
+    latlng = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return latlng[:, ::-1].tolist()
+
+
+def encode_geometry(geometry):
+    geom_type = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+    if geom_type == "Polygon":
+        return dict(geometry, coordinates=[encode_polyline(ring) for ring in coordinates])
+    if geom_type == "MultiPolygon":
+        return dict(geometry, coordinates=[[encode_polyline(ring) for ring in polygon] for polygon in coordinates])
+    if geom_type == "LineString":
+        return dict(geometry, coordinates=encode_polyline(coordinates))
+    return geometry
+
+
+def encode_collection(collection):
+    """FeatureCollection con los anillos de cada polígono como encoded polylines"""
+    features = [dict(f, geometry=encode_geometry(f["geometry"])) if f.get("geometry") else f
+                for f in collection.get("features", [])]
+    return dict(collection, encoding=ENCODING, features=features)
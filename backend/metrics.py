@@ -0,0 +1,227 @@
+"""
+Métricas de rendimiento en memoria, expuestas en formato de texto Prometheus
+
+- Counter: total acumulado (puntos ingeridos, ejecuciones de clustering, ...)
+- Gauge: valor actual (puntos, clusters, puntos de ruido)
+- Histogram: distribución de latencias en cubetas fijas, con suma y conteo
+
+Cada métrica admite etiquetas (p. ej. stage="dbscan"). Registrar una muestra
+es una suma bajo un cerrojo, sin E/S, así que se puede llamar en el camino
+caliente de las peticiones. render() produce el texto de /api/metrics.
+
+En modo multi-proceso cada worker tiene sus propias métricas; Prometheus las
+distingue por instancia.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Cubetas de latencia en segundos (de 1 ms a 30 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Un contador solo puede aumentar")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Conteos por cubeta (la última es +Inf), suma y conteo total
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Registra la duración del bloque with (también si lanza una excepción)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self, **labels):
+        """(conteo, suma) de las observaciones con esas etiquetas"""
+        state = self._values.get(self._key(labels))
+        return (state[2], state[1]) if state else (0, 0.0)
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {repr(float(total))}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+    def render(self):
+        # Copia de los conteos bajo el cerrojo para que cada serie sea coherente
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, state in items:
+            lines.extend(self._render_sample(key, state))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Todas las métricas en formato de exposición de texto de Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'earthbloom_http_request_seconds', 'Latencia de las peticiones HTTP por endpoint',
+    ('endpoint', 'method', 'status'))
+STAGE_SECONDS = REGISTRY.histogram(
+    'earthbloom_stage_seconds', 'Duración de las etapas del pipeline de clustering', ('stage',))
+
+POINTS_INGESTED = REGISTRY.counter(
+    'earthbloom_points_ingested_total', 'Puntos de usuario aceptados')
+POINTS_MERGED = REGISTRY.counter(
+    'earthbloom_points_merged_total', 'Puntos de usuario fusionados con un punto existente al deduplicar')
+POINTS_REJECTED = REGISTRY.counter(
+    'earthbloom_points_rejected_total', 'Puntos de usuario rechazados por validación')
+CLUSTERING_RUNS = REGISTRY.counter(
+    'earthbloom_clustering_runs_total', 'Ejecuciones de clustering por modo (full, incremental, manual, partition)', ('mode',))
+
+POINTS = REGISTRY.gauge(
+    'earthbloom_points', 'Puntos de entrada del clustering por fuente', ('source',))
+CLUSTERS = REGISTRY.gauge(
+    'earthbloom_clusters', 'Clusters encontrados en el último clustering')
+NOISE_POINTS = REGISTRY.gauge(
+    'earthbloom_noise_points', 'Puntos de ruido en el último clustering')
+ML_POLYGONS = REGISTRY.gauge(
+    'earthbloom_ml_polygons', 'Polígonos ML publicados')
+
+LOAD_PROGRESS = REGISTRY.gauge(
+    'earthbloom_load_progress_ratio', 'Fracción leída del GeoJSON en carga (0 a 1)', ('file',))
+LOAD_FEATURES = REGISTRY.gauge(
+    'earthbloom_load_features', 'Features decodificados del GeoJSON en carga', ('file',))
+
+
+def stage(name):
+    """Context manager que mide una etapa del pipeline: with metrics.stage('dbscan'): ..."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def render():
+    return REGISTRY.render()
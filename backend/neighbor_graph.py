@@ -0,0 +1,126 @@
+"""
+Grafo de vecinos por radio reutilizable entre ejecuciones de DBSCAN
+
+DBSCAN dedica casi todo su tiempo a buscar las vecindades ε. Esta caché guarda
+el grafo disperso de vecinos (CSR, distancias explícitas) y lo reutiliza:
+
+- Cambiar min_samples no requiere recalcular nada
+- Un ε menor o igual se obtiene filtrando el grafo guardado
+- Si solo se añadieron puntos al final, únicamente se buscan los vecinos de
+  los puntos nuevos y se agregan de forma simétrica
+
+Con métrica 'haversine' la búsqueda usa un BallTree sobre [lat, lng] en
+radianes y el radio se expresa en km.
+"""
+import numpy as np
+
+from spatial_index import EARTH_RADIUS_KM
+
+
+def unit_vectors(lnglat):
+    """Convierte [[lng, lat], ...] en grados a vectores unitarios 3D"""
+    lnglat = np.radians(np.asarray(lnglat, dtype=np.float64).reshape(-1, 2))
+    lng, lat = lnglat[:, 0], lnglat[:, 1]
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def chord_length(distance_km):
+    """Distancia euclídea 3D (esfera unitaria) equivalente a una distancia de gran círculo"""
+    return 2.0 * np.sin(distance_km / EARTH_RADIUS_KM / 2.0)
+
+
+class RadiusNeighborGraph:
+    def __init__(self):
+        self.metric = None
+        self.radius = None
+        self.points = None
+        self.graph = None
+
+    def get(self, lnglat, radius, metric='euclidean'):
+        """
+        Grafo CSR de vecinos a distancia ≤ radius (incluye a cada punto)
+
+        radius está en grados con métrica 'euclidean' y en km con 'haversine';
+        las distancias del grafo devuelto usan esas mismas unidades.
+        """
+        points = self._prepare(lnglat, metric)
+        search_radius = self._search_radius(radius, metric)
+        n_cached = 0 if self.points is None else len(self.points)
+
+        reusable = (self.graph is not None and metric == self.metric
+                    and search_radius <= self.radius and len(points) >= n_cached
+                    and np.array_equal(points[:n_cached], self.points))
+        if not reusable:
+            self.metric = metric
+            self.radius = search_radius
+            self.points = points
+            self.graph = self._search(points, points, search_radius)
+        elif len(points) > n_cached:
+            self._extend(points)
+
+        graph = self.graph
+        if search_radius < self.radius:
+            graph = self._filter(graph, search_radius)
+        if metric == 'haversine':
+            graph = graph.copy()
+            graph.data = graph.data * EARTH_RADIUS_KM
+        return graph
+
+    def clear(self):
+        self.metric = None
+        self.radius = None
+        self.points = None
+        self.graph = None
+
+    def _prepare(self, lnglat, metric):
+        lnglat = np.asarray(lnglat, dtype=np.float64).reshape(-1, 2)
+        if metric == 'haversine':
+            # BallTree haversine espera [lat, lng] en radianes
+            return np.radians(lnglat[:, ::-1])
+        if metric == 'euclidean':
+            return lnglat
+        raise ValueError(f"Métrica no soportada: {metric}")
+
+    def _search_radius(self, radius, metric):
+        return radius / EARTH_RADIUS_KM if metric == 'haversine' else radius
+
+    def _search(self, queries, points, radius):
+        # Importación diferida: scikit-learn solo se carga al primer clustering
+        from sklearn.neighbors import NearestNeighbors
+
+        if self.metric == 'haversine':
+            nn = NearestNeighbors(radius=radius, algorithm='ball_tree', metric='haversine')
+        else:
+            nn = NearestNeighbors(radius=radius)
+        return nn.fit(points).radius_neighbors_graph(queries, mode='distance')
+
+    def _extend(self, points):
+        """Añade al grafo los vecinos de los puntos nuevos (simétrico)"""
+        n_old, n = len(self.points), len(points)
+        rows = self._search(points[n_old:], points, self.radius).tocoo()
+        new_rows = rows.row + n_old
+
+        old = self.graph.tocoo()
+        to_old = rows.col < n_old
+        row = np.concatenate([old.row, new_rows, rows.col[to_old]])
+        col = np.concatenate([old.col, rows.col, new_rows[to_old]])
+        data = np.concatenate([old.data, rows.data, rows.data[to_old]])
+
+        self.graph = self._csr(data, row, col, n)
+        self.points = points
+
+    def _filter(self, graph, radius):
+        graph = graph.tocoo()
+        keep = graph.data <= radius
+        return self._csr(graph.data[keep], graph.row[keep], graph.col[keep], graph.shape[0])
+
+    @staticmethod
+    def _csr(data, row, col, n):
+        # Las distancias 0 (el propio punto, duplicados) deben conservarse como
+        # entradas explícitas, así que se ordena a mano en vez de sumar matrices
+        from scipy import sparse
+
+        order = np.lexsort((col, row))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(row, minlength=n))])
+        return sparse.csr_matrix((data[order], col[order], indptr), shape=(n, n))
@@ -0,0 +1,200 @@
+"""
+Clustering particionado por temporada y ventana de tiempo
+
+Cada punto del almacén columnar pertenece a una partición (temporada, ventana):
+
+- temporada: propiedad Season del feature de origen (season en los puntos de
+  usuario), sin distinguir mayúsculas; "unknown" si no tiene
+- ventana: el año, mes, semana ISO o día del timestamp del punto según
+  PARTITION_WINDOWS; None para los datos sin fecha (los polígonos originales)
+
+Cada partición se agrupa por separado y sus polígonos se guardan en caché.
+sync() asigna la partición de los puntos añadidos al almacén desde la última
+llamada e invalida solo esas particiones (invalidate() las de los puntos que
+cambiaron de peso); las demás siguen sirviéndose desde caché. Un almacén
+nuevo (re-extracción completa) o parámetros de clustering distintos
+invalidan todas.
+
+Las consultas (temporada y rango since/until) se resuelven sobre las claves
+de partición: una ventana se selecciona entera si se solapa con el rango, así
+que la resolución temporal es la de la ventana.
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from spatial_index import EARTH_RADIUS_KM
+
+PARTITION_WINDOWS = ('none', 'year', 'month', 'week', 'day')
+UNKNOWN_SEASON = "unknown"
+
+
+def parse_time(value):
+    """
+    datetime sin zona horaria de una fecha u hora ISO 8601: las horas con
+    zona se pasan a UTC y las que no la tienen se toman como UTC
+    """
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    t = datetime.fromisoformat(text)
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t
+
+
+def season_of(properties):
+    season = properties.get("Season", properties.get("season"))
+    if season is None or not str(season).strip():
+        return UNKNOWN_SEASON
+    return str(season).strip()
+
+
+def window_of(timestamp, window):
+    """Clave de la ventana que contiene timestamp ('2025-10', '2025-W41', ...)"""
+    if window == 'none' or not timestamp:
+        return None
+    try:
+        t = parse_time(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if window == 'year':
+        return f"{t.year:04d}"
+    if window == 'month':
+        return f"{t.year:04d}-{t.month:02d}"
+    if window == 'week':
+        year, week, _ = t.isocalendar()
+        return f"{year:04d}-W{week:02d}"
+    return t.date().isoformat()
+
+
+def window_bounds(key, window):
+    """Intervalo [inicio, fin) de una clave de ventana"""
+    if window == 'year':
+        start = datetime(int(key), 1, 1)
+        return start, start.replace(year=start.year + 1)
+    if window == 'month':
+        start = datetime.strptime(key, "%Y-%m")
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return start, end
+    if window == 'week':
+        start = datetime.strptime(key + "-1", "%G-W%V-%u")
+        return start, start + timedelta(weeks=1)
+    start = datetime.strptime(key, "%Y-%m-%d")
+    return start, start + timedelta(days=1)
+
+
+def cluster_partition(coords, radius, min_samples, metric, weights=None):
+    """
+    DBSCAN sobre los puntos de una partición: índices (en coords) de cada
+    cluster. radius en grados con métrica 'euclidean' y en km con 'haversine';
+    weights es el peso de cada punto (sample_weight)
+    """
+    total = len(coords) if weights is None else weights.sum()
+    if len(coords) < 3 or total < min_samples:
+        return []
+    from sklearn.cluster import DBSCAN
+
+    if metric == 'haversine':
+        labels = DBSCAN(eps=radius / EARTH_RADIUS_KM, min_samples=min_samples, metric='haversine',
+                        algorithm='ball_tree').fit_predict(np.radians(coords[:, ::-1]), sample_weight=weights)
+    else:
+        labels = DBSCAN(eps=radius, min_samples=min_samples).fit_predict(coords, sample_weight=weights)
+    clustered = np.flatnonzero(labels != -1)
+    order = clustered[np.argsort(labels[clustered], kind='stable')]
+    return np.split(order, np.flatnonzero(np.diff(labels[order])) + 1) if len(order) else []
+
+
+class PartitionCache:
+    """Claves de partición por punto y polígonos en caché por partición"""
+
+    def __init__(self, window='month'):
+        if window not in PARTITION_WINDOWS:
+            raise ValueError(f"Ventana no válida: {window} (usar {', '.join(PARTITION_WINDOWS)})")
+        self.window = window
+        self.reset()
+
+    def reset(self, store=None, params=None):
+        self.store = store
+        self.params = params
+        self.codes = np.empty(0, dtype=np.int64)  # partición de cada feature / punto de origen
+        self.keys = []                            # código -> (temporada, ventana)
+        self.seasons = []                         # código -> temporada tal como aparece en los datos
+        self._lookup = {}
+        self.polygons = {}                        # código -> features de polígonos ML
+        # Filas del almacén ordenadas por partición (y sus códigos), al día
+        # hasta la fila _rows: members() no reordena todo el almacén
+        self._order = np.empty(0, dtype=np.int64)
+        self._sorted = np.empty(0, dtype=np.int64)
+        self._rows = 0
+
+    def _code(self, properties):
+        season = season_of(properties)
+        key = (season.casefold(), window_of(properties.get("timestamp"), self.window))
+        code = self._lookup.get(key)
+        if code is None:
+            code = self._lookup[key] = len(self.keys)
+            self.keys.append(key)
+            self.seasons.append(season)
+        return code
+
+    def sync(self, store, params):
+        """
+        Asigna partición a los puntos nuevos de store e invalida solo esas
+        particiones. Devuelve el número de particiones invalidadas
+        """
+        if store is not self.store or params != self.params:
+            self.reset(store, params)
+        new = store.properties[len(self.codes):]
+        if new:
+            codes = np.fromiter((self._code(p) for p in new), dtype=np.int64, count=len(new))
+            self.codes = np.concatenate([self.codes, codes])
+        self._extend_order()
+        if not new:
+            return 0
+        stale = set(codes.tolist())
+        for code in stale:
+            self.polygons.pop(code, None)
+        return len(stale)
+
+    def _extend_order(self):
+        """Inserta en el orden por partición las filas añadidas al almacén desde la última vez"""
+        if self.store is None or len(self.store) == self._rows:
+            return
+        point_codes = self.codes[self.store.feature_idx[self._rows:]]
+        new_order = np.argsort(point_codes, kind='stable')
+        # side='right': las filas nuevas van tras las existentes de su partición
+        positions = np.searchsorted(self._sorted, point_codes[new_order], side='right')
+        self._order = np.insert(self._order, positions, new_order + self._rows)
+        self._sorted = np.insert(self._sorted, positions, point_codes[new_order])
+        self._rows = len(self.store)
+
+    def invalidate(self, store, rows):
+        """Invalida las particiones de las filas rows de store (p. ej. puntos que ganaron peso)"""
+        if store is not self.store:
+            return
+        owners = store.feature_idx[rows]
+        for code in np.unique(self.codes[owners[owners < len(self.codes)]]).tolist():
+            self.polygons.pop(code, None)
+
+    def select(self, season=None, since=None, until=None):
+        """Códigos de las particiones de la temporada cuya ventana se solapa con [since, until)"""
+        season = season.casefold() if season else None
+        selected = []
+        for code, (key_season, window) in enumerate(self.keys):
+            if season is not None and key_season != season:
+                continue
+            if since is not None or until is not None:
+                if window is None:
+                    continue  # sin fecha: solo cuando no se filtra por tiempo
+                start, end = window_bounds(window, self.window)
+                if (since is not None and end <= since) or (until is not None and start >= until):
+                    continue
+            selected.append(code)
+        return selected
+
+    def members(self, codes):
+        """Filas del almacén de cada partición de codes (orden mantenido por sync())"""
+        self._extend_order()
+        bounds = np.searchsorted(self._sorted, [codes, np.asarray(codes) + 1])
+        return {code: self._order[start:end] for code, start, end in zip(codes, *bounds)}
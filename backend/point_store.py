@@ -0,0 +1,207 @@
+"""
+Almacén columnar de los puntos que alimentan el clustering
+
+En lugar de un dict por vértice (con una referencia a las propiedades completas
+del feature), los puntos se guardan en arrays NumPy contiguos:
+
+- coords:      float64 (n, 2) con [lng, lat]
+- feature_idx: int32, índice en `properties` del feature o punto de origen
+- source:      uint8, código de fuente (ver SOURCES)
+- weights:     int64, reportes que representa cada punto (1 salvo los
+  puntos de usuario que absorbieron duplicados, ver dedup)
+
+DBSCAN, las envolventes y las estadísticas de cada cluster trabajan
+directamente sobre estos arrays. Las propiedades se guardan una sola vez por
+feature de origen, no una vez por vértice.
+"""
+import numpy as np
+
+from dedup import point_weight
+
+SOURCES = ("combined_polygon", "combined_multipolygon", "user")
+SOURCE_CODES = {name: code for code, name in enumerate(SOURCES)}
+USER = SOURCE_CODES["user"]
+
+
+def ring_coords(ring):
+    """Array (k, 2) con las posiciones válidas (al menos lng, lat) de un anillo"""
+    try:
+        arr = np.asarray(ring, dtype=np.float64)
+        if arr.ndim == 2 and arr.shape[1] >= 2:
+            return arr[:, :2]
+    except (TypeError, ValueError):
+        pass
+    return np.asarray([c[:2] for c in ring if len(c) >= 2], dtype=np.float64).reshape(-1, 2)
+
+
+class PointStore:
+    def __init__(self, capacity=0):
+        self.n = 0
+        self.properties = []
+        self._coords = np.empty((capacity, 2), dtype=np.float64)
+        self._feature_idx = np.empty(capacity, dtype=np.int32)
+        self._source = np.empty(capacity, dtype=np.uint8)
+        self._weights = np.empty(capacity, dtype=np.int64)
+        # (id, timestamp) de cada punto de usuario -> su fila
+        self.user_rows = {}
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def coords(self):
+        return self._coords[:self.n]
+
+    @property
+    def feature_idx(self):
+        return self._feature_idx[:self.n]
+
+    @property
+    def source(self):
+        return self._source[:self.n]
+
+    @property
+    def weights(self):
+        return self._weights[:self.n]
+
+    @classmethod
+    def from_data(cls, features, user_points):
+        """
+        Construye el almacén desde los features de la base combinada y los
+        puntos de usuario. Los polígonos generados por ML se excluyen: son el
+        resultado del clustering, no una entrada.
+        """
+        builder = PointStoreBuilder()
+        for feature in features:
+            builder.add_feature(feature)
+        builder.add_user_points(user_points)
+        return builder.build()
+
+    def append(self, lng, lat, source, properties, weight=1):
+        """Añade un punto con sus propiedades y devuelve su índice"""
+        i = self.n
+        if i == len(self._coords):
+            capacity = max(64, 2 * i)
+            self._coords = np.resize(self._coords, (capacity, 2))
+            self._feature_idx = np.resize(self._feature_idx, capacity)
+            self._source = np.resize(self._source, capacity)
+            self._weights = np.resize(self._weights, capacity)
+        self._coords[i] = (lng, lat)
+        self._feature_idx[i] = len(self.properties)
+        self._source[i] = SOURCE_CODES[source]
+        self._weights[i] = weight
+        self.properties.append(properties)
+        if source == "user":
+            self.user_rows[user_key(properties)] = i
+        self.n = i + 1
+        return i
+
+    def update_user_point(self, row, point):
+        """Sustituye el punto de usuario de la fila row (misma posición) y su peso"""
+        self.properties[self._feature_idx[row]] = point
+        self._weights[row] = point_weight(point)
+
+    def source_counts(self):
+        """Número de puntos por fuente"""
+        counts = np.bincount(self.source, minlength=len(SOURCES))
+        return {name: int(counts[code]) for code, name in enumerate(SOURCES)}
+
+    def cluster_stats(self, indices):
+        """
+        Estadísticas de procedencia de un cluster a partir de sus índices:
+        fuentes presentes, número de puntos de usuario y sitios originales
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return provenance(self._source[indices], self._feature_idx[indices], self.site_of)
+
+    def site_of(self, idx):
+        """Nombre del sitio (propiedad Site) del feature de origen idx"""
+        return self.properties[idx].get("Site")
+
+
+def user_key(point):
+    """Clave de un punto de usuario: (id, timestamp), igual que al reproducir el log"""
+    return point.get("id"), point.get("timestamp")
+
+
+def provenance(source, feature_idx, site_of):
+    """
+    Estadísticas de procedencia de los puntos (source, feature_idx) de un
+    cluster; site_of(idx) da el sitio de un feature de origen
+    """
+    counts = np.bincount(source, minlength=len(SOURCES))
+
+    sites = set()
+    for idx in np.unique(feature_idx[source != USER]).tolist():
+        site = site_of(idx)
+        if site:
+            sites.add(site)
+
+    return {
+        "sources": [SOURCES[code] for code in np.flatnonzero(counts)],
+        "user_count": int(counts[USER]),
+        "original_polygons": sorted(sites)
+    }
+
+
+class PointStoreBuilder:
+    """
+    Construye un PointStore feature a feature (p. ej. mientras se lee un
+    GeoJSON en streaming); los arrays se concatenan una sola vez en build()
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.owners = []
+        self.sources = []
+        self.weights = []
+        self.properties = []
+        self.user_rows = {}
+
+    def add_feature(self, feature):
+        geometry = feature.get("geometry") or {}
+        feature_props = feature.get("properties") or {}
+        if feature_props.get("generated_auto", False):
+            return
+
+        geom_type = geometry.get("type")
+        if geom_type == "Polygon":
+            rings = geometry.get("coordinates", [])
+        elif geom_type == "MultiPolygon":
+            rings = [ring for polygon in geometry.get("coordinates", []) for ring in polygon]
+        else:
+            return
+
+        coords = [ring_coords(ring) for ring in rings]
+        count = sum(len(c) for c in coords)
+        if not count:
+            return
+        self.blocks.extend(coords)
+        self.owners.append(np.full(count, len(self.properties), dtype=np.int32))
+        self.sources.append(np.full(count, SOURCE_CODES["combined_" + geom_type.lower()], dtype=np.uint8))
+        self.weights.append(np.ones(count, dtype=np.int64))
+        self.properties.append(feature_props)
+
+    def add_user_points(self, user_points):
+        users = [p for p in user_points if p.get("lng") is not None and p.get("lat") is not None]
+        if users:
+            start = len(self.properties)
+            self.blocks.append(np.array([[p["lng"], p["lat"]] for p in users], dtype=np.float64))
+            self.owners.append(np.arange(start, start + len(users), dtype=np.int32))
+            self.sources.append(np.full(len(users), USER, dtype=np.uint8))
+            self.weights.append(np.array([point_weight(p) for p in users], dtype=np.int64))
+            first_row = sum(len(block) for block in self.blocks[:-1])
+            self.user_rows.update((user_key(p), first_row + k) for k, p in enumerate(users))
+            self.properties.extend(users)
+
+    def build(self):
+        store = PointStore()
+        if self.blocks:
+            store._coords = np.concatenate(self.blocks)
+            store._feature_idx = np.concatenate(self.owners)
+            store._source = np.concatenate(self.sources)
+            store._weights = np.concatenate(self.weights)
+            store.n = len(store._coords)
+        store.properties = self.properties
+        store.user_rows = self.user_rows
+        return store
@@ -0,0 +1,125 @@
+"""
+Construcción de los polígonos ML de un clustering en paralelo
+
+Por cada cluster hace falta su envolvente (convexa o cóncava), su área
+geodésica y su procedencia (fuentes, puntos de usuario, sitios originales).
+Cada cluster es independiente, así que los clusters se reparten en bloques
+de chunk_size clusters entre los workers de un pool:
+
+- 'process': ProcessPoolExecutor, usa todos los núcleos (las envolventes
+  tienen bucles en Python que no sueltan el GIL)
+- 'thread': ThreadPoolExecutor, sin coste de arranque ni de copia
+- 'serial': todo en el hilo que llama
+
+Cada bloque viaja como arrays planos (coordenadas, fuente y feature de origen
+de sus puntos, más los nombres de sitio que referencian), no como el
+PointStore completo. executor.map conserva el orden de los bloques, así que
+el resultado no depende del número de workers ni del orden en que terminan.
+Con un solo bloque o un solo worker no se usa el pool.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import geometry
+from point_store import USER, provenance
+
+POOL_KINDS = ('process', 'thread', 'serial')
+
+
+def cluster_hull(coords, mode='convex', radius=None):
+    """Envolvente de los puntos de un cluster ('convex' o 'concave' con radius en grados)"""
+    if len(coords) < 3:
+        return None
+    if mode == 'concave':
+        return geometry.concave_hull(coords, radius)
+    return geometry.convex_hull(coords)
+
+
+def build_chunk(task):
+    """
+    (envolvente, área, procedencia, error) de cada cluster de un bloque
+
+    task es (modo, radio, coords, source, feature_idx, offsets, sites): los
+    puntos del cluster k son las filas offsets[k]:offsets[k+1]. Un cluster
+    sin envolvente válida (menos de 3 puntos, colineal) da envolvente None;
+    un error en la envolvente se devuelve como texto para registrarlo
+    """
+    mode, radius, coords, source, feature_idx, offsets, sites = task
+    results = []
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        hull, error = None, None
+        try:
+            hull = cluster_hull(coords[start:end], mode, radius)
+        except Exception as e:
+            error = str(e)
+        if not hull or len(hull) < 4:
+            results.append([None, 0.0, None, error])
+            continue
+        stats = provenance(source[start:end], feature_idx[start:end], sites.get)
+        results.append([hull, 0.0, stats, None])
+
+    # Áreas de todas las envolventes del bloque en una sola llamada
+    built = [r for r in results if r[0] is not None]
+    areas, _ = geometry.polygon_stats([[r[0]] for r in built])
+    for r, area in zip(built, areas.tolist()):
+        r[1] = area
+    return [tuple(r) for r in results]
+
+
+class PolygonPipeline:
+    """Pool (creado en el primer uso) que construye los polígonos de muchos clusters"""
+
+    def __init__(self, kind='process', workers=0, chunk_size=128):
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Tipo de pool no válido: {kind} (usar {', '.join(POOL_KINDS)})")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == 'process':
+                    # forkserver: los workers no heredan los hilos ni los cerrojos del servidor
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    context = multiprocessing.get_context(method)
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+                else:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='polygon-worker')
+            return self._executor
+
+    def close(self):
+        """Detiene los workers (se vuelven a crear si se construyen más polígonos)"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def _task(self, store, clusters, mode, radius):
+        indices = np.concatenate(clusters) if clusters else np.empty(0, dtype=np.int64)
+        offsets = np.zeros(len(clusters) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in clusters], out=offsets[1:])
+        source = store.source[indices]
+        feature_idx = store.feature_idx[indices]
+        sites = {idx: store.site_of(idx) for idx in np.unique(feature_idx[source != USER]).tolist()}
+        return mode, radius, store.coords[indices], source, feature_idx, offsets, sites
+
+    def build(self, store, clusters, mode='convex', radius=None):
+        """
+        (envolvente, área, procedencia, error) de cada cluster, en el orden
+        de clusters (listas de índices de filas de store)
+        """
+        clusters = [np.asarray(c, dtype=np.int64) for c in clusters]
+        tasks = [self._task(store, clusters[i:i + self.chunk_size], mode, radius)
+                 for i in range(0, len(clusters), self.chunk_size)]
+        if self.kind == 'serial' or self.workers == 1 or len(tasks) <= 1:
+            chunks = map(build_chunk, tasks)
+        else:
+            chunks = self.executor().map(build_chunk, tasks)
+        return [result for chunk in chunks for result in chunk]
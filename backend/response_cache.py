@@ -0,0 +1,140 @@
+"""
+Caché versionada de respuestas JSON serializadas
+
+Los endpoints de lectura (/api/combined-data, /api/ml-polygons, ...) solo
+cambian cuando hay una mutación (puntos nuevos, clustering, reset). En vez de
+volver a recorrer los features y serializar con jsonify en cada GET, cada
+cuerpo se guarda ya serializado junto con la generación de datos con la que
+se construyó; cualquier mutación aumenta esa generación y la entrada se
+reconstruye en la siguiente petición.
+
+Por entrada se guardan:
+- el cuerpo JSON en bytes y un ETag fuerte (hash del contenido)
+- las variantes gzip y brotli (esta última solo si el paquete `brotli` está
+  instalado), comprimidas una sola vez y bajo demanda
+
+Un If-None-Match que coincide con el ETag se responde con 304 sin cuerpo, así
+que el polling del mapa apenas cuesta una comparación de cadenas.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Por debajo de este tamaño comprimir no compensa
+MIN_COMPRESS_SIZE = 1024
+
+
+class CachedBody:
+    def __init__(self, version, body, mimetype='application/json'):
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        # Las imágenes ya vienen comprimidas
+        self.compressible = not mimetype.startswith('image/')
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """Cuerpo comprimido con encoding ('gzip' o 'br'), calculado una sola vez"""
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == 'br':
+                    data = brotli.compress(self.body, quality=5)
+                else:
+                    data = gzip.compress(self.body, compresslevel=6, mtime=0)
+                self._encoded[encoding] = data
+            return data
+
+    def representation_etag(self, encoding):
+        # Un ETag fuerte identifica bytes exactos: cada codificación lleva el suyo
+        return f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+
+    def matches(self, if_none_match):
+        """True si alguna etiqueta de If-None-Match corresponde a este contenido"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag.strip('"').split('-', 1)[0] == self.etag:
+                return True
+        return False
+
+
+class ResponseCache:
+    def __init__(self, max_entries=None):
+        """max_entries limita el número de entradas (se descartan las menos usadas)"""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build, mimetype='application/json'):
+        """
+        Devuelve el CachedBody de key para la generación version
+
+        build() se llama solo si la entrada no existe o es de otra generación y
+        debe devolver el cuerpo serializado en bytes
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry
+
+        body = build()
+        entry = CachedBody(version, body, mimetype)
+        with self._lock:
+            self.misses += 1
+            current = self._entries.get(key)
+            # No pisar una entrada más nueva construida por otra petición
+            if current is None or current.version <= version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def respond(self, entry, request):
+        """Response de Flask para entry: 304, o el cuerpo en la mejor codificación aceptada"""
+        encoding = None
+        if entry.compressible and len(entry.body) >= MIN_COMPRESS_SIZE:
+            accepted = request.accept_encodings
+            if brotli is not None and accepted['br']:
+                encoding = 'br'
+            elif accepted['gzip']:
+                encoding = 'gzip'
+
+        headers = {
+            'ETag': entry.representation_etag(encoding),
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding'
+        }
+
+        if entry.matches(request.headers.get('If-None-Match')):
+            return Response(status=304, headers=headers)
+
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            return Response(entry.encoded(encoding), mimetype=entry.mimetype, headers=headers)
+        return Response(entry.body, mimetype=entry.mimetype, headers=headers)
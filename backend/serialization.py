@@ -0,0 +1,142 @@
+"""
+Serialización JSON rápida para los GeoJSON grandes
+
+- dumps: bytes JSON compactos. Usa orjson si está instalado (varias veces más
+  rápido que json y produce bytes directamente) y si no, json de la
+  biblioteca estándar con separadores compactos
+- quantize_features: redondea las coordenadas de las geometrías a `precision`
+  decimales (6 decimales ≈ 11 cm), sin modificar los datos originales
+- iter_feature_collection: codifica un FeatureCollection feature a feature y
+  entrega bloques de ~chunk_size bytes, para responder exportaciones en
+  streaming sin armar el documento completo ni escribir archivos temporales
+- JSONProvider: proveedor de Flask que usa el mismo codificador para jsonify
+
+EARTHBLOOM_FAST_JSON=0 desactiva orjson aunque esté instalado.
+"""
+import json
+import os
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if os.environ.get('EARTHBLOOM_FAST_JSON', '1') == '0':
+    orjson = None
+
+# Tamaño aproximado de cada bloque de una exportación en streaming
+CHUNK_SIZE = 64 * 1024
+
+
+def _default(obj):
+    """Tipos NumPy que pueden quedar en propiedades o coordenadas"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (tuple, set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Objeto de tipo {type(obj).__name__} no serializable a JSON")
+
+
+def dumps(data, pretty=False, sort_keys=False):
+    """JSON en bytes UTF-8 (compacto salvo pretty=True)"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(data, default=_default, option=option)
+    if pretty:
+        text = json.dumps(data, indent=2, ensure_ascii=False, sort_keys=sort_keys, default=_default)
+    else:
+        text = json.dumps(data, separators=(',', ':'), ensure_ascii=False, sort_keys=sort_keys, default=_default)
+    return text.encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def quantize_coordinates(coordinates, precision):
+    """Coordenadas GeoJSON (de cualquier profundidad) redondeadas a precision decimales"""
+    try:
+        arr = np.asarray(coordinates, dtype=np.float64)
+    except (TypeError, ValueError):
+        # Anillos de distinta longitud: redondear cada parte por separado
+        return [quantize_coordinates(part, precision) for part in coordinates]
+    return np.round(arr, precision).tolist()
+
+
+def quantize_geometry(geometry, precision):
+    if not geometry:
+        return geometry
+    if geometry.get("type") == "GeometryCollection":
+        return dict(geometry, geometries=[quantize_geometry(g, precision) for g in geometry.get("geometries", [])])
+    if "coordinates" not in geometry:
+        return geometry
+    return dict(geometry, coordinates=quantize_coordinates(geometry["coordinates"], precision))
+
+
+def quantize_feature(feature, precision):
+    """Copia del feature con la geometría redondeada (None = sin cambios)"""
+    if precision is None or not feature.get("geometry"):
+        return feature
+    return dict(feature, geometry=quantize_geometry(feature["geometry"], precision))
+
+
+def quantize_features(collection, precision):
+    """Copia del FeatureCollection con todas las geometrías redondeadas"""
+    if precision is None:
+        return collection
+    return dict(collection, features=[quantize_feature(f, precision) for f in collection.get("features", [])])
+
+
+def iter_feature_collection(collection, precision=None, chunk_size=CHUNK_SIZE):
+    """
+    Bloques de bytes de un FeatureCollection serializado feature a feature
+
+    Las claves de primer nivel distintas de "features" (type, name, crs, ...)
+    se conservan. Cada feature se cuantiza y codifica por separado, así que
+    la memoria extra no depende del tamaño de la colección
+    """
+    head = {key: value for key, value in collection.items() if key != "features"}
+    head.setdefault("type", "FeatureCollection")
+    prefix = dumps(head)
+    buffer = bytearray(prefix[:-1])
+    buffer += b',"features":[' if len(prefix) > 2 else b'"features":['
+
+    for i, feature in enumerate(collection.get("features", [])):
+        if i:
+            buffer += b','
+        buffer += dumps(quantize_feature(feature, precision))
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    buffer += b']}'
+    yield bytes(buffer)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask (jsonify, request.json) con el codificador rápido"""
+
+    def dumps(self, obj, **kwargs):
+        # response() solo pide separadores compactos o indent=2 (modo debug)
+        options = set(kwargs) - {"separators", "indent"}
+        if orjson is None or options or kwargs.get("indent") not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, pretty="indent" in kwargs, sort_keys=self.sort_keys).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
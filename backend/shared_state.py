@@ -0,0 +1,245 @@
+"""
+Estado compartido entre hilos y entre procesos
+
+Dentro de un proceso:
+- PublishedData: snapshot inmutable de los datos de lectura. Los escritores
+  construyen estructuras nuevas (copy-on-write) y sustituyen la referencia de
+  una sola vez, así que un lector que toma `ml_system.published` ve siempre un
+  estado completo y coherente, sin bloquear
+- RWLock: lectores concurrentes / un escritor, para las estructuras que se
+  actualizan en el sitio (índice espacial)
+
+Entre procesos (varios workers de gunicorn):
+- SharedSnapshot publica los cuerpos JSON ya serializados, uno por archivo,
+  que los demás procesos mapean en memoria (mmap), junto con un número de
+  generación de 8 bytes también mapeado. Un índice pequeño dice qué archivo
+  tiene cada cuerpo: una publicación solo escribe los cuerpos que cambiaron y
+  el resto sigue apuntando a sus archivos anteriores. Un lector solo compara
+  la generación con la suya y, si cambió, vuelve a mapear los archivos
+  nuevos: las lecturas escalan con los núcleos sin que cada worker recalcule
+  nada
+- writer_lock() es el cerrojo de escritor único entre procesos (flock)
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin modo multi-proceso
+    fcntl = None
+
+PublishedData = namedtuple("PublishedData", ["generation", "combined_data", "user_points", "ml_vertices"])
+
+_HEADER = struct.Struct('<Q')
+
+
+class RWLock:
+    """Cerrojo lectores/escritor con preferencia por el escritor"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class SharedSnapshot:
+    def __init__(self, directory, prefix='shared'):
+        if fcntl is None:
+            raise RuntimeError("El modo multi-proceso requiere fcntl (POSIX)")
+        self.directory = directory
+        self.prefix = prefix
+        self.data_path = os.path.join(directory, f'{prefix}_snapshot.bin')
+        self.generation_path = os.path.join(directory, f'.{prefix}_generation')
+        self.lock_path = os.path.join(directory, f'.{prefix}.lock')
+
+        self._lock_file = None
+        self._lock_depth = 0
+        self._thread_lock = threading.RLock()
+
+        self._generation_map = None
+        # (generación, {nombre: memoryview}, {nombre: archivo}) de la última
+        # lectura: un solo atributo, así que nunca se ve una generación con
+        # los cuerpos de otra
+        self._current = (None, {}, {})
+        self._read_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Generación (8 bytes mapeados en memoria)
+    # ------------------------------------------------------------------
+    def _generation_view(self):
+        if self._generation_map is None:
+            fd = os.open(self.generation_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < _HEADER.size:
+                    os.ftruncate(fd, _HEADER.size)
+                self._generation_map = mmap.mmap(fd, _HEADER.size)
+            finally:
+                os.close(fd)
+        return self._generation_map
+
+    def generation(self):
+        """Última generación publicada por cualquier proceso (0 si ninguna)"""
+        return _HEADER.unpack_from(self._generation_view(), 0)[0]
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    @contextmanager
+    def writer_lock(self):
+        """Cerrojo exclusivo entre procesos (reentrante dentro del proceso)"""
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, 'a+b')
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def publish(self, generation, bodies):
+        """
+        Escribe los cuerpos {nombre: bytes} de la generación dada y la anuncia
+
+        Debe llamarse con writer_lock() tomado. Cada cuerpo va en su propio
+        archivo; un cuerpo None conserva el archivo de la publicación
+        anterior sin reescribirlo. El índice (nombre -> archivo) se sustituye
+        de forma atómica, así que los lectores que ya tenían mapeados los
+        archivos anteriores siguen viendo esa versión completa hasta que
+        vuelven a mapear
+        """
+        previous = self._read_index() or {}
+        files, written = {}, []
+        try:
+            for name, body in bodies.items():
+                if body is None:
+                    files[name] = previous["bodies"][name]
+                    continue
+                files[name] = f'{self.prefix}_snapshot.{name}.{generation}.bin'
+                _write_atomic(os.path.join(self.directory, files[name]), body)
+                written.append(files[name])
+            _write_atomic(self.data_path, json.dumps({"generation": generation, "bodies": files},
+                                                     separators=(',', ':')).encode('utf-8'))
+        except BaseException:
+            for filename in written:
+                _unlink(os.path.join(self.directory, filename))
+            raise
+
+        # Los archivos que ya no están en el índice siguen accesibles para
+        # quien los tenga mapeados (POSIX)
+        for filename in set(previous.get("bodies", {}).values()) - set(files.values()):
+            _unlink(os.path.join(self.directory, filename))
+
+        view = self._generation_view()
+        _HEADER.pack_into(view, 0, generation)
+        view.flush()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def _read_index(self):
+        try:
+            with open(self.data_path, 'rb') as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def read(self):
+        """
+        (generación, {nombre: memoryview}) de la última publicación, mapeando
+        de nuevo solo los archivos de los cuerpos que cambiaron
+        """
+        generation = self.generation()
+        current = self._current
+        if generation == current[0]:
+            return current[0], current[1]
+
+        with self._read_lock:
+            current = self._current
+            # Un archivo puede desaparecer si otra publicación llega entre
+            # leer el índice y mapearlo: se vuelve a leer el índice
+            for _ in range(3):
+                if generation == current[0]:
+                    break
+                index = self._read_index()
+                if index is None:
+                    return generation, {}
+                try:
+                    bodies = {name: (current[1][name] if current[2].get(name) == filename
+                                     else _map(os.path.join(self.directory, filename)))
+                              for name, filename in index["bodies"].items()}
+                except OSError:
+                    generation = self.generation()
+                    continue
+                current = self._current = (index["generation"], bodies, index["bodies"])
+                break
+        return current[0], current[1]
+
+
+def _write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        _unlink(temp_path)
+        raise
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _map(path):
+    """Contenido de un archivo mapeado en memoria (solo lectura)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
@@ -0,0 +1,145 @@
+"""
+Índice espacial en memoria para los puntos y polígonos del sistema
+
+Rejilla uniforme en grados: cada elemento se registra en todas las celdas que
+cubre su caja envolvente (un punto ocupa una sola celda). Las consultas por
+caja o por radio solo revisan las celdas que intersectan la zona pedida, de
+modo que su costo depende del tamaño del resultado y no del total de datos.
+"""
+from collections import defaultdict
+from math import asin, cos, floor, radians, sin, sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lng1, lat1, lng2, lat2):
+    """Distancia de gran círculo en km entre dos coordenadas"""
+    dlat = radians(lat2 - lat1)
+    dlng = radians(lng2 - lng1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def geometry_bbox(geometry):
+    """Caja envolvente [min_lng, min_lat, max_lng, max_lat] de una geometría GeoJSON"""
+    geom_type = geometry.get("type")
+    coords = geometry.get("coordinates", [])
+    if geom_type == "Point":
+        positions = [coords]
+    elif geom_type in ("MultiPoint", "LineString"):
+        positions = coords
+    elif geom_type in ("Polygon", "MultiLineString"):
+        positions = [c for ring in coords for c in ring]
+    elif geom_type == "MultiPolygon":
+        positions = [c for polygon in coords for ring in polygon for c in ring]
+    else:
+        return None
+
+    positions = [c for c in positions if len(c) >= 2]
+    if not positions:
+        return None
+    lngs = [c[0] for c in positions]
+    lats = [c[1] for c in positions]
+    return [min(lngs), min(lats), max(lngs), max(lats)]
+
+
+def radius_bbox(lng, lat, radius_km):
+    """Caja envolvente en grados de un círculo de radio radius_km"""
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(cos(radians(lat)), 1e-6))
+    return [lng - dlng, lat - dlat, lng + dlng, lat + dlat]
+
+
+class SpatialIndex:
+    """Rejilla uniforme de celdas con capas ("original", "ml", "user", ...)"""
+
+    def __init__(self, cell_size=0.25):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        self._cells = defaultdict(set)
+        self._entries = {}
+        self._next_key = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def insert(self, layer, bbox, item):
+        """Registra un elemento y devuelve su clave (para poder retirarlo)"""
+        key = self._next_key
+        self._next_key += 1
+        cells = self._cells_for(bbox)
+        self._entries[key] = (layer, tuple(bbox), item, cells)
+        for cell in cells:
+            self._cells[cell].add(key)
+        return key
+
+    def insert_point(self, layer, lng, lat, item):
+        return self.insert(layer, (lng, lat, lng, lat), item)
+
+    def insert_feature(self, layer, feature):
+        bbox = geometry_bbox(feature.get("geometry") or {})
+        if bbox is None:
+            return None
+        return self.insert(layer, bbox, feature)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for cell in entry[3]:
+            keys = self._cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def query_bbox(self, bbox, layers=None):
+        """Elementos cuya caja intersecta bbox, en orden de inserción"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        matches = []
+        for key in self._candidates(bbox):
+            layer, (e_min_lng, e_min_lat, e_max_lng, e_max_lat), item, _ = self._entries[key]
+            if layers is not None and layer not in layers:
+                continue
+            if e_min_lng <= max_lng and e_max_lng >= min_lng and e_min_lat <= max_lat and e_max_lat >= min_lat:
+                matches.append((key, item))
+        return [item for _, item in sorted(matches, key=lambda m: m[0])]
+
+    def query_radius(self, lng, lat, radius_km, layers=None):
+        """Elementos cuya caja queda a menos de radius_km de (lng, lat)"""
+        matches = []
+        for key in self._candidates(radius_bbox(lng, lat, radius_km)):
+            layer, (e_min_lng, e_min_lat, e_max_lng, e_max_lat), item, _ = self._entries[key]
+            if layers is not None and layer not in layers:
+                continue
+            # Punto de la caja más cercano al centro de búsqueda
+            near_lng = min(max(lng, e_min_lng), e_max_lng)
+            near_lat = min(max(lat, e_min_lat), e_max_lat)
+            if haversine_km(lng, lat, near_lng, near_lat) <= radius_km:
+                matches.append((key, item))
+        return [item for _, item in sorted(matches, key=lambda m: m[0])]
+
+    def _cell_range(self, bbox):
+        size = self.cell_size
+        return (floor(bbox[0] / size), floor(bbox[1] / size),
+                floor(bbox[2] / size), floor(bbox[3] / size))
+
+    def _cells_for(self, bbox):
+        x0, y0, x1, y1 = self._cell_range(bbox)
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def _candidates(self, bbox):
+        x0, y0, x1, y1 = self._cell_range(bbox)
+        n_cells = (x1 - x0 + 1) * (y1 - y0 + 1)
+        keys = set()
+        if n_cells > len(self._cells):
+            # Consultas muy amplias: recorrer solo las celdas ocupadas
+            for (x, y), cell_keys in self._cells.items():
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    keys.update(cell_keys)
+        else:
+            for cell in self._cells_for(bbox):
+                keys.update(self._cells.get(cell, ()))
+        return keys
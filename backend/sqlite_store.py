@@ -0,0 +1,300 @@
+"""
+Base de datos embebida (sqlite3 de la biblioteca estándar) como alternativa a
+los archivos JSON
+
+Con EARTHBLOOM_STORAGE=sqlite la base combinada, los puntos de usuario y los
+vértices ML viven en un solo archivo SQLite en modo WAL en vez de en tres
+JSON que se reescriben enteros en cada cambio:
+
+- features: un feature por fila (JSON compacto) con su capa ('original' o
+  'ml'), Season y Type normalizados e indexados, más una tabla virtual R-tree
+  con su caja envolvente
+- user_points: un punto por fila; los puntos nuevos se insertan y los que
+  absorbieron reportes duplicados se reescriben en bloque (executemany) en
+  una sola transacción, así que no hace falta log aparte ni compactación
+- ml_vertices: un vértice por fila, indexado por polygon_id
+
+Guardar la base combinada solo toca las filas que cambiaron: el almacén
+recuerda qué objeto feature cargó o escribió en cada fila (los features
+publicados no se modifican en el sitio, ver publish_data), borra las filas
+cuyos features ya no están e inserta los nuevos al final.
+
+Al cargar, el filtro de carga (bbox, Season, Type) se resuelve en SQL sobre
+la capa original (R-tree e índices): solo se decodifican las filas que
+pueden pasar el filtro. La capa ML se carga siempre entera. Las filas que
+el filtro deja fuera no se cargan ni se tocan al guardar.
+
+Si SQLite no trae el módulo rtree, las cajas se filtran sobre columnas
+normales de la tabla features (sin índice espacial, pero igual sin
+decodificar el JSON de las filas descartadas).
+"""
+import heapq
+import sqlite3
+import threading
+
+import serialization
+from spatial_index import geometry_bbox
+
+# Filas por executemany en las importaciones masivas
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS features (
+    id INTEGER PRIMARY KEY,
+    layer TEXT NOT NULL,
+    season TEXT NOT NULL,
+    type TEXT NOT NULL,
+    min_lng REAL, min_lat REAL, max_lng REAL, max_lat REAL,
+    feature BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS features_layer ON features (layer, season, type);
+CREATE TABLE IF NOT EXISTS user_points (
+    seq INTEGER PRIMARY KEY,
+    id TEXT,
+    lng REAL,
+    lat REAL,
+    timestamp TEXT,
+    point BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_points_timestamp ON user_points (timestamp);
+CREATE INDEX IF NOT EXISTS user_points_id ON user_points (id);
+CREATE TABLE IF NOT EXISTS ml_vertices (
+    seq INTEGER PRIMARY KEY,
+    polygon_id TEXT,
+    vertex BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ml_vertices_polygon ON ml_vertices (polygon_id);
+"""
+
+RTREE_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS features_bbox USING rtree (id, min_lng, max_lng, min_lat, max_lat)"
+
+
+def feature_layer(feature):
+    """Capa de un feature: 'ml' para los polígonos generados, 'original' para el resto"""
+    return "ml" if (feature.get("properties") or {}).get("generated_auto", False) else "original"
+
+
+def _key(value):
+    # La misma normalización que FeatureFilter
+    return str(value).casefold()
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            try:
+                self.connection.execute(RTREE_SCHEMA)
+                self.rtree = True
+            except sqlite3.OperationalError:
+                self.rtree = False
+        # id(feature) -> (fila, feature) de los features cargados o escritos
+        self._rows = {}
+
+    def close(self):
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    # --- meta ---
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return serialization.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                (key, serialization.dumps(value)))
+
+    def initialized(self):
+        """True si la base ya recibió sus datos iniciales (ver mark_initialized)"""
+        return bool(self.get_meta("initialized", False))
+
+    # --- features ---
+
+    def _feature_rows(self, rows, features):
+        for row_id, feature in zip(rows, features):
+            properties = feature.get("properties") or {}
+            box = geometry_bbox(feature.get("geometry") or {}) or (None, None, None, None)
+            yield (row_id, feature_layer(feature), _key(properties.get("Season", "")), _key(properties.get("Type", "")),
+                   *box, serialization.dumps(feature))
+
+    def _insert_features(self, features, first_id):
+        rows = list(self._feature_rows(range(first_id, first_id + len(features)), features))
+        self.connection.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        if self.rtree:
+            self.connection.executemany(
+                "INSERT INTO features_bbox VALUES (?, ?, ?, ?, ?)",
+                [(r[0], r[4], r[6], r[5], r[7]) for r in rows if r[4] is not None])
+        return rows
+
+    def _delete_features(self, row_ids):
+        params = [(row_id,) for row_id in row_ids]
+        self.connection.executemany("DELETE FROM features WHERE id = ?", params)
+        if self.rtree:
+            self.connection.executemany("DELETE FROM features_bbox WHERE id = ?", params)
+
+    def _next_id(self):
+        return (self.connection.execute("SELECT max(id) FROM features").fetchone()[0] or 0) + 1
+
+    def _select(self, feature_filter):
+        """(fila, JSON) de la capa original que puede pasar feature_filter, por fila"""
+        sql = "SELECT f.id, f.feature FROM features f"
+        where, params = ["f.layer = 'original'"], []
+        if feature_filter and feature_filter.bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = feature_filter.bbox
+            if self.rtree:
+                sql += " JOIN features_bbox b ON b.id = f.id"
+                where.append("b.max_lng >= ? AND b.min_lng <= ? AND b.max_lat >= ? AND b.min_lat <= ?")
+            else:
+                where.append("f.max_lng >= ? AND f.min_lng <= ? AND f.max_lat >= ? AND f.min_lat <= ?")
+            params += [min_lng, max_lng, min_lat, max_lat]
+        if feature_filter and feature_filter.seasons is not None:
+            where.append(f"f.season IN ({', '.join('?' * len(feature_filter.seasons))})")
+            params += sorted(feature_filter.seasons)
+        if feature_filter and feature_filter.types is not None:
+            where.append(f"f.type IN ({', '.join('?' * len(feature_filter.types))})")
+            params += sorted(feature_filter.types)
+        return self.connection.execute(f"{sql} WHERE {' AND '.join(where)} ORDER BY f.id", params)
+
+    def load_features(self, feature_filter=None, on_feature=None):
+        """
+        FeatureCollection guardado: la capa original filtrada con
+        feature_filter y la capa ML completa, en el orden de las filas
+
+        on_feature(feature) se llama con cada feature aceptado. Los features
+        devueltos quedan asociados a su fila para save_features
+        """
+        with self._lock:
+            ml = self.connection.execute("SELECT id, feature FROM features WHERE layer = 'ml' ORDER BY id")
+            self._rows = {}
+            features = []
+            for row_id, blob in heapq.merge(self._select(feature_filter), ml):
+                feature = serialization.loads(blob)
+                # El SQL solo preselecciona (cajas del R-tree en float32): el filtro decide
+                if feature_filter and feature_layer(feature) == "original" and not feature_filter(feature):
+                    continue
+                if on_feature is not None:
+                    on_feature(feature)
+                features.append(feature)
+                self._rows[id(feature)] = (row_id, feature)
+            collection = {"type": "FeatureCollection"}
+            collection.update(self.get_meta("collection", {}))
+            collection["features"] = features
+            return collection
+
+    def save_features(self, collection):
+        """
+        Sincroniza las filas con collection: borra las filas de los features
+        que ya no están e inserta los nuevos. Devuelve (insertados, borrados)
+
+        Solo se consideran las filas cargadas o escritas por este almacén. Las
+        filas nuevas van al final, así que a partir del primer feature nuevo
+        de la colección se reescriben también los que le siguen (el orden de
+        las filas es siempre el de la colección)
+        """
+        features = collection.get("features", [])
+        with self._lock, self.connection:
+            kept = []
+            for feature in features:
+                entry = self._rows.get(id(feature))
+                if entry is None or entry[1] is not feature or (kept and entry[0] <= kept[-1]):
+                    break
+                kept.append(entry[0])
+            new = features[len(kept):]
+
+            kept_ids = set(kept)
+            removed = [row_id for row_id, _ in self._rows.values() if row_id not in kept_ids]
+            self._delete_features(removed)
+            first_id = self._next_id()
+            self._insert_features(new, first_id)
+            self._set_meta("collection", {k: v for k, v in collection.items() if k not in ("type", "features")})
+
+            rows = {id(f): self._rows[id(f)] for f in features[:len(kept)]}
+            rows.update((id(f), (first_id + i, f)) for i, f in enumerate(new))
+            self._rows = rows
+            return len(new), len(removed)
+
+    def import_features(self, features, head=None):
+        """
+        Sustituye todas las filas de features por las de un iterable (p. ej.
+        el generador de geojson_stream), en bloques de BATCH_SIZE
+        """
+        count = 0
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM features")
+            if self.rtree:
+                self.connection.execute("DELETE FROM features_bbox")
+            self._rows = {}
+            batch = []
+            for feature in features:
+                batch.append(feature)
+                if len(batch) >= BATCH_SIZE:
+                    self._insert_features(batch, count + 1)
+                    count += len(batch)
+                    batch = []
+            self._insert_features(batch, count + 1)
+            count += len(batch)
+            self._set_meta("collection", {k: v for k, v in (head or {}).items() if k not in ("type", "features")})
+        return count
+
+    # --- puntos de usuario ---
+
+    def _point_rows(self, points):
+        return [(p.get("id"), p.get("lng"), p.get("lat"), p.get("timestamp"), serialization.dumps(p))
+                for p in points]
+
+    def load_user_points(self):
+        with self._lock:
+            return [serialization.loads(blob) for blob, in
+                    self.connection.execute("SELECT point FROM user_points ORDER BY seq")]
+
+    def append_user_points(self, points, replaced=()):
+        """
+        Inserta los puntos nuevos y reescribe los replaced (mismo id y
+        timestamp, p. ej. con más peso) en una sola transacción
+        """
+        if not points and not replaced:
+            return
+        with self._lock, self.connection:
+            self.connection.executemany("INSERT INTO user_points (id, lng, lat, timestamp, point) VALUES (?, ?, ?, ?, ?)",
+                                        self._point_rows(points))
+            self.connection.executemany("UPDATE user_points SET point = ? WHERE id = ? AND timestamp = ?",
+                                        [(serialization.dumps(p), p.get("id"), p.get("timestamp")) for p in replaced])
+
+    def save_user_points(self, points):
+        """Sustituye todos los puntos de usuario"""
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM user_points")
+            self.connection.executemany("INSERT INTO user_points (id, lng, lat, timestamp, point) VALUES (?, ?, ?, ?, ?)",
+                                        self._point_rows(points))
+
+    # --- vértices ML ---
+
+    def load_ml_vertices(self):
+        with self._lock:
+            return [serialization.loads(blob) for blob, in
+                    self.connection.execute("SELECT vertex FROM ml_vertices ORDER BY seq")]
+
+    def save_ml_vertices(self, vertices):
+        """Sustituye todos los vértices ML"""
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM ml_vertices")
+            self.connection.executemany("INSERT INTO ml_vertices (polygon_id, vertex) VALUES (?, ?)",
+                                        [(v.get("polygon_id"), serialization.dumps(v)) for v in vertices])
+
+    # --- carga inicial ---
+
+    def mark_initialized(self):
+        with self._lock, self.connection:
+            self._set_meta("initialized", True)
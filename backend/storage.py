@@ -0,0 +1,188 @@
+"""
+Persistencia en disco: escrituras atómicas y log de escritura anticipada (WAL)
+
+- atomic_write_json: escribe en un archivo temporal del mismo directorio,
+  hace fsync y lo renombra sobre el destino; un lector (o un corte de luz)
+  nunca ve un archivo a medio escribir
+- PointLog: log JSONL de solo-anexado. Cada punto nuevo es una línea, así que
+  el costo de una inserción no depende del tamaño de la base de datos. Los
+  fsync se agrupan (cada `fsync_every` registros o `fsync_interval` segundos)
+  y el log se compacta periódicamente en el snapshot completo
+- ClusterSnapshot: estado del clustering (.npz) etiquetado con el hash de sus
+  entradas; al arrancar se restaura en vez de volver a ejecutar DBSCAN si las
+  entradas no cambiaron
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import serialization
+
+logger = logging.getLogger('earthbloom.storage')
+
+
+def atomic_write_json(path, data, pretty=False):
+    """
+    Escribe data como JSON en path de forma atómica (temporal + rename)
+
+    La salida es compacta salvo pretty=True y usa el codificador rápido de
+    serialization cuando está disponible
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(serialization.dumps(data, pretty=pretty))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def content_digest(*parts):
+    """Hash hexadecimal de una secuencia de arrays NumPy, bytes o valores JSON"""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            data = np.ascontiguousarray(part)
+            digest.update(f"{data.dtype.str}{data.shape}".encode())
+            digest.update(data.tobytes())
+        elif isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(json.dumps(part, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class ClusterSnapshot:
+    # Cambiar al modificar el contenido del snapshot invalida los anteriores
+    FORMAT = 1
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, digest):
+        """
+        Devuelve (arrays, meta) si el snapshot existe y corresponde a digest;
+        None si no existe, es de otras entradas o está dañado
+        """
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = serialization.loads(data["_meta"].tobytes())
+                if meta.get("format") != self.FORMAT or meta.get("digest") != digest:
+                    return None
+                arrays = {name: data[name] for name in data.files if name != "_meta"}
+        except (OSError, ValueError, KeyError):
+            return None
+        return arrays, meta
+
+    def save(self, digest, arrays, meta=None):
+        """Escribe el snapshot de forma atómica (temporal + rename)"""
+        meta = dict(meta or {}, format=self.FORMAT, digest=digest)
+        encoded = np.frombuffer(serialization.dumps(meta), dtype=np.uint8)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, _meta=encoded, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+class PointLog:
+    def __init__(self, path, fsync_every=32, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.count = 0
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def replay(self):
+        """
+        Lee los registros del log. Una última línea truncada (escritura
+        interrumpida) se descarta y se recorta del archivo: si no, el próximo
+        append quedaría pegado a ella y se perdería en cada reproducción
+        """
+        records = []
+        if not os.path.exists(self.path):
+            self.count = 0
+            return records
+
+        good_offset = 0     # fin de la última línea válida
+        terminated = True   # si esa línea acaba en salto de línea
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        break
+                good_offset += len(line)
+                terminated = line.endswith(b'\n')
+            size = f.seek(0, os.SEEK_END)
+
+        if good_offset < size:
+            logger.warning("⚠️ Log de puntos con una línea truncada: se recorta a %s bytes", good_offset)
+            os.truncate(self.path, good_offset)
+        if not terminated:
+            with open(self.path, 'ab') as f:
+                f.write(b'\n')
+        self.count = len(records)
+        return records
+
+    def append(self, record):
+        """Añade un registro al final del log"""
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        self._file.write(serialization.dumps(record) + b'\n')
+        self._file.flush()
+        self.count += 1
+        self._unsynced += 1
+
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def sync(self):
+        """Fuerza a disco los registros pendientes"""
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def truncate(self):
+        """Vacía el log (tras volcar su contenido a un snapshot)"""
+        self.close()
+        if not self.count and not os.path.exists(self.path):
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.count = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None